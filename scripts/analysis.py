@@ -2,69 +2,243 @@
 # Mô-đun phân tích dữ liệu từ GitHub Trending
 # Thực hiện các phân tích về ngôn ngữ lập trình, thay đổi số sao và số lượng người đóng góp
 
+# pandas, matplotlib/seaborn và pyarrow chỉ được nạp khi thực sự có dữ liệu cần
+# phân tích; khi dữ liệu không đổi lệnh kết thúc sau một truy vấn SQLite nhỏ
+
+import hashlib
+import json
+import os
 import sqlite3
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from db_utils import get_data_from_db
+from db_utils import get_connection, get_data_from_db, init_db
+import metrics_utils
 
-def analyze_by_date():
-    # Hàm phân tích dữ liệu theo ngày
-    # Thực hiện các phân tích:
-    # 1. Phân bố ngôn ngữ lập trình
-    # 2. Thay đổi số sao của repository
-    # 3. Phân tích số lượng người đóng góp
-    # Get data from database
-    df = get_data_from_db()
-    if df.empty:
-        print("No data found in the database. Please run the scraper first.")
-        return
-    # Convert scrape_date to datetime
-    df["scrape_date"] = pd.to_datetime(df["scrape_date"])
-    
-    # 1. Language Distribution Analysis
+# Các cột cần cho phân tích, chỉ các cột này được đọc từ dữ liệu dạng cột
+ANALYSIS_COLUMNS = ['full_name', 'language', 'star_change', 'contributor_count', 'scrape_date']
+
+def load_analysis_data(days=7):
+    """
+    Lấy dữ liệu của days ngày gần nhất cho phân tích
+
+    Nếu đã cài pyarrow, dữ liệu mới được xuất thêm ra file Arrow (chỉ các lần
+    chạy chưa xuất) rồi đọc lại qua memory-map, chỉ các cột và ngày cần thiết;
+    ngược lại đọc trực tiếp từ SQLite.
+    """
+    import columnar_utils
+
+    if columnar_utils.available():
+        columnar_utils.export_snapshots()
+        cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+        df = columnar_utils.read_snapshots(ANALYSIS_COLUMNS, start_date=cutoff_date)
+        if df is not None:
+            return df
+    return get_data_from_db(days)
+
+# Thư mục chứa biểu đồ, báo cáo và file ghi nhận mã băm của lần vẽ trước
+OUTPUT_DIR = 'data'
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, '.analysis_manifest.json')
+
+# Tăng khi đổi cách vẽ để buộc vẽ lại mọi biểu đồ dù dữ liệu không đổi
+RENDER_VERSION = 1
+
+def _plotting():
+    # Nạp matplotlib/seaborn khi cần vẽ
+    import matplotlib
+    matplotlib.use('Agg')  # vẽ không cần giao diện, an toàn trong tiến trình con
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    return plt, sns
+
+def _render_language_distribution(lang_counts, path):
+    plt, sns = _plotting()
     plt.figure(figsize=(12, 6))
-    lang_counts = df['language'].value_counts().head(15)
-    if not lang_counts.empty:
-        sns.barplot(x=lang_counts.values, y=lang_counts.index)
-        plt.title('Most Used Programming Languages')
-        plt.xlabel('Number of Repositories')
-        plt.tight_layout()
-        plt.savefig('data/language_distribution.png')
+    sns.barplot(x=lang_counts['count'].values, y=lang_counts['language'].values)
+    plt.title('Most Used Programming Languages')
+    plt.xlabel('Number of Repositories')
+    plt.tight_layout()
+    plt.savefig(path)
     plt.close()
-    # 2. Star Changes Analysis
+
+def _render_star_changes(top_star, path):
+    plt, sns = _plotting()
     plt.figure(figsize=(12, 6))
-    df_sorted = df.sort_values('star_change', ascending=False).head(15)
-    sns.barplot(x='star_change', y='full_name', data=df_sorted)
+    sns.barplot(x='star_change', y='full_name', data=top_star)
     plt.title('Repositories with Most Star Changes')
     plt.xlabel('Star Change')
     plt.tight_layout()
-    plt.savefig('data/star_changes.png')
+    plt.savefig(path)
     plt.close()
-    # 3. Contributor Analysis
+
+def _render_contributors(top_contributors, path):
+    plt, sns = _plotting()
     plt.figure(figsize=(12, 6))
-    df_sorted = df.sort_values('contributor_count', ascending=False).head(15)
-    sns.barplot(x='contributor_count', y='full_name', data=df_sorted)
+    sns.barplot(x='contributor_count', y='full_name', data=top_contributors)
     plt.title('Repositories with Most Contributors')
     plt.xlabel('Number of Contributors')
     plt.tight_layout()
-    plt.savefig('data/contributor_analysis.png')
+    plt.savefig(path)
     plt.close()
-    # Generate summary report
-    with open('data/analysis_report.md', 'w', encoding='utf-8') as f:
+
+def _render(job):
+    # Chạy trong tiến trình con: job = (hàm vẽ, dữ liệu đầu vào, đường dẫn file)
+    render, data, path = job
+    render(data, path)
+    return path
+
+def _content_hash(*parts):
+    # Mã băm nội dung của dữ liệu đầu vào một sản phẩm (DataFrame hoặc chuỗi)
+    import pandas as pd
+
+    digest = hashlib.sha256(str(RENDER_VERSION).encode())
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            digest.update(','.join(map(str, part.columns)).encode())
+            digest.update(pd.util.hash_pandas_object(part, index=False).values.tobytes())
+        else:
+            digest.update(str(part).encode())
+    return digest.hexdigest()
+
+def _load_manifest():
+    try:
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_manifest(manifest):
+    tmp = f'{MANIFEST_PATH}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, MANIFEST_PATH)
+
+def _data_version(days):
+    # Dấu hiệu của dữ liệu đầu vào, đọc từ runs và bảng tổng hợp run_stats (được
+    # cập nhật cả khi ghi đè dòng cũ) mà không cần đọc snapshots; None nếu chưa có dữ liệu
+    cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+    conn = get_connection()
+    try:
+        row = conn.execute('''
+            SELECT MAX(ru.id), MAX(ru.completed_at), COUNT(*), SUM(st.repo_count),
+                   SUM(st.star_change_sum), SUM(st.contributor_sum)
+            FROM runs ru CROSS JOIN run_stats st ON st.run_id = ru.id
+            WHERE ru.scrape_date >= ?
+        ''', (cutoff_date,)).fetchone()
+    finally:
+        conn.close()
+    if row[0] is None:
+        return None
+    return ':'.join(map(str, (RENDER_VERSION, cutoff_date, *row)))
+
+def summarize(df, top_n=15):
+    """
+    Tính tất cả các phần dữ liệu cần cho biểu đồ và báo cáo trong một lượt
+
+    Trả về:
+        dict gồm lang_counts (language, count), top_star (full_name, star_change),
+        top_contributors (full_name, contributor_count); các dòng không lấy được
+        số người đóng góp (NaN) không được xếp hạng
+    """
+    import pandas as pd
+
+    lang_counts = df['language'].value_counts().head(top_n)
+    return {
+        'lang_counts': pd.DataFrame({'language': lang_counts.index.astype(str), 'count': lang_counts.values}),
+        'top_star': df.nlargest(top_n, 'star_change')[['full_name', 'star_change']].reset_index(drop=True),
+        'top_contributors': df.nlargest(top_n, 'contributor_count')[['full_name', 'contributor_count']]
+                              .astype({'contributor_count': 'int64'}).reset_index(drop=True),
+    }
+
+def write_report(summary, path):
+    """
+    Ghi báo cáo tóm tắt từ kết quả của summarize
+    """
+    lang_counts = summary['lang_counts']
+    with open(path, 'w', encoding='utf-8') as f:
         f.write('# GitHub Trending Analysis Report\n\n')
         f.write(f'Report generated on: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}\n\n')
         
         f.write('## Key Findings\n\n')
         if not lang_counts.empty:
-            f.write(f'1. Most Popular Language: {lang_counts.index[0]} with {lang_counts.values[0]} repositories\n')
+            f.write(f'1. Most Popular Language: {lang_counts["language"].iloc[0]} with {lang_counts["count"].iloc[0]} repositories\n')
         
-        top_star_change = df_sorted.iloc[0]
+        top_star_change = summary['top_star'].iloc[0]
         f.write(f'2. Repository with Most Star Changes: {top_star_change["full_name"]} with {top_star_change["star_change"]} stars\n')
         
-        top_contributors = df.nlargest(1, 'contributor_count').iloc[0]
-        f.write(f'3. Repository with Most Contributors: {top_contributors["full_name"]} with {top_contributors["contributor_count"]} contributors\n')
+        if not summary['top_contributors'].empty:
+            top_contributors = summary['top_contributors'].iloc[0]
+            f.write(f'3. Repository with Most Contributors: {top_contributors["full_name"]} with {top_contributors["contributor_count"]} contributors\n')
+
+@metrics_utils.timed('analyze')
+def analyze_by_date(max_workers=None, days=7):
+    # Hàm phân tích dữ liệu theo ngày
+    # Thực hiện các phân tích:
+    # 1. Phân bố ngôn ngữ lập trình
+    # 2. Thay đổi số sao của repository
+    # 3. Phân tích số lượng người đóng góp
+    # Mỗi biểu đồ và báo cáo chỉ được tạo lại khi mã băm dữ liệu đầu vào của nó
+    # khác lần trước; các biểu đồ cần vẽ lại được vẽ song song trong process pool.
+    # Nếu dữ liệu không đổi kể từ lần trước thì dừng ngay, không nạp pandas/matplotlib.
+    init_db()
+    version = _data_version(days)
+    manifest = _load_manifest()
+    outputs = [name for name in manifest if name != 'data_version']
+    if version is None:
+        print("No data found in the database. Please run the scraper first.")
+        return
+    if manifest.get('data_version') == version and outputs and all(
+            os.path.exists(os.path.join(OUTPUT_DIR, name)) for name in outputs):
+        print("[INFO] Dữ liệu không đổi kể từ lần phân tích trước, bỏ qua")
+        return
+
+    # Get data from database
+    with metrics_utils.span('analysis_load') as span:
+        df = load_analysis_data(days)
+        span.rows = len(df)
+    if df.empty:
+        print("No data found in the database. Please run the scraper first.")
+        return
+    summary = summarize(df)
+
+    artifacts = [
+        ('language_distribution.png', _render_language_distribution, summary['lang_counts']),
+        ('star_changes.png', _render_star_changes, summary['top_star']),
+        ('contributor_analysis.png', _render_contributors, summary['top_contributors']),
+    ]
+    if summary['lang_counts'].empty:
+        artifacts.pop(0)
+
+    hashes = {'data_version': version}
+    jobs = []
+    for file_name, render, data in artifacts:
+        path = os.path.join(OUTPUT_DIR, file_name)
+        hashes[file_name] = _content_hash(data)
+        if manifest.get(file_name) != hashes[file_name] or not os.path.exists(path):
+            jobs.append((render, data, path))
+
+    # Một tiến trình thì vẽ ngay tại chỗ, tránh chi phí khởi tạo pool
+    workers = min(len(jobs), max_workers or os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_render, jobs))
+    else:
+        for job in jobs:
+            _render(job)
+
+    # Generate summary report
+    report_path = os.path.join(OUTPUT_DIR, 'analysis_report.md')
+    hashes['analysis_report.md'] = _content_hash(summary['lang_counts'], summary['top_star'].head(1),
+                                                 summary['top_contributors'].head(1))
+    report_changed = manifest.get('analysis_report.md') != hashes['analysis_report.md'] or not os.path.exists(report_path)
+    if report_changed:
+        write_report(summary, report_path)
+
+    manifest.update(hashes)
+    _save_manifest(manifest)
+    skipped = len(artifacts) - len(jobs) + (0 if report_changed else 1)
+    print(f"[INFO] Đã tạo {len(jobs)} biểu đồ{' và báo cáo' if report_changed else ''}, "
+          f"bỏ qua {skipped} mục không thay đổi")
+
 def main():
     # Hàm chính để thực thi quá trình phân tích dữ liệu
     # Tạo các biểu đồ và báo cáo phân tích
@@ -0,0 +1,591 @@
+# scripts/bench.py
+# Bộ đo hiệu năng offline cho scraper, cơ sở dữ liệu và dashboard
+# Phục vụ các trang HTML mẫu từ một máy chủ HTTP cục bộ thay cho github.com
+# và xuất kết quả dưới dạng JSON để so sánh giữa các phiên bản
+
+import argparse
+import collections
+import json
+import math
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'fixtures')
+
+# Các trường hợp đo mặc định, dạng "tên:quy mô"
+DEFAULT_CASES = [
+    'scrape:25',
+    'scrape:1000',
+    'convert_star:1000000',
+    'append:25',
+    'append:1000',
+    'history:1000000',
+    'load_data:1000000',
+    'charts:1000000',
+    'scatter:1000000',
+    'star_metrics:1000000',
+    'startup:1000',
+]
+
+# Số dòng của mỗi lần chạy scraper trong lịch sử giả lập
+HISTORY_ROWS_PER_RUN = 100
+
+# Ngân sách thời gian nạp mô-đun (ms, cumulative theo python -X importtime) của
+# các lệnh thường chạy bằng cron; vượt ngân sách thường là do một thư viện nặng
+# (pandas, matplotlib, pyarrow...) bị nạp ở đầu mô-đun
+IMPORT_BUDGETS_MS = {
+    'cli': 25,
+    'db_utils': 60,
+    'mail_utils': 150,
+    'notifier': 200,
+    'analysis': 200,
+    'scraper': 600,
+}
+
+# Các lệnh cli.py thường không có việc gì khi chạy lại bằng cron
+IDLE_COMMANDS = ['notify', 'analyze', 'deliver']
+
+_ARTICLE_RE = re.compile(r'<article class="Box-row">.*?</article>', re.DOTALL)
+_REPO_HREF_RE = re.compile(r'href="/([^/"]+)/([^/"]+)/stargazers"')
+
+def build_trending_page(n_repos, fixtures_dir=FIXTURES_DIR):
+    """
+    Tạo trang trending có n_repos repository bằng cách nhân bản các repository
+    trong trang mẫu, mỗi bản sao được đổi tên chủ sở hữu để không bị trùng
+
+    Trả về:
+        Nội dung HTML dạng bytes
+    """
+    with open(os.path.join(fixtures_dir, 'trending.html'), encoding='utf-8') as f:
+        html = f.read()
+    articles = _ARTICLE_RE.findall(html)
+    head = html[:html.index(articles[0])]
+    tail = html[html.index(articles[-1]) + len(articles[-1]):]
+
+    generated = []
+    for i in range(n_repos):
+        article = articles[i % len(articles)]
+        copy = i // len(articles)
+        if copy:
+            owner = _REPO_HREF_RE.search(article).group(1)
+            article = article.replace(f'/{owner}/', f'/{owner}-{copy}/').replace(f'{owner} /', f'{owner}-{copy} /')
+        generated.append(article)
+    return (head + '\n'.join(generated) + tail).encode('utf-8')
+
+class GitHubStandIn:
+    """
+    Máy chủ HTTP cục bộ thay thế github.com cho các phép đo
+
+    Phục vụ /trending... và /<owner>/<repo>/contributors từ các trang mẫu, có
+    thể thêm độ trễ (latency_ms ± jitter_ms), trả lỗi ngẫu nhiên theo error_rate
+    và giới hạn tốc độ như GitHub: quá rate_limit request trong một giây thì trả
+    429 kèm Retry-After (0 là không giới hạn).
+    """
+
+    def __init__(self, n_repos=25, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, error_status=500,
+                 rate_limit=0, fixtures_dir=FIXTURES_DIR, seed=0):
+        self.trending = build_trending_page(n_repos, fixtures_dir)
+        with open(os.path.join(fixtures_dir, 'contributors.html'), 'rb') as f:
+            self.contributors = f.read()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rate_limit = rate_limit
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self._window = collections.deque()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def _handler_class(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                delay, fail, throttled = stand_in._next_request()
+                if delay:
+                    time.sleep(delay)
+                path = self.path.split('?', 1)[0]
+                if throttled:
+                    body, status = b'rate limit exceeded', 429
+                elif fail:
+                    body, status = b'error', stand_in.error_status
+                elif path.startswith('/trending'):
+                    body, status = stand_in.trending, 200
+                elif path.endswith('/contributors'):
+                    body, status = stand_in.contributors, 200
+                else:
+                    body, status = b'not found', 404
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                if status == 429:
+                    self.send_header('Retry-After', '1')
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def _next_request(self):
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            throttled = False
+            if self.rate_limit:
+                # Cửa sổ trượt một giây; request bị từ chối không được tính vào hạn mức
+                now = time.monotonic()
+                while self._window and now - self._window[0] >= 1.0:
+                    self._window.popleft()
+                throttled = len(self._window) >= self.rate_limit
+                if throttled:
+                    self.throttled += 1
+                else:
+                    self._window.append(now)
+        return delay, fail, throttled
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+def synthetic_history(n_rows, rows_per_run=HISTORY_ROWS_PER_RUN, n_repos=20000, seed=0, start=None):
+    """
+    Tạo lịch sử dữ liệu giả lập gồm n_rows dòng, mỗi lần chạy cách nhau một giờ
+    (bắt đầu từ start, mặc định 2024-01-01) và không có repository nào lặp lại
+    trong cùng một lần chạy
+
+    Trả về:
+        Generator các danh sách bản ghi (dict), mỗi danh sách là một lần chạy
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    languages = np.array(['Python', 'JavaScript', 'TypeScript', 'Go', 'Rust', 'C++', 'Java', 'C', 'Shell', ''])
+    start = start or datetime(2024, 1, 1)
+    n_runs = math.ceil(n_rows / rows_per_run)
+    for run in range(n_runs):
+        size = min(rows_per_run, n_rows - run * rows_per_run)
+        ids = rng.choice(n_repos, size, replace=False).tolist()
+        stars = rng.integers(10, 200000, size).tolist()
+        star_changes = rng.integers(0, 3000, size).tolist()
+        contributors = rng.integers(0, 500, size).tolist()
+        scrape_date = (start + timedelta(hours=run)).strftime('%Y-%m-%d %H:%M:%S')
+        yield [
+            {
+                'full_name': f'owner{i % 500}/repo{i}',
+                'description': f'Synthetic repository {i}',
+                'language': str(languages[i % len(languages)]),
+                'stars': stars[k],
+                'star_change': star_changes[k],
+                'contributor_count': contributors[k],
+                'link': f'https://github.com/owner{i % 500}/repo{i}',
+                'scrape_date': scrape_date,
+            }
+            for k, i in enumerate(ids)
+        ]
+
+def _percentile(values, p):
+    # Phân vị theo phương pháp nearest-rank
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))]
+
+def _summary(name, scale, items, latencies, unit='ms', total=None, **extra):
+    # Gom kết quả của một trường hợp đo thành dict
+    total = sum(latencies) if total is None else total
+    factor = 1000 if unit == 'ms' else 1e6
+    result = {
+        'case': name,
+        'scale': scale,
+        'items': items,
+        'iterations': len(latencies),
+        'total_s': round(total, 6),
+        'throughput_per_s': round(items / total, 2) if total else None,
+        f'latency_{unit}': {
+            'p50': round(_percentile(latencies, 50) * factor, 4),
+            'p99': round(_percentile(latencies, 99) * factor, 4),
+            'mean': round(sum(latencies) / len(latencies) * factor, 4),
+        },
+    }
+    result.update(extra)
+    return result
+
+def bench_scrape(scale, args):
+    import metrics_utils
+    import scraper
+    from http_utils import RateLimiter, create_session
+
+    with GitHubStandIn(n_repos=scale, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                       error_rate=args.error_rate, error_status=args.error_status,
+                       rate_limit=args.server_rate) as server:
+        latencies = []
+        rows = 0
+        missing = 0
+        for _ in range(args.iterations):
+            limiter = RateLimiter(rate=args.rate, max_concurrency=args.workers)
+            session = create_session(pool_size=args.workers, limiter=limiter)
+            started = time.perf_counter()
+            data = scraper.scrape_github_trending(f'{server.base_url}/trending', session=session,
+                                                  max_workers=args.workers)
+            latencies.append(time.perf_counter() - started)
+            rows += len(data)
+            missing += sum(1 for item in data if item['contributor_count'] is None)
+            session.close()
+        return _summary('scrape', scale, rows, latencies, http_requests=server.requests,
+                        http_errors=server.errors, http_throttled=server.throttled,
+                        missing_contributors=missing, limiter=limiter.snapshot(), workers=args.workers,
+                        metrics=metrics_utils.snapshot())
+
+def bench_convert_star(scale, args):
+    from scraper import convert_star_str_to_int
+
+    rng = random.Random(0)
+    samples = [rng.choice(['{:,}'.format(rng.randint(0, 999999)), f'{rng.randint(1, 999)}.{rng.randint(0, 9)}k',
+                           str(rng.randint(0, 999))]) for _ in range(10000)]
+    latencies = []
+    total = 0.0
+    done = 0
+    while done < scale:
+        size = min(len(samples), scale - done)
+        started = time.perf_counter()
+        for value in samples[:size]:
+            convert_star_str_to_int(value)
+        elapsed = time.perf_counter() - started
+        latencies.append(elapsed / size)
+        total += elapsed
+        done += size
+    return _summary('convert_star', scale, scale, latencies, unit='us', total=total,
+                    note='latency is per call, averaged over batches of 10000')
+
+def bench_append(scale, args):
+    import pandas as pd
+    import db_utils
+
+    db_utils.init_db()
+    frames = [pd.DataFrame(records) for records in synthetic_history(scale * args.iterations, rows_per_run=scale, seed=1)]
+    latencies = []
+    for df in frames:
+        started = time.perf_counter()
+        db_utils.append_data_to_db(df)
+        latencies.append(time.perf_counter() - started)
+    return _summary('append', scale, scale * len(frames), latencies)
+
+def bench_history(scale, args):
+    import db_utils
+
+    db_utils.init_db()
+    latencies = []
+    with db_utils.SnapshotWriter() as writer:
+        for records in synthetic_history(scale, rows_per_run=args.history_batch):
+            started = time.perf_counter()
+            writer.write(records)
+            latencies.append(time.perf_counter() - started)
+    return _summary('history', scale, scale, latencies, batch_rows=args.history_batch)
+
+def bench_load_data(scale, args):
+    import db_utils
+
+    db_utils.init_db()
+    history = list(synthetic_history(scale + args.history_batch, rows_per_run=args.history_batch))
+    with db_utils.SnapshotWriter() as writer:
+        for records in history[:-1]:
+            writer.write(records)
+
+    import dashboard
+
+    # Lần đầu đọc toàn bộ lịch sử, các lần sau không có dữ liệu mới
+    started = time.perf_counter()
+    df = dashboard.load_data()
+    cold = time.perf_counter() - started
+    cold_rows = len(df)
+
+    # Lần đầu đọc từ dữ liệu đã xuất ra file Arrow (nếu có pyarrow)
+    extra = {}
+    import columnar_utils
+    if columnar_utils.pa is not None:
+        started = time.perf_counter()
+        columnar_utils.export_snapshots()
+        extra['export_ms'] = round((time.perf_counter() - started) * 1000, 4)
+        dashboard._cache.update(df=None, last_id=0, revisions={}, data_version=None)
+        started = time.perf_counter()
+        df = dashboard.load_data()
+        extra['cold_arrow_ms'] = round((time.perf_counter() - started) * 1000, 4)
+
+    # Các lần gọi khi không có dữ liệu mới chỉ trả về cache: chỉ đo độ trễ,
+    # throughput được tính từ lần đọc đầu và lần đọc phần tăng thêm
+    latencies = []
+    for _ in range(args.iterations):
+        started = time.perf_counter()
+        dashboard.load_data()
+        latencies.append(time.perf_counter() - started)
+
+    # Ghi thêm một lần chạy rồi đo thời gian đọc phần tăng thêm
+    with db_utils.SnapshotWriter() as writer:
+        writer.write(history[-1])
+    started = time.perf_counter()
+    df = dashboard.load_data()
+    delta = time.perf_counter() - started
+
+    return _summary('load_data', scale, cold_rows, latencies, total=cold,
+                    cold_ms=round(cold * 1000, 4), delta_ms=round(delta * 1000, 4),
+                    delta_rows=len(history[-1]), delta_rows_per_s=round(len(history[-1]) / delta, 2),
+                    total_rows=len(df), **extra)
+
+def bench_charts(scale, args):
+    import db_utils
+
+    db_utils.init_db()
+    with db_utils.SnapshotWriter() as writer:
+        for records in synthetic_history(scale, rows_per_run=args.history_batch):
+            writer.write(records)
+
+    import dashboard
+
+    # Biểu đồ ngôn ngữ và thẻ thống kê đọc từ bảng tổng hợp thay vì toàn bộ lịch sử
+    latencies = []
+    for _ in range(args.iterations):
+        started = time.perf_counter()
+        lang_trend, star_df, summary = dashboard.load_rollups()
+        dashboard.create_language_trend_chart(lang_trend)
+        dashboard.create_star_changes_chart(star_df)
+        latencies.append(time.perf_counter() - started)
+    return _summary('charts', scale, args.iterations, latencies, rollup_rows=len(lang_trend))
+
+def bench_scatter(scale, args):
+    import db_utils
+
+    db_utils.init_db()
+    with db_utils.SnapshotWriter() as writer:
+        for records in synthetic_history(scale, rows_per_run=args.history_batch, n_repos=max(20000, scale // 10)):
+            writer.write(records)
+
+    import dashboard
+
+    df = dashboard.load_data()
+    latencies = []
+    for _ in range(args.iterations):
+        started = time.perf_counter()
+        fig = dashboard.create_stars_contributors_chart(df)
+        latencies.append(time.perf_counter() - started)
+    return _summary('scatter', scale, args.iterations, latencies,
+                    points=sum(len(trace.x) for trace in fig.data),
+                    payload_kb=round(len(fig.to_json()) / 1024, 1))
+
+def bench_star_metrics(scale, args):
+    import db_utils
+    import star_metrics
+
+    db_utils.init_db()
+    with db_utils.SnapshotWriter() as writer:
+        for records in synthetic_history(scale, rows_per_run=args.history_batch):
+            writer.write(records)
+
+    conn = db_utils.get_connection()
+    started = time.perf_counter()
+    history = db_utils.get_star_history_arrays(conn)
+    load = time.perf_counter() - started
+
+    # Tính chỉ số và xếp hạng toàn bộ repository (không tính thời gian đọc SQLite)
+    latencies = []
+    for _ in range(args.iterations):
+        started = time.perf_counter()
+        metrics = star_metrics.compute_star_metrics(history)
+        star_metrics.rank_repos(metrics, by='acceleration', top_n=20)
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+    return _summary('star_metrics', scale, len(history['stars']) * len(latencies), latencies,
+                    repos=len(history['repo_ids']), load_ms=round(load * 1000, 4))
+
+def _import_ms(module):
+    # Thời gian nạp module (ms, cumulative) trong một tiến trình Python mới
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                               capture_output=True, text=True, check=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    for line in completed.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"Không tìm thấy {module} trong kết quả -X importtime")
+
+def bench_startup(scale, args):
+    import db_utils
+
+    # Hai lần chạy đã hoàn tất trong vài giờ gần nhất, mỗi lần scale dòng
+    db_utils.init_db()
+    start = datetime.now().replace(microsecond=0) - timedelta(hours=2)
+    with db_utils.SnapshotWriter() as writer:
+        for records in synthetic_history(2 * scale, rows_per_run=scale, start=start):
+            writer.write(records, complete=True)
+    # Lần chạy mới nhất coi như đã được thông báo (không cần cấu hình email)
+    conn = db_utils.get_connection()
+    db_utils.mark_run_notified(conn, db_utils.get_latest_complete_runs(conn, 1)[0])
+    conn.close()
+
+    # Thời gian nạp tốt nhất qua các lần lặp, so với ngân sách
+    imports_ms = {module: round(min(_import_ms(module) for _ in range(args.iterations)), 1)
+                  for module in IMPORT_BUDGETS_MS}
+    over_budget = {module: value for module, value in imports_ms.items() if value > IMPORT_BUDGETS_MS[module]}
+
+    # Tổng thời gian tiến trình của các lệnh khi không có việc gì: lần chạy đầu
+    # (thông báo, vẽ biểu đồ) không được tính, các lần sau phải dừng sớm
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli.py')
+    commands_ms, latencies = {}, []
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, 'data'))  # thư mục kết quả của analysis
+        for command in IDLE_COMMANDS:
+            subprocess.run([sys.executable, cli, command], capture_output=True, check=True, cwd=workdir)
+            timings = []
+            for _ in range(args.iterations):
+                started = time.perf_counter()
+                subprocess.run([sys.executable, cli, command], capture_output=True, check=True, cwd=workdir)
+                timings.append(time.perf_counter() - started)
+            commands_ms[command] = round(_percentile(timings, 50) * 1000, 1)
+            latencies.extend(timings)
+
+    baseline = []
+    for _ in range(args.iterations):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        baseline.append(time.perf_counter() - started)
+    return _summary('startup', scale, len(latencies), latencies, imports_ms=imports_ms,
+                    import_budgets_ms=IMPORT_BUDGETS_MS, over_budget=over_budget, idle_commands_ms=commands_ms,
+                    python_startup_ms=round(_percentile(baseline, 50) * 1000, 1))
+
+CASES = {
+    'scrape': bench_scrape,
+    'convert_star': bench_convert_star,
+    'append': bench_append,
+    'history': bench_history,
+    'load_data': bench_load_data,
+    'charts': bench_charts,
+    'scatter': bench_scatter,
+    'star_metrics': bench_star_metrics,
+    'startup': bench_startup,
+}
+
+def run_case(case, args):
+    """
+    Chạy một trường hợp đo trong tiến trình hiện tại
+
+    Cơ sở dữ liệu được tạo mới trong thư mục tạm để không ảnh hưởng dữ liệu thật.
+    """
+    name, scale = case.split(':')
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['GITHUB_TRENDING_DB'] = os.path.join(tmp, 'bench.db')
+        os.environ['GITHUB_TRENDING_EXPORT_DIR'] = os.path.join(tmp, 'columnar')
+        result = CASES[name](int(scale), args)
+    # ru_maxrss tính bằng KB trên Linux và byte trên macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result['peak_rss_mb'] = round(maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    return result
+
+def run_isolated(case, argv):
+    """
+    Chạy một trường hợp đo trong tiến trình con riêng để đo peak RSS chính xác
+    """
+    cmd = [sys.executable, os.path.abspath(__file__), '--case', case, *argv]
+    completed = subprocess.run(cmd, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {'case': case, 'error': completed.stderr.strip().splitlines()[-1:] or ['unknown error']}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    """
+    Hàm chính để chạy bộ đo hiệu năng
+    """
+    parser = argparse.ArgumentParser(description="Đo hiệu năng scraper offline với máy chủ GitHub giả lập")
+    parser.add_argument('--cases', nargs='+', default=DEFAULT_CASES,
+                        help='Các trường hợp đo dạng tên:quy mô, ví dụ scrape:25 history:1000000')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--iterations', type=int, default=5, help='Số lần lặp cho mỗi trường hợp đo')
+    parser.add_argument('--workers', type=int, default=8, help='Số request song song của scraper')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Độ trễ của máy chủ giả lập (ms)')
+    parser.add_argument('--jitter-ms', type=float, default=5.0, help='Độ dao động của độ trễ (ms)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Tỉ lệ request trả về lỗi (0-1)')
+    parser.add_argument('--error-status', type=int, default=500, help='Mã lỗi HTTP được trả về (ví dụ 500, 429)')
+    parser.add_argument('--server-rate', type=int, default=0,
+                        help='Số request mỗi giây máy chủ giả lập chấp nhận trước khi trả 429 (0: không giới hạn)')
+    parser.add_argument('--rate', type=float, help='Số request tối đa mỗi giây phía scraper (mặc định: không giới hạn)')
+    parser.add_argument('--history-batch', type=int, default=10000, help='Số dòng mỗi lần ghi khi nhập lịch sử')
+    parser.add_argument('--output', help='Ghi kết quả JSON ra file này')
+    args = parser.parse_args()
+
+    if args.case:
+        # Tiến trình con: chạy một trường hợp và in kết quả JSON trên dòng cuối
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        result = run_case(args.case, args)
+        print(json.dumps(result))
+        return
+
+    passthrough = [
+        '--iterations', str(args.iterations), '--workers', str(args.workers),
+        '--latency-ms', str(args.latency_ms), '--jitter-ms', str(args.jitter_ms),
+        '--error-rate', str(args.error_rate), '--error-status', str(args.error_status),
+        '--history-batch', str(args.history_batch), '--server-rate', str(args.server_rate),
+    ]
+    if args.rate is not None:
+        passthrough += ['--rate', str(args.rate)]
+    report = {
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'git_revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('case', 'cases', 'output')},
+        'results': [],
+    }
+    for case in args.cases:
+        print(f"[INFO] Đang đo {case}...", file=sys.stderr)
+        report['results'].append(run_isolated(case, passthrough))
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+
+    over_budget = {module: value for result in report['results'] for module, value in result.get('over_budget', {}).items()}
+    if over_budget:
+        for module, value in over_budget.items():
+            print(f"[CẢNH BÁO] Nạp {module} mất {value} ms, vượt ngân sách {IMPORT_BUDGETS_MS[module]} ms",
+                  file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
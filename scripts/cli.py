@@ -0,0 +1,62 @@
+# scripts/cli.py
+# Điểm vào dòng lệnh chung của dự án: python scripts/cli.py <lệnh> [tham số...]
+# Mỗi lệnh chỉ nạp mô-đun của nó khi được gọi, nên pandas, matplotlib/seaborn,
+# dash/plotly và pyarrow không làm chậm các lệnh không cần đến chúng.
+
+import argparse
+import importlib
+import os
+import sys
+
+# Lệnh -> (mô-đun, mô tả); các tham số sau tên lệnh được chuyển nguyên cho main() của mô-đun
+COMMANDS = {
+    'scrape': ('scraper', 'Thu thập GitHub Trending và ghi vào cơ sở dữ liệu'),
+    'analyze': ('analysis', 'Tạo biểu đồ và báo cáo phân tích (bỏ qua nếu dữ liệu không đổi)'),
+    'notify': ('notifier', 'Thông báo thay đổi của lần thu thập mới nhất (mỗi lần thu thập một lần)'),
+    'deliver': ('mail_utils', 'Gửi lại các thông báo còn trong hàng đợi'),
+    'serve': ('dashboard', 'Chạy dashboard'),
+    'export': ('columnar_utils', 'Xuất dữ liệu ra file Arrow/Parquet'),
+    'metrics': ('star_metrics', 'Xếp hạng repository theo tốc độ/gia tốc tăng star'),
+    'schedule': ('scheduler', 'Chạy nền pipeline thu thập -> phân tích -> thông báo'),
+    'retain': ('retention', 'Gộp/xóa lịch sử snapshots cũ và thu nhỏ cơ sở dữ liệu'),
+    'bench': ('bench', 'Đo hiệu năng offline'),
+}
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='cli.py',
+        description='Công cụ GitHub Trending',
+        epilog='Dùng "cli.py <lệnh> --help" để xem tham số của từng lệnh',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--metrics-json', default=os.getenv('GITHUB_TRENDING_METRICS_JSON'),
+                        help='Ghi số liệu đo đạc (thời gian từng giai đoạn, HTTP, cache) ra file JSON '
+                             'khi lệnh kết thúc (mặc định: biến môi trường GITHUB_TRENDING_METRICS_JSON)')
+    subparsers = parser.add_subparsers(dest='command', metavar='<lệnh>', required=True)
+    for name, (_, description) in COMMANDS.items():
+        # add_help=False: --help được chuyển cho parser của mô-đun
+        subparsers.add_parser(name, help=description, add_help=False)
+    return parser
+
+def main(argv=None):
+    """
+    Chạy một lệnh: nạp mô-đun tương ứng rồi gọi main() của nó
+
+    Tham số:
+        argv: Danh sách tham số (mặc định: sys.argv[1:])
+    """
+    args, rest = build_parser().parse_known_args(argv)
+    module = importlib.import_module(COMMANDS[args.command][0])
+    # main() của các mô-đun đọc tham số từ sys.argv
+    sys.argv = [f'cli.py {args.command}', *rest]
+    try:
+        return module.main()
+    finally:
+        if args.metrics_json:
+            import metrics_utils
+
+            metrics_utils.dump_json(args.metrics_json)
+            print(f"[INFO] Đã ghi số liệu đo đạc vào {args.metrics_json}")
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,330 @@
+# scripts/columnar_utils.py
+# Mô-đun xuất dữ liệu snapshots ra file cột (Arrow IPC/Parquet) và đọc lại
+# Dữ liệu được phân vùng theo ngày thu thập, mỗi lần chạy một file mang số
+# phiên bản dữ liệu (runs.revision) của lần chạy lúc xuất:
+#   data/columnar/scrape_day=2024-01-01/run-00000001.r3.arrow
+
+import argparse
+import os
+import re
+import sys
+from datetime import datetime
+
+from db_utils import DB_PATH, SNAPSHOT_COLUMNS, SNAPSHOTS_BY_RUN, get_connection
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow là phụ thuộc tùy chọn
+    pa = None
+
+# Thư mục chứa dữ liệu đã xuất (có thể thay đổi bằng biến môi trường GITHUB_TRENDING_EXPORT_DIR);
+# khi chỉ GITHUB_TRENDING_DB được đặt, thư mục nằm cạnh file cơ sở dữ liệu đó để
+# hai cơ sở dữ liệu không bao giờ dùng chung dữ liệu đã xuất
+EXPORT_DIR = os.getenv('GITHUB_TRENDING_EXPORT_DIR') or (
+    f'{os.path.splitext(DB_PATH)[0]}_columnar' if os.getenv('GITHUB_TRENDING_DB')
+    else os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'columnar')
+)
+
+# Định dạng file: "arrow" (Arrow IPC không nén, đọc qua memory-map không cần sao chép)
+# hoặc "parquet" (nén, nhỏ hơn, phù hợp để lưu trữ/chia sẻ)
+FORMATS = {
+    'arrow': 'arrow',
+    'parquet': 'parquet',
+}
+DEFAULT_FORMAT = 'arrow'
+
+# File xuất trước khi có runs.revision không có phần .r<revision>
+_RUN_FILE_RE = re.compile(r'^run-(\d+)(?:\.r(\d+))?\.(arrow|parquet)$')
+
+def _schema():
+    # Lược đồ cột của file xuất; các cột ít giá trị khác nhau được mã hóa dạng dictionary
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('id', pa.int64()),
+        ('full_name', pa.string()),
+        ('description', pa.string()),
+        ('language', dictionary),
+        ('stars', pa.int64()),
+        ('star_change', pa.int64()),
+        ('contributor_count', pa.int64()),
+        ('link', pa.string()),
+        ('scrape_date', pa.timestamp('s')),
+        ('listing', dictionary),
+        ('period', dictionary),
+        ('run_id', pa.int64()),
+        ('repo_id', pa.int64()),
+    ])
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Cần cài đặt pyarrow để xuất/đọc dữ liệu dạng cột (pip install pyarrow)")
+
+_warned_unavailable = False
+
+def available():
+    """
+    Kiểm tra có thể dùng dữ liệu dạng cột hay không (đã cài pyarrow)
+
+    Lần đầu thấy thiếu pyarrow, một cảnh báo được in ra để việc chuyển sang đọc
+    trực tiếp từ SQLite không diễn ra âm thầm.
+
+    Trả về:
+        True nếu đã cài pyarrow
+    """
+    global _warned_unavailable
+    if pa is None and not _warned_unavailable:
+        _warned_unavailable = True
+        print("[CẢNH BÁO] Chưa cài đặt pyarrow, đọc dữ liệu trực tiếp từ SQLite "
+              "thay vì file Arrow (pip install -r requirements.txt)")
+    return pa is not None
+
+def exported_runs(path=EXPORT_DIR):
+    """
+    Liệt kê các lần chạy đã được xuất
+
+    Trả về:
+        dict run_id -> đường dẫn file
+    """
+    return {run_id: file for run_id, (file, _) in _scan(path).items()}
+
+def exported_revisions(path=EXPORT_DIR):
+    """
+    Liệt kê số phiên bản dữ liệu (runs.revision) của các lần chạy đã được xuất
+
+    Trả về:
+        dict run_id -> revision (None với file xuất trước khi có revision)
+    """
+    return {run_id: revision for run_id, (_, revision) in _scan(path).items()}
+
+def _scan(path):
+    # run_id -> (đường dẫn file, revision); nếu một lần chạy còn nhiều file (tiến
+    # trình dừng giữa lúc thay file) thì lấy file có revision lớn nhất
+    runs = {}
+    if not os.path.isdir(path):
+        return runs
+    for day in os.listdir(path):
+        day_dir = os.path.join(path, day)
+        if not day.startswith('scrape_day=') or not os.path.isdir(day_dir):
+            continue
+        for file_name in os.listdir(day_dir):
+            match = _RUN_FILE_RE.match(file_name)
+            if match:
+                run_id = int(match.group(1))
+                revision = int(match.group(2)) if match.group(2) is not None else None
+                current = runs.get(run_id)
+                if current is None or (revision or -1) > (current[1] or -1):
+                    runs[run_id] = (os.path.join(day_dir, file_name), revision)
+    return runs
+
+def export_snapshots(path=EXPORT_DIR, fmt=DEFAULT_FORMAT, full=False, db_path=None):
+    """
+    Xuất snapshots từ SQLite ra các file cột, phân vùng theo ngày thu thập
+
+    Chỉ xuất các lần chạy chưa có file hoặc có file mang revision khác với
+    runs.revision, tức là đã được ghi thêm/ghi đè (kể cả lần chạy cũ được thu
+    thập lại cùng run_key) sau lần xuất trước. Mỗi file được ghi ra file tạm rồi
+    đổi tên nên người đọc không bao giờ thấy file dở dang. Các lần chạy không có
+    scrape_date được bỏ qua.
+
+    Tham số:
+        path: Thư mục đích
+        fmt: "arrow" hoặc "parquet"
+        full: Xuất lại toàn bộ các lần chạy
+        db_path: Đường dẫn cơ sở dữ liệu (mặc định: DB_PATH)
+
+    Trả về:
+        Số lần chạy đã xuất
+    """
+    _require_pyarrow()
+    if fmt not in FORMATS:
+        raise ValueError(f"Định dạng không hợp lệ: {fmt}")
+    existing = _scan(path)
+    conn = get_connection(db_path or DB_PATH)
+    try:
+        runs = conn.execute(
+            "SELECT id, scrape_date, revision FROM runs WHERE scrape_date IS NOT NULL ORDER BY id"
+        ).fetchall()
+        exported = 0
+        for run_id, scrape_date, revision in runs:
+            old_file, old_revision = existing.get(run_id, (None, None))
+            if not full and old_revision == revision:
+                continue
+            exported += _export_run(conn, run_id, scrape_date, revision, path, fmt, old_file)
+        return exported
+    finally:
+        conn.close()
+
+def _export_run(conn, run_id, scrape_date, revision, path, fmt, old_file=None):
+    # Xuất một lần chạy; trả về False nếu lần chạy không có dòng hoặc scrape_date không hợp lệ.
+    # revision phải được đọc trước các dòng: nếu lần chạy bị ghi giữa hai lần đọc,
+    # file mang revision cũ và sẽ được xuất lại ở lần sau
+    rows = conn.execute(
+        f"SELECT {SNAPSHOT_COLUMNS} {SNAPSHOTS_BY_RUN} WHERE ru.id = ? ORDER BY s.id", (run_id,)
+    ).fetchall()
+    if not rows:
+        return False
+    columns = [list(column) for column in zip(*rows)]
+    # scrape_date giống nhau trong cả lần chạy nên chỉ cần phân tích một lần
+    try:
+        timestamp = datetime.fromisoformat(str(scrape_date))
+    except ValueError:
+        return False
+    schema = _schema()
+    columns[schema.get_field_index('scrape_date')] = [timestamp] * len(rows)
+    table = pa.Table.from_arrays(
+        [pa.array(column).cast(field.type) if pa.types.is_dictionary(field.type)
+         else pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+        schema=schema
+    )
+    _write_run(table, path, timestamp.strftime('%Y-%m-%d'), run_id, revision, fmt, old_file)
+    return True
+
+def archive_runs(conn, run_ids, path, fmt='parquet'):
+    """
+    Lưu trữ các lần chạy ra file cột trước khi chúng bị gộp hoặc xóa (xem retention.py)
+
+    Lần chạy đã có file lưu trữ được bỏ qua, để file đầy đủ độ phân giải không bị
+    ghi đè bởi bản đã gộp ở lần retention sau.
+
+    Tham số:
+        conn: Kết nối SQLite đang mở
+        run_ids: Các lần chạy cần lưu trữ
+        path: Thư mục lưu trữ (cùng cách phân vùng với EXPORT_DIR)
+        fmt: "arrow" hoặc "parquet"
+
+    Trả về:
+        Số lần chạy đã lưu trữ
+    """
+    _require_pyarrow()
+    existing = exported_runs(path)
+    archived = 0
+    for run_id in run_ids:
+        if run_id in existing:
+            continue
+        row = conn.execute("SELECT scrape_date, revision FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if row is not None:
+            archived += _export_run(conn, run_id, *row, path, fmt)
+    return archived
+
+def sync_exported_runs(conn, run_ids, path=EXPORT_DIR):
+    """
+    Cập nhật file đã xuất của các lần chạy vừa bị gộp hoặc xóa trong SQLite
+
+    export_snapshots không biết lần chạy nào đã bị xóa, nên sau khi retention
+    thay đổi các lần chạy cũ, file của lần chạy đã bị xóa được xóa theo và file
+    của lần chạy còn lại được xuất lại ngay (cùng định dạng), để người đọc dữ
+    liệu đã xuất (dashboard, analysis) thấy đúng dữ liệu như SQLite.
+
+    Trả về:
+        Số file đã xóa hoặc xuất lại
+    """
+    existing = exported_runs(path)
+    changed = 0
+    for run_id in run_ids:
+        old_file = existing.get(run_id)
+        if old_file is None:
+            continue
+        row = conn.execute("SELECT scrape_date, revision FROM runs WHERE id = ?", (run_id,)).fetchone()
+        fmt = 'parquet' if old_file.endswith('.parquet') else 'arrow'
+        if row is None or pa is None or not _export_run(conn, run_id, *row, path, fmt, old_file):
+            os.remove(old_file)
+        changed += 1
+    return changed
+
+def _write_run(table, path, day, run_id, revision, fmt, old_file=None):
+    # Ghi một lần chạy ra file tạm rồi đổi tên thành file chính thức
+    day_dir = os.path.join(path, f'scrape_day={day}')
+    os.makedirs(day_dir, exist_ok=True)
+    target = os.path.join(day_dir, f'run-{run_id:08d}.r{revision}.{FORMATS[fmt]}')
+    tmp = f'{target}.tmp'
+    if fmt == 'parquet':
+        pq.write_table(table, tmp, compression='zstd')
+    else:
+        with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, target)
+    if old_file and old_file != target:
+        os.remove(old_file)
+
+def read_snapshots(columns=None, start_date=None, end_date=None, languages=None, path=EXPORT_DIR,
+                   revisions=None):
+    """
+    Đọc dữ liệu đã xuất, chỉ các cột và phân vùng cần thiết
+
+    File Arrow được đọc qua memory-map nên các cột không được chọn không bao giờ
+    được nạp vào bộ nhớ; bộ lọc ngày loại bỏ cả thư mục phân vùng trước khi đọc.
+    Các cột language, listing, period được trả về dạng category.
+
+    Tham số:
+        columns: Danh sách cột cần lấy (mặc định: tất cả)
+        start_date, end_date: Khoảng ngày thu thập "YYYY-MM-DD", tính cả hai đầu
+        languages: Danh sách ngôn ngữ cần lấy (mặc định: tất cả)
+        path: Thư mục dữ liệu đã xuất
+        revisions: dict run_id -> revision hiện tại (db_utils.get_run_revisions);
+                   nếu có, chỉ đọc các file cùng revision, bỏ qua file đã cũ
+
+    Trả về:
+        DataFrame, hoặc None nếu chưa có dữ liệu đã xuất
+    """
+    _require_pyarrow()
+    runs = {run_id: file for run_id, (file, revision) in _scan(path).items()
+            if revisions is None or revisions.get(run_id) == revision}
+    if not runs:
+        return None
+    # Thư mục có thể chứa cả hai định dạng nếu đã đổi --format giữa các lần xuất
+    children = []
+    for extension, fmt in (('.arrow', 'ipc'), ('.parquet', 'parquet')):
+        files = [file for file in runs.values() if file.endswith(extension)]
+        if files:
+            children.append(ds.dataset(
+                files,
+                schema=_schema().append(pa.field('scrape_day', pa.string())),
+                format=fmt,
+                partitioning=ds.partitioning(pa.schema([('scrape_day', pa.string())]), flavor='hive'),
+                partition_base_dir=path,
+                filesystem=pyarrow.fs.LocalFileSystem(use_mmap=True),
+            ))
+    dataset = children[0] if len(children) == 1 else ds.dataset(children)
+
+    language_filter = None
+    if languages:
+        language_filter = ds.field('language').isin([language for language in languages if language])
+        if '' in languages:
+            # '' đại diện cho repository không có ngôn ngữ (NULL hoặc rỗng)
+            language_filter = language_filter | ds.field('language').is_null() | (ds.field('language') == '')
+    condition = None
+    for expression in (
+        ds.field('scrape_day') >= str(start_date)[:10] if start_date else None,
+        ds.field('scrape_day') <= str(end_date)[:10] if end_date else None,
+        language_filter,
+    ):
+        if expression is not None:
+            condition = expression if condition is None else condition & expression
+    columns = columns or [name for name in dataset.schema.names if name != 'scrape_day']
+    table = dataset.to_table(columns=columns, filter=condition)
+    df = table.to_pandas()
+    # Cột dictionary được trả về dạng category, chỉ giữ các giá trị thực sự xuất hiện
+    for column in df.select_dtypes('category'):
+        df[column] = df[column].cat.remove_unused_categories()
+    return df
+
+def main():
+    parser = argparse.ArgumentParser(description='Xuất dữ liệu snapshots ra file Arrow/Parquet')
+    parser.add_argument('--output', default=EXPORT_DIR, help='Thư mục đích')
+    parser.add_argument('--format', choices=sorted(FORMATS), default=DEFAULT_FORMAT, help='Định dạng file')
+    parser.add_argument('--full', action='store_true', help='Xuất lại toàn bộ các lần chạy')
+    args = parser.parse_args()
+
+    try:
+        exported = export_snapshots(args.output, fmt=args.format, full=args.full)
+    except ImportError as e:
+        print(f"[LỖI] {e}")
+        sys.exit(1)
+    print(f"[INFO] Đã xuất {exported} lần chạy vào {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -3,17 +3,51 @@
 # Sử dụng Dash framework để tạo giao diện người dùng tương tác
 
 import dash
+import flask
 from dash import html, dcc
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 import plotly.express as px
 import pandas as pd
+import hashlib
 import sqlite3
+import threading
+import uuid
 from datetime import datetime, timedelta
-from db_utils import DB_PATH
+import columnar_utils
+import metrics_utils
+from db_utils import (
+    get_connection, get_snapshots_since, get_latest_snapshots, get_languages,
+    get_language_trend, get_language_star_change, get_retention_version, get_run_revisions,
+    get_summary_stats
+)
+
+# Nhãn hiển thị cho các repository không có thông tin ngôn ngữ
+UNKNOWN_LANGUAGE = 'Không xác định'
+
+# Biểu đồ phân tán: trên SCATTER_WEBGL_THRESHOLD điểm thì vẽ bằng WebGL (scattergl),
+# trên SCATTER_POINT_BUDGET điểm thì lấy mẫu phân tầng theo ngôn ngữ để giới hạn
+# kích thước figure gửi xuống trình duyệt; SCATTER_KEEP_TOP repository nhiều star
+# nhất luôn được giữ lại
+SCATTER_WEBGL_THRESHOLD = 1000
+SCATTER_POINT_BUDGET = 20000
+SCATTER_KEEP_TOP = 100
+
+# Các cột dashboard cần từ mỗi snapshot
+DATA_COLUMNS = [
+    'id', 'full_name', 'language', 'stars', 'star_change', 'contributor_count',
+    'scrape_date', 'run_id', 'repo_id'
+]
 
 # Khởi tạo ứng dụng Dash
 app = dash.Dash(__name__)
 
+@app.server.route('/metrics')
+def metrics():
+    """
+    Số liệu đo đạc của tiến trình dashboard theo định dạng văn bản của Prometheus
+    """
+    return flask.Response(metrics_utils.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # Thiết lập giao diện người dùng với các thành phần tùy chỉnh
 # Sử dụng CSS Grid và Flexbox để tạo layout linh hoạt
 app.layout = html.Div([
@@ -90,6 +124,24 @@ app.layout = html.Div([
                 }
             }
         ),
+        dcc.DatePickerRange(
+            id='date-range',
+            display_format='YYYY-MM-DD',
+            start_date_placeholder_text='Từ ngày',
+            end_date_placeholder_text='Đến ngày',
+            clearable=True,
+            style={'marginRight': '20px'}
+        ),
+        dcc.Dropdown(
+            id='language-filter',
+            multi=True,
+            placeholder='Tất cả ngôn ngữ',
+            style={
+                'minWidth': '260px',
+                'marginRight': '20px',
+                'fontFamily': '"Segoe UI", system-ui, -apple-system, sans-serif'
+            }
+        ),
         html.Div(
             id='last-update-time',
             style={
@@ -175,7 +227,10 @@ app.layout = html.Div([
         id='interval-component',
         interval=300000,  # cập nhật mỗi 5 phút
         n_intervals=0
-    )
+    ),
+
+    # Khóa phiên bản của các thành phần trình duyệt đang hiển thị
+    dcc.Store(id='figure-versions', data={})
 ], style={
     'backgroundColor': '#f6f8fa',
     'minHeight': '100vh',
@@ -184,51 +239,232 @@ app.layout = html.Div([
     'fontFamily': '"Segoe UI", system-ui, -apple-system, sans-serif'
 })
 
+# Dữ liệu đã tải được giữ lại trong tiến trình giữa các lần cập nhật:
+# - df: DataFrame đã xử lý kiểu dữ liệu
+# - last_id: id snapshot lớn nhất đã đọc (mốc đọc tăng dần)
+# - revisions: run_id -> runs.revision của dữ liệu lần chạy đang có trong df (None:
+#   chưa có bản đúng); lần chạy có revision thay đổi (còn đang ghi, được thu thập
+#   lại cùng run_key, ...) được đọc lại toàn bộ
+# - data_version: PRAGMA data_version lúc đọc, không đổi nghĩa là chưa có ghi mới
+# - retention: db_utils.get_retention_version lúc đọc, đổi nghĩa là lịch sử cũ đã bị gộp/xóa
+# - generation: tăng mỗi khi df thay đổi
+_cache = {'conn': None, 'df': None, 'last_id': 0, 'revisions': {}, 'data_version': None,
+          'retention': None, 'generation': 0}
+_cache_lock = threading.Lock()
+
+# Các biểu đồ và thẻ thống kê đã dựng, mỗi thành phần kèm khóa của dữ liệu đầu vào:
+# - data_version, filters: PRAGMA data_version và bộ lọc lúc dựng gần nhất
+# - entries: tên thành phần -> (khóa, giá trị đã dựng)
+_figure_cache = {'data_version': None, 'filters': None, 'entries': {}}
+_figure_lock = threading.Lock()
+
+# Mã riêng của tiến trình, để khóa dựa trên bộ đếm không trùng sau khi khởi động lại
+_PROCESS_TOKEN = uuid.uuid4().hex
+
+def _prepare_data(df):
+    """
+    Xử lý kiểu dữ liệu cho các dòng vừa đọc từ cơ sở dữ liệu
+    """
+    df = df[DATA_COLUMNS].copy()
+
+    # Xử lý dữ liệu ngày tháng
+    df['scrape_date'] = pd.to_datetime(df['scrape_date'], errors='coerce')
+    df = df.dropna(subset=['scrape_date'])
+
+    # Xử lý dữ liệu số
+    df['language'] = df['language'].astype(object).fillna('').replace('', UNKNOWN_LANGUAGE)
+    df['star_change'] = pd.to_numeric(df['star_change'], errors='coerce').fillna(0)
+    # Số người đóng góp giữ NaN khi không lấy được để không bị hiểu là 0
+    df['contributor_count'] = pd.to_numeric(df['contributor_count'], errors='coerce')
+    df['stars'] = pd.to_numeric(df['stars'], errors='coerce').fillna(0)
+
+    # Chuyển đổi kiểu dữ liệu
+    df['star_change'] = df['star_change'].astype(int)
+    df['stars'] = df['stars'].astype(int)
+
+    return df
+
+def _get_connection():
+    # Kết nối dùng chung của dashboard, gọi khi đang giữ _cache_lock
+    if _cache['conn'] is None:
+        _cache['conn'] = get_connection(check_same_thread=False)
+    return _cache['conn']
+
+def get_data_version():
+    """
+    Lấy bộ đếm thay đổi của cơ sở dữ liệu (PRAGMA data_version)
+
+    Giá trị chỉ thay đổi khi có kết nối khác ghi dữ liệu, nên có thể so sánh
+    giữa các lần cập nhật để biết có dữ liệu mới hay không.
+
+    Trả về:
+        Số nguyên, hoặc None nếu không đọc được cơ sở dữ liệu
+    """
+    with _cache_lock:
+        try:
+            return _get_connection().execute('PRAGMA data_version').fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Lỗi cơ sở dữ liệu: {e}")
+            return None
+
+def make_filters(start_date=None, end_date=None, languages=None):
+    """
+    Chuẩn hóa giá trị của các bộ lọc trên giao diện thành tham số cho db_utils
+
+    Tham số:
+        start_date, end_date: Giá trị của DatePickerRange ("YYYY-MM-DD" hoặc None)
+        languages: Các ngôn ngữ được chọn (nhãn UNKNOWN_LANGUAGE ứng với '')
+
+    Trả về:
+        dict gồm start_date, end_date, languages (tuple đã sắp xếp hoặc None)
+    """
+    languages = tuple(sorted('' if language == UNKNOWN_LANGUAGE else language for language in languages or []))
+    return {
+        'start_date': (start_date or '')[:10] or None,
+        'end_date': (end_date or '')[:10] or None,
+        'languages': languages or None,
+    }
+
+NO_FILTERS = make_filters()
+
+@metrics_utils.timed('load_rollups')
+def load_rollups(filters=NO_FILTERS):
+    """
+    Đọc các bảng tổng hợp phục vụ biểu đồ ngôn ngữ và thẻ thống kê
+
+    Các bảng này được cập nhật khi ghi dữ liệu nên thời gian đọc không phụ
+    thuộc vào độ dài lịch sử; bộ lọc được đưa thẳng vào truy vấn SQL.
+
+    Tham số:
+        filters: Kết quả của make_filters (mặc định: không lọc)
+
+    Trả về:
+        Tuple (lang_trend, star_df, summary) gồm hai DataFrame và một dict số liệu tổng quan
+    """
+    with _cache_lock:
+        try:
+            conn = _get_connection()
+            lang_trend = get_language_trend(conn, **filters)
+            star_df = get_language_star_change(conn, **filters)
+            summary = get_summary_stats(conn, **filters)
+        except sqlite3.Error as e:
+            print(f"Lỗi cơ sở dữ liệu: {e}")
+            lang_trend = pd.DataFrame(columns=['scrape_date', 'language', 'count'])
+            star_df = pd.DataFrame(columns=['language', 'avg_stars'])
+            summary = {'total_rows': 0, 'total_star_change': 0, 'avg_contributors': 0.0, 'unique_languages': 0}
+    lang_trend['scrape_date'] = pd.to_datetime(lang_trend['scrape_date'], errors='coerce')
+    lang_trend['language'] = lang_trend['language'].replace('', UNKNOWN_LANGUAGE)
+    star_df['language'] = star_df['language'].replace('', UNKNOWN_LANGUAGE)
+    return lang_trend, star_df, summary
+
+@metrics_utils.timed('load_latest_snapshots')
+def load_latest_snapshots(filters):
+    """
+    Tải snapshot mới nhất của mỗi repository thỏa bộ lọc
+
+    Bộ lọc được đưa vào truy vấn SQL (theo index của runs.scrape_date) nên chỉ
+    các dòng trong phạm vi lọc được đọc.
+    """
+    with _cache_lock:
+        try:
+            return _prepare_data(get_latest_snapshots(_get_connection(), **filters))
+        except sqlite3.Error as e:
+            print(f"Lỗi cơ sở dữ liệu: {e}")
+            return pd.DataFrame(columns=['repo_id', 'full_name', 'language', 'stars', 'star_change', 'contributor_count'])
+
+@metrics_utils.timed('load_data')
 def load_data():
     """
     Tải dữ liệu từ cơ sở dữ liệu và xử lý
+
+    Chỉ các dòng mới (cùng lần chạy mới nhất đã đọc) được lấy và xử lý rồi nối
+    vào DataFrame đã lưu trong tiến trình; khi cơ sở dữ liệu không đổi thì trả về
+    ngay DataFrame cũ. Lần tải đầu dùng dữ liệu đã xuất bởi columnar_utils nếu có.
+    DataFrame trả về được dùng chung, không sửa trực tiếp.
     """
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        df = pd.read_sql("SELECT * FROM repositories", conn)
-        conn.close()
-        
-        if df.empty:
-            print("Cảnh báo: Không tìm thấy dữ liệu trong cơ sở dữ liệu")
+    with _cache_lock:
+        try:
+            conn = _get_connection()
+
+            data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            if _cache['df'] is not None and data_version == _cache['data_version']:
+                metrics_utils.record_cache('load_data', 'hit')
+                return _cache['df']
+            metrics_utils.record_cache('load_data', 'miss')
+
+            # Mọi truy vấn dưới đây đọc cùng một trạng thái của cơ sở dữ liệu,
+            # nên revisions khớp đúng với các dòng được đọc
+            conn.execute("BEGIN")
+            try:
+                retention = get_retention_version(conn)
+                if retention != _cache['retention']:
+                    # Lịch sử cũ đã bị gộp/xóa (scripts/retention.py): các dòng đã đọc
+                    # không còn đúng, tải lại từ đầu
+                    _cache.update(df=None, last_id=0, revisions={}, retention=retention)
+                revisions = get_run_revisions(conn)
+
+                if _cache['df'] is None and columnar_utils.available():
+                    # Lần tải đầu: các lần chạy đã xuất với đúng revision hiện tại được đọc
+                    # từ file Arrow qua memory-map, phần còn lại lấy từ SQLite
+                    exported = columnar_utils.read_snapshots(DATA_COLUMNS, revisions=revisions)
+                    if exported is not None and not exported.empty:
+                        _cache['df'] = _prepare_data(exported.sort_values('id', ignore_index=True))
+                        _cache['last_id'] = int(exported['id'].max())
+                        loaded = set(exported['run_id'].unique().tolist())
+                        # Lần chạy chưa xuất hoặc có file đã cũ có thể có dòng với id nhỏ
+                        # hơn last_id, nên được đánh dấu cần đọc lại
+                        _cache['revisions'] = {run_id: revision if run_id in loaded else None
+                                               for run_id, revision in revisions.items()}
+                        _cache['generation'] += 1
+
+                # Lần chạy chưa có trong revisions đã lưu là lần chạy mới, mọi dòng của
+                # nó có id lớn hơn last_id nên đã nằm trong phần đọc theo id
+                stale = [run_id for run_id, revision in _cache['revisions'].items()
+                         if revisions.get(run_id, revision) != revision]
+                delta = get_snapshots_since(conn, _cache['last_id'], stale)
+            finally:
+                conn.execute("COMMIT")
+
+            cached = _cache['df']
+            if not delta.empty or stale:
+                if not delta.empty:
+                    _cache['last_id'] = max(_cache['last_id'], int(delta['id'].max()))
+                delta = _prepare_data(delta)
+                if cached is None:
+                    cached = delta
+                else:
+                    # Các dòng của lần chạy được đọc lại thay thế bản cũ trong cache
+                    if stale:
+                        cached = cached[~cached['run_id'].isin(stale)]
+                    # Giữ thứ tự theo id khi một lần chạy cũ được đọc lại
+                    reorder = not cached.empty and not delta.empty and delta['id'].iloc[0] < cached['id'].iloc[-1]
+                    cached = pd.concat([cached, delta], ignore_index=True)
+                    if reorder:
+                        cached = cached.sort_values('id', ignore_index=True)
+                _cache['generation'] += 1
+            _cache['revisions'] = revisions
+            _cache['df'] = cached
+            _cache['data_version'] = data_version
+
+            if cached is None or cached.empty:
+                print("Cảnh báo: Không tìm thấy dữ liệu trong cơ sở dữ liệu")
+                return pd.DataFrame()
+            return cached
+        except sqlite3.Error as e:
+            print(f"Lỗi cơ sở dữ liệu: {e}")
+            return pd.DataFrame()
+        except Exception as e:
+            print(f"Lỗi khi tải dữ liệu: {e}")
             return pd.DataFrame()
-            
-        # Xử lý dữ liệu ngày tháng
-        df['scrape_date'] = pd.to_datetime(df['scrape_date'], errors='coerce')
-        df = df.dropna(subset=['scrape_date'])
-        
-        # Xử lý dữ liệu số
-        df['language'] = df['language'].fillna('Không xác định')
-        df['star_change'] = pd.to_numeric(df['star_change'], errors='coerce').fillna(0)
-        df['contributor_count'] = pd.to_numeric(df['contributor_count'], errors='coerce').fillna(0)
-        df['stars'] = pd.to_numeric(df['stars'], errors='coerce').fillna(0)
-        
-        # Chuyển đổi kiểu dữ liệu
-        df['star_change'] = df['star_change'].astype(int)
-        df['contributor_count'] = df['contributor_count'].astype(int)
-        df['stars'] = df['stars'].astype(int)
-        
-        return df
-    except sqlite3.Error as e:
-        print(f"Lỗi cơ sở dữ liệu: {e}")
-        return pd.DataFrame()
-    except Exception as e:
-        print(f"Lỗi khi tải dữ liệu: {e}")
-        return pd.DataFrame()
 
-def create_language_trend_chart(df):
+@metrics_utils.timed('chart_language_trend')
+def create_language_trend_chart(lang_trend):
     """
     Tạo biểu đồ xu hướng ngôn ngữ lập trình
+
+    Tham số:
+        lang_trend: Số repository theo (scrape_date, language) của 10 ngôn ngữ phổ biến nhất
     """
-    # Lấy 10 ngôn ngữ phổ biến nhất
-    top_languages = df.groupby('language').size().nlargest(10).index
-    df_filtered = df[df['language'].isin(top_languages)]
-    lang_trend = df_filtered.groupby(['scrape_date', 'language']).size().reset_index(name='count')
-    
     # Tạo biểu đồ
     fig = px.area(lang_trend, x='scrape_date', y='count', color='language',
                   title='Xu Hướng Ngôn Ngữ Lập Trình',
@@ -259,14 +495,14 @@ def create_language_trend_chart(df):
     )
     return fig
 
-def create_star_changes_chart(df):
+@metrics_utils.timed('chart_star_changes')
+def create_star_changes_chart(star_df):
     """
     Tạo biểu đồ thay đổi star theo ngôn ngữ
+
+    Tham số:
+        star_df: Trung bình thay đổi star của 10 ngôn ngữ cao nhất (language, avg_stars)
     """
-    # Tính trung bình thay đổi star cho mỗi ngôn ngữ
-    star_changes = df.groupby('language')['star_change'].mean().sort_values(ascending=False).head(10)
-    star_df = pd.DataFrame({'language': star_changes.index, 'avg_stars': star_changes.values})
-    
     # Tạo biểu đồ
     fig = px.bar(star_df, x='language', y='avg_stars',
                  title='Trung Bình Thay Đổi Star Theo Ngôn Ngữ')
@@ -287,13 +523,65 @@ def create_star_changes_chart(df):
     )
     return fig
 
+def sample_scatter_points(df, budget=SCATTER_POINT_BUDGET, keep_top=SCATTER_KEEP_TOP, seed=0):
+    """
+    Lấy mẫu phân tầng theo ngôn ngữ để số điểm không vượt quá budget
+
+    Mỗi ngôn ngữ được giữ ít nhất một điểm, phần còn lại chia theo tỷ lệ số
+    repository của ngôn ngữ, và keep_top repository nhiều star nhất luôn được
+    giữ lại. Nếu số ngôn ngữ nhiều hơn số điểm còn lại thì chỉ các ngôn ngữ có
+    nhiều repository nhất được giữ, mỗi ngôn ngữ một điểm. Kết quả là cố định
+    với cùng dữ liệu và seed.
+
+    Trả về:
+        DataFrame có tối đa budget dòng (hoặc df nếu đã đủ nhỏ)
+    """
+    if len(df) <= budget:
+        return df
+    top = df.nlargest(min(keep_top, budget), 'stars')
+    rest = df.drop(top.index)
+    remaining = budget - len(top)
+    counts = rest['language'].value_counts()
+    if remaining <= 0:
+        return top
+    if len(counts) >= remaining:
+        quotas = pd.Series(1, index=counts.index[:remaining])
+    else:
+        # Mỗi ngôn ngữ một điểm, phần còn lại chia theo tỷ lệ (làm tròn xuống);
+        # phần dư do làm tròn được chia cho các nhóm lớn nhất còn chỗ, để tổng
+        # đúng bằng remaining
+        spare = counts - 1
+        extra = remaining - len(counts)
+        quotas = 1 + spare * extra // int(spare.sum())
+        leftover = remaining - int(quotas.sum())
+        for language in counts.index:
+            if leftover <= 0:
+                break
+            added = min(leftover, int(counts[language] - quotas[language]))
+            quotas[language] += added
+            leftover -= added
+    parts = [top]
+    for language, group in rest.groupby('language', sort=False):
+        if language in quotas.index:
+            parts.append(group.sample(n=int(quotas[language]), random_state=seed))
+    return pd.concat(parts)
+
+@metrics_utils.timed('chart_stars_contributors')
 def create_stars_contributors_chart(df):
     """
     Tạo biểu đồ phân tán giữa số star và số người đóng góp
+
+    Mỗi repository chỉ được biểu diễn bằng snapshot mới nhất. Với nhiều điểm,
+    biểu đồ chuyển sang WebGL và lấy mẫu phân tầng (xem sample_scatter_points),
+    nên kích thước figure bị giới hạn bất kể độ dài lịch sử.
     """
+    # df được sắp theo thời điểm đọc, dòng cuối của mỗi repo là snapshot mới nhất
+    latest = df.drop_duplicates('repo_id', keep='last') if 'repo_id' in df else df
+    points = sample_scatter_points(latest)
+
     # Tạo biểu đồ phân tán
     fig = px.scatter(
-        df,
+        points,
         x='stars',
         y='contributor_count',
         color='language',
@@ -306,8 +594,15 @@ def create_stars_contributors_chart(df):
             'full_name': 'Repository',
             'star_change': 'Thay Đổi Star'
         },
-        color_discrete_sequence=px.colors.qualitative.Set3
+        color_discrete_sequence=px.colors.qualitative.Set3,
+        render_mode='webgl' if len(points) > SCATTER_WEBGL_THRESHOLD else 'svg'
     )
+    if len(points) < len(latest):
+        fig.add_annotation(
+            text=f'Hiển thị mẫu {len(points):,} / {len(latest):,} repository (phân tầng theo ngôn ngữ)',
+            xref='paper', yref='paper', x=0.5, y=1.0, yanchor='bottom',
+            showarrow=False, font=dict(size=12, color='#586069')
+        )
 
     # Cập nhật layout
     fig.update_layout(
@@ -339,36 +634,23 @@ def create_stars_contributors_chart(df):
                       'Ngôn ngữ: %{marker.color}<extra></extra>'
     )
 
+    # Không đo kích thước bằng fig.to_json() ở đây (Dash sẽ tuần tự hóa figure
+    # thêm một lần); kích thước được đo trong bench.py, trường hợp scatter
+    metrics_utils.record_chart_points('stars_contributors', len(points))
+
     return fig
 
-@app.callback(
-    [Output('language-trend-chart', 'figure'),
-     Output('star-changes-chart', 'figure'),
-     Output('stars-contributors-chart', 'figure'),
-     Output('last-update-time', 'children'),
-     Output('summary-stats', 'children')],
-    [Input('refresh-button', 'n_clicks'),
-     Input('interval-component', 'n_intervals')]
-)
-def update_charts(n_clicks, n_intervals):
+@metrics_utils.timed('chart_summary')
+def create_summary_cards(summary):
     """
-    Cập nhật tất cả các biểu đồ và thống kê
+    Tạo các thẻ thống kê tổng quan
     """
-    df = load_data()
-    
-    # Tính toán thống kê tổng quan
-    total_repos = len(df)
-    total_stars = df['star_change'].sum()
-    avg_contributors = df['contributor_count'].mean()
-    unique_languages = df['language'].nunique()
-    
-    # Tạo các thẻ thống kê
     summary_stats = []
     for title, value, icon in [
-        ('Tổng Số Repository', f'{total_repos:,}', '📚'),
-        ('Tổng Star Mới', f'{total_stars:,}', '⭐'),
-        ('Trung Bình Người Đóng Góp', f'{avg_contributors:.1f}', '👥'),
-        ('Số Ngôn Ngữ', str(unique_languages), '💻')
+        ('Tổng Số Repository', f'{summary["total_rows"]:,}', '📚'),
+        ('Tổng Star Mới', f'{summary["total_star_change"]:,}', '⭐'),
+        ('Trung Bình Người Đóng Góp', f'{summary["avg_contributors"]:.1f}', '👥'),
+        ('Số Ngôn Ngữ', str(summary['unique_languages']), '💻')
     ]:
         summary_stats.append(html.Div([
             html.Div(icon, style={
@@ -399,16 +681,109 @@ def update_charts(n_clicks, n_intervals):
                 'boxShadow': '0 8px 16px rgba(0,0,0,0.1)'
             }
         }))
-    
+    return summary_stats
+
+def _frame_key(df):
+    # Khóa theo nội dung của một DataFrame nhỏ (ổn định giữa các tiến trình)
+    return hashlib.md5(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+# Thứ tự các thành phần theo Output của update_charts
+FIGURE_NAMES = ['language-trend', 'star-changes', 'stars-contributors', 'summary']
+
+def refresh_figures(filters=NO_FILTERS, data_version=None):
+    """
+    Dựng lại các biểu đồ và thẻ thống kê có dữ liệu đầu vào thay đổi
+
+    Mỗi thành phần được dựng lại độc lập, chỉ khi khóa dữ liệu đầu vào khác
+    với bản đã lưu trong _figure_cache. Gọi khi đang giữ _figure_lock.
+
+    Tham số:
+        filters: Kết quả của make_filters
+        data_version: Giá trị get_data_version() tương ứng với lần đọc này
+    """
+    if filters == NO_FILTERS:
+        # Không lọc: dùng dữ liệu tải tăng dần trong tiến trình
+        df = load_data()
+        scatter_key = f"{_PROCESS_TOKEN}:{_cache['generation']}"
+    else:
+        df = load_latest_snapshots(filters)
+        scatter_key = f"{_PROCESS_TOKEN}:{data_version}:{sorted(filters.items())}"
+    lang_trend, star_df, summary = load_rollups(filters)
+    inputs = {
+        'language-trend': (_frame_key(lang_trend), lambda: create_language_trend_chart(lang_trend)),
+        'star-changes': (_frame_key(star_df), lambda: create_star_changes_chart(star_df)),
+        'stars-contributors': (scatter_key, lambda: create_stars_contributors_chart(df)),
+        'summary': (hashlib.md5(repr(sorted(summary.items())).encode()).hexdigest(), lambda: create_summary_cards(summary)),
+    }
+    entries = _figure_cache['entries']
+    for name, (key, build) in inputs.items():
+        entry = entries.get(name)
+        if entry is None or entry[0] != key:
+            metrics_utils.record_cache('figures', 'miss')
+            entries[name] = (key, build())
+        else:
+            metrics_utils.record_cache('figures', 'hit')
+
+@app.callback(
+    [Output('language-trend-chart', 'figure'),
+     Output('star-changes-chart', 'figure'),
+     Output('stars-contributors-chart', 'figure'),
+     Output('summary-stats', 'children'),
+     Output('figure-versions', 'data'),
+     Output('last-update-time', 'children')],
+    [Input('refresh-button', 'n_clicks'),
+     Input('interval-component', 'n_intervals'),
+     Input('date-range', 'start_date'),
+     Input('date-range', 'end_date'),
+     Input('language-filter', 'value')],
+    [State('figure-versions', 'data')]
+)
+def update_charts(n_clicks, n_intervals, start_date, end_date, languages, client_versions):
+    """
+    Cập nhật tất cả các biểu đồ và thống kê theo bộ lọc đang chọn
+
+    Khi cơ sở dữ liệu và bộ lọc không đổi kể từ lần kiểm tra trước, chỉ tốn một
+    lần đọc PRAGMA data_version. Các thành phần mà trình duyệt đang hiển thị
+    đúng phiên bản (theo figure-versions) không được gửi lại.
+    """
+    client_versions = client_versions or {}
+    filters = make_filters(start_date, end_date, languages)
+    with _figure_lock:
+        data_version = get_data_version()
+        if (data_version is None or data_version != _figure_cache['data_version']
+                or filters != _figure_cache['filters'] or not _figure_cache['entries']):
+            refresh_figures(filters, data_version)
+            _figure_cache['data_version'] = data_version
+            _figure_cache['filters'] = filters
+        else:
+            metrics_utils.record_cache('figures', 'hit', len(FIGURE_NAMES))
+        entries = dict(_figure_cache['entries'])
+
+    outputs = [
+        dash.no_update if client_versions.get(name) == entries[name][0] else entries[name][1]
+        for name in FIGURE_NAMES
+    ]
+    versions = {name: entries[name][0] for name in FIGURE_NAMES}
     last_update = f'Cập nhật lần cuối: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}'
     
-    return [
-        create_language_trend_chart(df),
-        create_star_changes_chart(df),
-        create_stars_contributors_chart(df),
-        last_update,
-        summary_stats
-    ]
+    return outputs + [versions if versions != client_versions else dash.no_update, last_update]
+
+@app.callback(
+    Output('language-filter', 'options'),
+    [Input('interval-component', 'n_intervals')]
+)
+def update_language_options(n_intervals):
+    """
+    Cập nhật danh sách ngôn ngữ cho bộ lọc từ bảng tổng hợp
+    """
+    with _cache_lock:
+        try:
+            languages = get_languages(_get_connection())
+        except sqlite3.Error as e:
+            print(f"Lỗi cơ sở dữ liệu: {e}")
+            return []
+    labels = [language or UNKNOWN_LANGUAGE for language in languages]
+    return [{'label': label, 'value': label} for label in labels]
 
 def main():
     """
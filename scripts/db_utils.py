@@ -1,78 +1,1499 @@
 # Mô-đun chứa các tiện ích thao tác với cơ sở dữ liệu SQLite
+import math
 import sqlite3
-import pandas as pd
 from datetime import datetime, timedelta
+from itertools import islice
 import os
 
-# Đường dẫn đến file cơ sở dữ liệu
-DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'db', 'github_trending.db')
+import metrics_utils
+
+# pandas và numpy (khoảng 1 giây khi khởi động) chỉ được nạp trong các hàm đọc dữ
+# liệu cần đến chúng, để các lệnh chỉ ghi hoặc không có việc gì khởi động nhanh
+
+# Đường dẫn đến file cơ sở dữ liệu (có thể thay đổi bằng biến môi trường GITHUB_TRENDING_DB)
+DB_PATH = os.getenv(
+    'GITHUB_TRENDING_DB',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'db', 'github_trending.db')
+)
+
+# Phiên bản lược đồ hiện tại, lưu trong PRAGMA user_version
+SCHEMA_VERSION = 11
+
+# Lược đồ chuẩn hóa:
+# - repos: bảng chiều, mỗi repository một dòng (tên, mô tả, ngôn ngữ, đường dẫn)
+# - runs: mỗi lần thu thập một dòng, run_key là mã định danh ổn định giữa các lần chạy lại;
+#   completed_at chỉ được ghi khi lần thu thập đã ghi xong toàn bộ dữ liệu,
+#   notified_at khi notifier đã xử lý lần thu thập đó (xem mark_run_notified);
+#   revision tăng mỗi khi snapshots của lần chạy được ghi hoặc gộp (xem get_run_revisions)
+# - snapshots: bảng sự kiện gọn, chỉ chứa các chỉ số theo từng lần thu thập;
+#   mỗi (run, repo, listing, period) chỉ có một dòng, rank là thứ hạng trên trang trending;
+#   contributor_count là NULL khi không lấy được (khác với 0 người đóng góp), ghi lại
+#   cùng lần chạy không ghi đè giá trị đã có bằng NULL
+# - repositories: view ghép ba bảng trên, giữ nguyên các cột của bảng phẳng cũ
+# - các bảng tổng hợp (ROLLUP_SCHEMA) được cập nhật cùng lúc với snapshots
+# - notification_outbox (OUTBOX_SCHEMA): hàng đợi email thông báo chờ gửi
+# - thống kê star_change và các bất thường đã phát hiện (ANOMALY_SCHEMA)
+# - nhật ký các lần gộp/xóa lịch sử cũ (RETENTION_SCHEMA, xem retention.py)
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS repos (
+        id INTEGER PRIMARY KEY,
+        full_name TEXT NOT NULL UNIQUE,
+        description TEXT,
+        language TEXT,
+        link TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scrape_date DATETIME,
+        run_key TEXT,
+        completed_at DATETIME,
+        notified_at DATETIME,
+        revision INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_runs_key ON runs(run_key);
+    CREATE INDEX IF NOT EXISTS idx_runs_scrape_date ON runs(scrape_date);
+
+    CREATE TABLE IF NOT EXISTS snapshots (
+        id INTEGER PRIMARY KEY,
+        repo_id INTEGER NOT NULL REFERENCES repos(id),
+        run_id INTEGER NOT NULL REFERENCES runs(id),
+        listing TEXT DEFAULT 'all',
+        period TEXT DEFAULT 'daily',
+        stars INTEGER,
+        star_change INTEGER,
+        contributor_count INTEGER,
+        rank INTEGER
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_snapshots_run_repo ON snapshots(run_id, repo_id, listing, period);
+    CREATE INDEX IF NOT EXISTS idx_snapshots_repo ON snapshots(repo_id, run_id);
+
+    CREATE VIEW IF NOT EXISTS repositories AS
+        SELECT s.id, r.full_name, r.description, r.language, s.stars, s.star_change,
+               s.contributor_count, r.link, ru.scrape_date, s.listing, s.period,
+               s.run_id, s.repo_id
+        FROM snapshots s
+        JOIN repos r ON r.id = s.repo_id
+        JOIN runs ru ON ru.id = s.run_id;
+'''
+
+# Bảng tổng hợp cho dashboard, kích thước không phụ thuộc số dòng snapshots:
+# - run_language_stats: số repository, tổng star_change, tổng số người đóng góp và
+#   số dòng có số người đóng góp (contributor_count NULL khi không lấy được, không
+#   tính vào trung bình) theo (lần chạy, ngôn ngữ); dùng khi lọc theo khoảng ngày/ngôn ngữ
+# - language_stats: tổng tích lũy theo ngôn ngữ trên toàn bộ lịch sử
+# - run_stats: tổng theo từng lần chạy cho các thẻ thống kê
+# Ngôn ngữ được tính theo repos.language tại thời điểm ghi; NULL được gộp thành ''.
+ROLLUP_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS run_language_stats (
+        run_id INTEGER NOT NULL,
+        language TEXT NOT NULL,
+        repo_count INTEGER NOT NULL,
+        star_change_sum INTEGER NOT NULL,
+        contributor_sum INTEGER NOT NULL DEFAULT 0,
+        contributor_rows INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (run_id, language)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS language_stats (
+        language TEXT PRIMARY KEY,
+        repo_count INTEGER NOT NULL,
+        star_change_sum INTEGER NOT NULL
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS run_stats (
+        run_id INTEGER PRIMARY KEY,
+        repo_count INTEGER NOT NULL,
+        star_change_sum INTEGER NOT NULL,
+        contributor_sum INTEGER NOT NULL,
+        contributor_rows INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+# Hàng đợi thông báo, mỗi (thông báo, người nhận) một dòng (xem mail_utils):
+# status là pending -> sending -> sent, hoặc failed sau khi hết số lần thử;
+# next_attempt_at là thời điểm sớm nhất được gửi (lại)
+OUTBOX_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS notification_outbox (
+        id INTEGER PRIMARY KEY,
+        recipient TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        body TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at DATETIME NOT NULL,
+        next_attempt_at DATETIME NOT NULL,
+        sent_at DATETIME,
+        last_error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox(status, next_attempt_at)
+'''
+
+# Thống kê chạy (EWMA) của log(1 + star_change) trang daily, cập nhật khi mỗi lần
+# chạy hoàn tất (xem _update_star_stats), và các repository bị đánh dấu bất thường:
+# - repo_star_stats, language_star_stats: trung bình, phương sai, số mẫu và lần
+#   chạy cuối cùng đã được tính (để không tính lại khi ghi lại cùng lần chạy)
+# - star_anomalies: z-score so với lịch sử của chính repository (baseline 'repo')
+#   hoặc của ngôn ngữ khi repository chưa đủ lịch sử (baseline 'language');
+#   expected là star_change thường gặp (exp(mean) - 1)
+ANOMALY_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS repo_star_stats (
+        repo_id INTEGER PRIMARY KEY,
+        mean REAL NOT NULL,
+        var REAL NOT NULL,
+        samples INTEGER NOT NULL,
+        last_run_id INTEGER NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS language_star_stats (
+        language TEXT PRIMARY KEY,
+        mean REAL NOT NULL,
+        var REAL NOT NULL,
+        samples INTEGER NOT NULL,
+        last_run_id INTEGER NOT NULL
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS star_anomalies (
+        run_id INTEGER NOT NULL,
+        repo_id INTEGER NOT NULL,
+        star_change INTEGER NOT NULL,
+        expected REAL NOT NULL,
+        z_score REAL NOT NULL,
+        baseline TEXT NOT NULL,
+        PRIMARY KEY (run_id, repo_id)
+    ) WITHOUT ROWID
+'''
+
+# Mỗi lần retention.py gộp hoặc xóa các lần chạy cũ ghi một dòng; người đọc giữ
+# dữ liệu trong bộ nhớ (dashboard) so sánh MAX(id) để biết cần đọc lại từ đầu
+RETENTION_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS retention_log (
+        id INTEGER PRIMARY KEY,
+        ran_at DATETIME NOT NULL,
+        runs_merged INTEGER NOT NULL,
+        runs_deleted INTEGER NOT NULL,
+        rows_removed INTEGER NOT NULL
+    )
+'''
+
+SCHEMA += ROLLUP_SCHEMA + ';' + OUTBOX_SCHEMA + ';' + ANOMALY_SCHEMA + ';' + RETENTION_SCHEMA + ';'
+
+# Lược đồ phiên bản 1 (chuẩn hóa lần đầu), giữ nguyên để chuyển đổi dữ liệu từ bảng phẳng
+_SCHEMA_V1 = '''
+    CREATE TABLE repos (
+        id INTEGER PRIMARY KEY,
+        full_name TEXT NOT NULL UNIQUE,
+        description TEXT,
+        language TEXT,
+        link TEXT
+    );
+    CREATE TABLE runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scrape_date DATETIME
+    );
+    CREATE UNIQUE INDEX idx_runs_scrape_date ON runs(scrape_date);
+    CREATE TABLE snapshots (
+        id INTEGER PRIMARY KEY,
+        repo_id INTEGER NOT NULL REFERENCES repos(id),
+        run_id INTEGER NOT NULL REFERENCES runs(id),
+        listing TEXT DEFAULT 'all',
+        period TEXT DEFAULT 'daily',
+        stars INTEGER,
+        star_change INTEGER,
+        contributor_count INTEGER
+    );
+    CREATE INDEX idx_snapshots_run ON snapshots(run_id);
+    CREATE INDEX idx_snapshots_repo ON snapshots(repo_id, run_id)
+'''
+
+def _migrate_v2(conn):
+    # Thêm run_key cho runs và ràng buộc duy nhất (run, repo, listing, period) cho snapshots;
+    # các dòng trùng lặp do chạy lại trước đây được gộp, giữ lại dòng ghi sau cùng
+    conn.execute("ALTER TABLE runs ADD COLUMN run_key TEXT")
+    conn.execute("UPDATE runs SET run_key = scrape_date")
+    conn.execute("DROP INDEX IF EXISTS idx_runs_scrape_date")
+    conn.execute("CREATE INDEX idx_runs_scrape_date ON runs(scrape_date)")
+    conn.execute("CREATE UNIQUE INDEX idx_runs_key ON runs(run_key)")
+    removed = conn.execute('''
+        DELETE FROM snapshots WHERE id NOT IN (
+            SELECT MAX(id) FROM snapshots GROUP BY run_id, repo_id, listing, period
+        )
+    ''').rowcount
+    if removed:
+        print(f"[INFO] Đã xóa {removed} dòng trùng lặp trong snapshots")
+    conn.execute("DROP INDEX IF EXISTS idx_snapshots_run")
+    conn.execute("CREATE UNIQUE INDEX idx_snapshots_run_repo ON snapshots(run_id, repo_id, listing, period)")
+
+def _migrate_v3(conn):
+    # Tạo các bảng tổng hợp và tính lại từ toàn bộ snapshots hiện có
+    for statement in ROLLUP_SCHEMA.split(';'):
+        conn.execute(statement)
+    rebuild_rollups(conn)
+
+def _migrate_v4(conn):
+    # Thêm tổng số người đóng góp theo (lần chạy, ngôn ngữ) để tính thẻ thống kê
+    # khi lọc theo ngôn ngữ; cơ sở dữ liệu vừa qua bước 3 đã có sẵn cột này
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(run_language_stats)")}
+    if 'contributor_sum' not in columns:
+        conn.execute("ALTER TABLE run_language_stats ADD COLUMN contributor_sum INTEGER NOT NULL DEFAULT 0")
+        rebuild_rollups(conn)
+
+def _migrate_v5(conn):
+    # Thêm thứ hạng trên trang trending và thời điểm hoàn tất của lần chạy;
+    # dữ liệu cũ không có thứ hạng (NULL), các lần chạy cũ được coi là đã hoàn tất
+    conn.execute("ALTER TABLE snapshots ADD COLUMN rank INTEGER")
+    conn.execute("ALTER TABLE runs ADD COLUMN completed_at DATETIME")
+    conn.execute("UPDATE runs SET completed_at = scrape_date")
+
+def _migrate_v6(conn):
+    # Tạo hàng đợi thông báo
+    for statement in OUTBOX_SCHEMA.split(';'):
+        conn.execute(statement)
+
+def _migrate_v7(conn):
+    # Đếm riêng số dòng có số người đóng góp để trung bình bỏ qua các lần tra cứu
+    # thất bại (NULL); cơ sở dữ liệu vừa qua bước 3 đã có sẵn cột này
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(run_language_stats)")}
+    if 'contributor_rows' not in columns:
+        conn.execute("ALTER TABLE run_language_stats ADD COLUMN contributor_rows INTEGER NOT NULL DEFAULT 0")
+        conn.execute("ALTER TABLE run_stats ADD COLUMN contributor_rows INTEGER NOT NULL DEFAULT 0")
+        rebuild_rollups(conn)
+
+def _migrate_v8(conn):
+    # Tạo các bảng phát hiện bất thường và tính thống kê từ các lần chạy đã hoàn tất
+    for statement in ANOMALY_SCHEMA.split(';'):
+        conn.execute(statement)
+    rebuild_star_stats(conn)
+
+def _migrate_v9(conn):
+    # Ghi nhận lần chạy đã được thông báo; các lần chạy cũ coi như đã thông báo
+    # để lần nâng cấp không gửi lại thông báo của lần thu thập gần nhất
+    conn.execute("ALTER TABLE runs ADD COLUMN notified_at DATETIME")
+    conn.execute("UPDATE runs SET notified_at = completed_at")
+
+def _migrate_v10(conn):
+    # Tạo nhật ký retention
+    conn.execute(RETENTION_SCHEMA)
+
+def _migrate_v11(conn):
+    # Đánh số phiên bản dữ liệu của từng lần chạy; file đã xuất trước đó không
+    # có số phiên bản nên được xuất lại một lần
+    conn.execute("ALTER TABLE runs ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+
+# Các bước nâng cấp lược đồ theo phiên bản đích
+MIGRATIONS = {
+    2: _migrate_v2,
+    3: _migrate_v3,
+    4: _migrate_v4,
+    5: _migrate_v5,
+    6: _migrate_v6,
+    7: _migrate_v7,
+    8: _migrate_v8,
+    9: _migrate_v9,
+    10: _migrate_v10,
+    11: _migrate_v11,
+}
+
+# Các cột trả về cho người đọc, giống các cột của view repositories
+SNAPSHOT_COLUMNS = '''
+    s.id, r.full_name, r.description, r.language, s.stars, s.star_change,
+    s.contributor_count, r.link, ru.scrape_date, s.listing, s.period,
+    s.run_id, s.repo_id
+'''
+
+# Truy vấn theo khoảng thời gian: CROSS JOIN buộc SQLite duyệt runs qua
+# idx_runs_scrape_date trước rồi mới tra snapshots theo idx_snapshots_run_repo,
+# thay vì quét toàn bộ snapshots khi chưa có thống kê ANALYZE
+SNAPSHOTS_BY_RUN = '''
+    FROM runs ru
+    CROSS JOIN snapshots s ON s.run_id = ru.id
+    CROSS JOIN repos r ON r.id = s.repo_id
+'''
 
 def init_db():
     """
     Khởi tạo cơ sở dữ liệu và tạo bảng nếu chưa tồn tại
+
+    Cơ sở dữ liệu cũ được nâng cấp ngay tại chỗ: bảng phẳng repositories được
+    chuyển sang lược đồ chuẩn hóa (xem migrate_flat_repositories), sau đó các
+    bước trong MIGRATIONS được áp dụng lần lượt theo PRAGMA user_version.
     """
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Tạo bảng repositories nếu chưa tồn tại
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS repositories (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            full_name TEXT,
-            description TEXT,
-            language TEXT,
-            stars INTEGER,
-            star_change INTEGER,
-            contributor_count INTEGER,
-            link TEXT,
-            scrape_date DATETIME
-        )
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    try:
+        if _object_type(conn, 'repositories') == 'table':
+            migrate_flat_repositories(conn)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if _object_type(conn, 'snapshots') is None:
+            # Cơ sở dữ liệu mới: tạo thẳng lược đồ mới nhất; auto_vacuum chỉ đổi được
+            # trước khi tạo bảng (hoặc bằng VACUUM), cho phép retention thu nhỏ file
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            version = SCHEMA_VERSION
+        elif version == 0:
+            # Cơ sở dữ liệu chuẩn hóa trước khi có user_version
+            version = 1
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                MIGRATIONS[target](conn)
+                conn.execute(f"PRAGMA user_version = {target}")
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+            print(f"[INFO] Đã nâng cấp lược đồ cơ sở dữ liệu lên phiên bản {target}")
+        conn.executescript(SCHEMA)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    finally:
+        conn.close()
+
+def _object_type(conn, name):
+    # Trả về loại đối tượng ("table", "view", ...) hoặc None nếu chưa tồn tại
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else None
+
+def migrate_flat_repositories(conn):
+    """
+    Chuyển bảng phẳng repositories sang lược đồ repos/runs/snapshots (phiên bản 1)
+
+    Toàn bộ quá trình chạy trong một transaction; id của từng dòng cũ được giữ
+    nguyên làm id của snapshot. Sau khi chuyển, repositories trở thành view và
+    init_db tiếp tục nâng cấp lên lược đồ mới nhất.
+
+    Tham số:
+        conn: Kết nối SQLite ở chế độ autocommit (isolation_level=None)
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(repositories)")}
+    listing = "COALESCE(o.listing, 'all')" if 'listing' in columns else "'all'"
+    period = "COALESCE(o.period, 'daily')" if 'period' in columns else "'daily'"
+    total = conn.execute("SELECT COUNT(*) FROM repositories").fetchone()[0]
+    print(f"[INFO] Đang chuyển {total} dòng sang lược đồ chuẩn hóa...")
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("ALTER TABLE repositories RENAME TO repositories_flat")
+        for statement in _SCHEMA_V1.split(';'):
+            conn.execute(statement)
+
+        conn.execute('''
+            INSERT INTO runs (scrape_date)
+            SELECT DISTINCT scrape_date FROM repositories_flat ORDER BY scrape_date
+        ''')
+        # Thông tin mô tả lấy theo lần xuất hiện gần nhất của mỗi repository
+        conn.execute('''
+            INSERT INTO repos (full_name, description, language, link)
+            SELECT COALESCE(full_name, ''), description, language, link
+            FROM repositories_flat
+            WHERE id IN (SELECT MAX(id) FROM repositories_flat GROUP BY COALESCE(full_name, ''))
+        ''')
+        conn.execute(f'''
+            INSERT INTO snapshots (id, repo_id, run_id, listing, period, stars, star_change, contributor_count)
+            SELECT o.id, r.id, ru.id, {listing}, {period}, o.stars, o.star_change, o.contributor_count
+            FROM repositories_flat o
+            JOIN repos r ON r.full_name = COALESCE(o.full_name, '')
+            JOIN runs ru ON ru.scrape_date IS o.scrape_date
+        ''')
+        conn.execute("DROP TABLE repositories_flat")
+        conn.execute("PRAGMA user_version = 1")
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("ANALYZE")
+    print("[INFO] Đã chuyển xong sang lược đồ chuẩn hóa")
+
+# Truy vấn tổng hợp theo (lần chạy, ngôn ngữ); {where} giới hạn theo một lần chạy hoặc để trống
+_RUN_LANGUAGE_ROLLUP = '''
+    SELECT s.run_id AS run_id, COALESCE(r.language, '') AS language, COUNT(*) AS repo_count,
+           COALESCE(SUM(s.star_change), 0) AS star_change_sum,
+           COALESCE(SUM(s.contributor_count), 0) AS contributor_sum,
+           COUNT(s.contributor_count) AS contributor_rows
+    FROM snapshots s
+    CROSS JOIN repos r ON r.id = s.repo_id
+    {where}
+    GROUP BY s.run_id, COALESCE(r.language, '')
+'''
+
+def rebuild_rollups(conn):
+    """
+    Tính lại toàn bộ các bảng tổng hợp từ snapshots
+
+    Dùng khi nâng cấp lược đồ hoặc khi cần sửa lại các bảng tổng hợp; khi ghi
+    bình thường SnapshotWriter tự cập nhật cho các lần chạy bị ảnh hưởng.
+
+    Tham số:
+        conn: Kết nối SQLite, nên đang ở trong một transaction
+    """
+    conn.execute("DELETE FROM run_language_stats")
+    conn.execute("DELETE FROM language_stats")
+    conn.execute("DELETE FROM run_stats")
+    conn.execute(f'''
+        CREATE TEMP TABLE rollup_rebuild AS {_RUN_LANGUAGE_ROLLUP.format(where='')}
     ''')
-    
-    conn.commit()
-    conn.close()
+    conn.execute('''
+        INSERT INTO run_language_stats
+        SELECT run_id, language, repo_count, star_change_sum, contributor_sum, contributor_rows
+        FROM rollup_rebuild
+    ''')
+    conn.execute('''
+        INSERT INTO language_stats
+        SELECT language, SUM(repo_count), SUM(star_change_sum) FROM run_language_stats GROUP BY language
+    ''')
+    conn.execute('''
+        INSERT INTO run_stats
+        SELECT run_id, SUM(repo_count), SUM(star_change_sum), SUM(contributor_sum), SUM(contributor_rows)
+        FROM rollup_rebuild GROUP BY run_id
+    ''')
+    conn.execute("DROP TABLE rollup_rebuild")
+
+def _refresh_rollups(c, run_ids):
+    # Tính lại tổng hợp của các lần chạy vừa được ghi (chỉ đọc dòng của những
+    # lần chạy đó qua idx_snapshots_run_repo) rồi cộng phần chênh lệch so với
+    # bản cũ vào language_stats; vẫn đúng khi dòng cũ bị ghi đè bởi upsert
+    deltas = {}
+    for run_id in run_ids:
+        for language, repo_count, star_change_sum in c.execute(
+                "SELECT language, repo_count, star_change_sum FROM run_language_stats WHERE run_id = ?", (run_id,)):
+            old_count, old_sum = deltas.get(language, (0, 0))
+            deltas[language] = (old_count - repo_count, old_sum - star_change_sum)
+        rows = c.execute(_RUN_LANGUAGE_ROLLUP.format(where='WHERE s.run_id = ?'), (run_id,)).fetchall()
+        totals = [0, 0, 0, 0]
+        for _, language, repo_count, star_change_sum, contributor_sum, contributor_rows in rows:
+            old_count, old_sum = deltas.get(language, (0, 0))
+            deltas[language] = (old_count + repo_count, old_sum + star_change_sum)
+            totals[0] += repo_count
+            totals[1] += star_change_sum
+            totals[2] += contributor_sum
+            totals[3] += contributor_rows
+        c.execute("DELETE FROM run_language_stats WHERE run_id = ?", (run_id,))
+        c.executemany("INSERT INTO run_language_stats VALUES (?, ?, ?, ?, ?, ?)", rows)
+        c.execute("INSERT OR REPLACE INTO run_stats VALUES (?, ?, ?, ?, ?)", (run_id, *totals))
+    c.executemany('''
+        INSERT INTO language_stats VALUES (?, ?, ?)
+        ON CONFLICT(language) DO UPDATE SET
+            repo_count = repo_count + excluded.repo_count,
+            star_change_sum = star_change_sum + excluded.star_change_sum
+    ''', [(language, *delta) for language, delta in deltas.items() if delta != (0, 0)])
+    c.execute("DELETE FROM language_stats WHERE repo_count = 0")
+
+# Tham số phát hiện bất thường của star_change (trên thang log(1 + star_change)):
+# hệ số EWMA cho mỗi lần chạy của repository và cho mỗi repository của ngôn ngữ,
+# số mẫu tối thiểu trước khi dùng làm baseline, độ lệch chuẩn tối thiểu (tránh
+# z-score rất lớn khi lịch sử gần như không đổi) và ngưỡng đánh dấu
+ANOMALY_REPO_ALPHA = 0.1
+ANOMALY_LANGUAGE_ALPHA = 0.01
+ANOMALY_MIN_REPO_SAMPLES = 5
+ANOMALY_MIN_LANGUAGE_SAMPLES = 50
+ANOMALY_MIN_STD = 0.5
+ANOMALY_Z_THRESHOLD = 3.0
+# Bỏ qua các mức tăng quá nhỏ dù z-score cao (ví dụ từ 0 lên 5 star)
+ANOMALY_MIN_STAR_CHANGE = 50
+
+def _ewma_update(stats, x, alpha, run_id):
+    # Cập nhật (mean, var, samples, last_run_id) theo EWMA có trọng số alpha
+    if stats is None:
+        return [x, 0.0, 1, run_id]
+    mean, var, samples, _ = stats
+    diff = x - mean
+    increment = alpha * diff
+    return [mean + increment, (1 - alpha) * (var + diff * increment), samples + 1, run_id]
+
+def _z_score(stats, x, min_samples):
+    # z-score của x so với thống kê, None nếu chưa đủ mẫu
+    if stats is None or stats[2] < min_samples:
+        return None
+    return (x - stats[0]) / max(math.sqrt(stats[1]), ANOMALY_MIN_STD)
+
+def _update_star_stats(c, run_id):
+    # Chấm điểm các repository của một lần chạy so với thống kê trước đó, ghi các
+    # bất thường, rồi cập nhật thống kê; chỉ đọc các dòng của lần chạy này và
+    # thống kê của các repository/ngôn ngữ có mặt, không quét lại lịch sử.
+    # Mỗi lần chạy được áp dụng một lần, theo thứ tự hoàn tất (SnapshotWriter.write
+    # chỉ gọi ở lần hoàn tất đầu tiên) chứ không theo id: hai listing/run_key ghi
+    # song song có thể hoàn tất không theo thứ tự id, và lần chạy đó vẫn phải được
+    # chấm điểm. Cố ý chấp nhận EWMA nhận mẫu lệch thứ tự thời gian trong trường
+    # hợp này, vì độ lệch chỉ là vài lần chạy.
+    rows = c.execute('''
+        SELECT s.repo_id, COALESCE(r.language, ''), MAX(s.star_change)
+        FROM snapshots s
+        CROSS JOIN repos r ON r.id = s.repo_id
+        WHERE s.run_id = ? AND s.period = 'daily' AND s.star_change IS NOT NULL
+        GROUP BY s.repo_id
+    ''', (run_id,)).fetchall()
+    if not rows:
+        return 0
+
+    repo_stats = {}
+    repo_ids = [row[0] for row in rows]
+    for start in range(0, len(repo_ids), 500):
+        chunk = repo_ids[start:start + 500]
+        for repo_id, *stats in c.execute(
+                f"SELECT repo_id, mean, var, samples, last_run_id FROM repo_star_stats "
+                f"WHERE repo_id IN ({','.join('?' * len(chunk))})", chunk):
+            repo_stats[repo_id] = stats
+    languages = sorted({row[1] for row in rows})
+    language_stats = {language: stats for language, *stats in c.execute(
+        f"SELECT language, mean, var, samples, last_run_id FROM language_star_stats "
+        f"WHERE language IN ({','.join('?' * len(languages))})", languages)}
+
+    # Chấm điểm trên thống kê trước lần chạy để mọi repository dùng cùng baseline
+    anomalies = []
+    observations = []
+    for repo_id, language, star_change in rows:
+        stats = repo_stats.get(repo_id)
+        if stats is not None and stats[3] == run_id:
+            continue  # lần chạy này đã được tính
+        x = math.log1p(max(star_change, 0))
+        observations.append((repo_id, language, x))
+        baseline, z = 'repo', _z_score(stats, x, ANOMALY_MIN_REPO_SAMPLES)
+        if z is None:
+            baseline, stats = 'language', language_stats.get(language)
+            z = _z_score(stats, x, ANOMALY_MIN_LANGUAGE_SAMPLES)
+        if z is not None and z >= ANOMALY_Z_THRESHOLD and star_change >= ANOMALY_MIN_STAR_CHANGE:
+            anomalies.append((run_id, repo_id, star_change, math.expm1(stats[0]), z, baseline))
+
+    for repo_id, language, x in observations:
+        repo_stats[repo_id] = _ewma_update(repo_stats.get(repo_id), x, ANOMALY_REPO_ALPHA, run_id)
+        language_stats[language] = _ewma_update(language_stats.get(language), x, ANOMALY_LANGUAGE_ALPHA, run_id)
+
+    c.executemany("INSERT OR REPLACE INTO star_anomalies VALUES (?, ?, ?, ?, ?, ?)", anomalies)
+    c.executemany("INSERT OR REPLACE INTO repo_star_stats VALUES (?, ?, ?, ?, ?)",
+                  [(repo_id, *repo_stats[repo_id]) for repo_id in {obs[0] for obs in observations}])
+    c.executemany("INSERT OR REPLACE INTO language_star_stats VALUES (?, ?, ?, ?, ?)",
+                  [(language, *stats) for language, stats in language_stats.items()])
+    return len(anomalies)
+
+def rebuild_star_stats(conn):
+    """
+    Tính lại thống kê star_change và các bất thường từ mọi lần chạy đã hoàn tất
+
+    Dùng khi nâng cấp lược đồ hoặc khi đổi tham số phát hiện; khi ghi bình
+    thường SnapshotWriter tự cập nhật khi mỗi lần chạy hoàn tất.
+
+    Tham số:
+        conn: Kết nối SQLite, nên đang ở trong một transaction
+    """
+    for table in ('repo_star_stats', 'language_star_stats', 'star_anomalies'):
+        conn.execute(f"DELETE FROM {table}")
+    run_ids = [row[0] for row in conn.execute(
+        "SELECT id FROM runs WHERE completed_at IS NOT NULL ORDER BY completed_at, scrape_date, id")]
+    if run_ids:
+        print(f"[INFO] Đang tính thống kê star_change cho {len(run_ids)} lần chạy...")
+    for run_id in run_ids:
+        _update_star_stats(conn, run_id)
+
+def _drop_run_rollups(c, run_ids):
+    # Xóa tổng hợp của các lần chạy sắp bị xóa và trừ phần của chúng khỏi language_stats
+    deltas = {}
+    for run_id in run_ids:
+        for language, repo_count, star_change_sum in c.execute(
+                "SELECT language, repo_count, star_change_sum FROM run_language_stats WHERE run_id = ?", (run_id,)):
+            old_count, old_sum = deltas.get(language, (0, 0))
+            deltas[language] = (old_count + repo_count, old_sum + star_change_sum)
+        c.execute("DELETE FROM run_language_stats WHERE run_id = ?", (run_id,))
+        c.execute("DELETE FROM run_stats WHERE run_id = ?", (run_id,))
+    c.executemany('''
+        UPDATE language_stats SET repo_count = repo_count - ?, star_change_sum = star_change_sum - ?
+        WHERE language = ?
+    ''', [(*delta, language) for language, delta in deltas.items()])
+    c.execute("DELETE FROM language_stats WHERE repo_count <= 0")
+
+def merge_runs(c, run_ids):
+    """
+    Gộp nhiều lần chạy thành lần chạy mới nhất trong số đó (giảm độ phân giải)
+
+    Mỗi (repository, listing, period) chỉ còn một dòng, gắn vào lần chạy mới nhất:
+    dòng có id lớn nhất được giữ lại (nên thứ tự id vẫn theo thời gian) với stars,
+    star_change, contributor_count lớn nhất và rank tốt nhất trong các lần chạy,
+    các dòng còn lại bị xóa. Các lần chạy khác bị xóa cùng tổng hợp và bất thường
+    của chúng; tổng hợp của lần chạy được giữ được tính lại. Thống kê EWMA của
+    star_change (repo_star_stats, language_star_stats) không đổi.
+
+    Tham số:
+        c: Cursor SQLite, đang ở trong một transaction
+        run_ids: Các lần chạy cần gộp
+
+    Trả về:
+        Tuple (run_id được giữ, số dòng snapshots đã xóa)
+    """
+    runs = c.execute(f'''
+        SELECT id, completed_at, notified_at FROM runs WHERE id IN ({','.join('?' * len(run_ids))})
+        ORDER BY scrape_date, id
+    ''', list(run_ids)).fetchall()
+    if len(runs) < 2:
+        return (runs[0][0] if runs else None), 0
+    keep = runs[-1][0]
+    others = [run[0] for run in runs[:-1]]
+    placeholders = ','.join('?' * len(runs))
+    all_ids = [run[0] for run in runs]
+
+    c.execute("DROP TABLE IF EXISTS temp.retention_keep")
+    c.execute(f'''
+        CREATE TEMP TABLE retention_keep AS
+        SELECT MAX(id) AS id, MAX(stars) AS stars, MAX(star_change) AS star_change,
+               MAX(contributor_count) AS contributor_count, MIN(rank) AS rank
+        FROM snapshots WHERE run_id IN ({placeholders})
+        GROUP BY repo_id, listing, period
+    ''', all_ids)
+    removed = c.execute(f'''
+        DELETE FROM snapshots
+        WHERE run_id IN ({placeholders}) AND id NOT IN (SELECT id FROM temp.retention_keep)
+    ''', all_ids).rowcount
+    c.execute('''
+        UPDATE snapshots SET run_id = ?, stars = k.stars, star_change = k.star_change,
+            contributor_count = k.contributor_count, rank = k.rank
+        FROM temp.retention_keep k WHERE snapshots.id = k.id
+    ''', (keep,))
+    c.execute("DROP TABLE temp.retention_keep")
+
+    # Lần chạy được giữ hoàn tất/đã thông báo nếu một lần chạy bất kỳ trong nhóm đã như vậy
+    completed = max((run[1] for run in runs if run[1]), default=None)
+    notified = max((run[2] for run in runs if run[2]), default=None)
+    c.execute("UPDATE runs SET completed_at = ?, notified_at = ?, revision = revision + 1 WHERE id = ?",
+              (completed, notified, keep))
+    _delete_run_rows(c, others)
+    _refresh_rollups(c, [keep])
+    return keep, removed
+
+def delete_runs(c, run_ids):
+    """
+    Xóa hẳn các lần chạy cùng snapshots, tổng hợp và bất thường của chúng
+
+    Bảng repos không bị xóa: SnapshotWriter giữ id repository trong bộ nhớ nên
+    xóa repos khi một tiến trình khác đang ghi có thể làm mất dòng.
+
+    Tham số:
+        c: Cursor SQLite, đang ở trong một transaction
+        run_ids: Các lần chạy cần xóa
+
+    Trả về:
+        Số dòng snapshots đã xóa
+    """
+    removed = 0
+    for run_id in run_ids:
+        removed += c.execute("DELETE FROM snapshots WHERE run_id = ?", (run_id,)).rowcount
+    _delete_run_rows(c, run_ids)
+    return removed
+
+def _delete_run_rows(c, run_ids):
+    # Xóa các lần chạy (đã không còn snapshots) cùng tổng hợp và bất thường của chúng
+    _drop_run_rollups(c, run_ids)
+    c.executemany("DELETE FROM star_anomalies WHERE run_id = ?", [(run_id,) for run_id in run_ids])
+    c.executemany("DELETE FROM runs WHERE id = ?", [(run_id,) for run_id in run_ids])
+
+def get_retention_version(conn):
+    """
+    Mã của lần retention gần nhất (0 nếu chưa có); thay đổi khi lịch sử cũ bị gộp hoặc xóa
+    """
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM retention_log").fetchone()[0]
+
+# Số dòng ghi trong mỗi transaction của SnapshotWriter
+DEFAULT_BATCH_SIZE = 50000
+
+# Các PRAGMA áp dụng cho kết nối dùng lâu dài: WAL cho phép dashboard đọc
+# trong khi scraper đang ghi; synchronous=NORMAL là đủ an toàn khi dùng WAL
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Bộ ghi hàng loạt cho phép WAL lớn hơn (tối đa ~200MB) để giảm số lần
+# checkpoint giữa các lô; WAL được checkpoint và thu gọn khi đóng bộ ghi
+WRITER_PRAGMAS = (
+    "PRAGMA wal_autocheckpoint=50000",
+)
+
+def get_connection(db_path=None, check_same_thread=True):
+    """
+    Mở kết nối SQLite đã được tinh chỉnh (WAL, cache lớn, mmap)
+
+    Tham số:
+        db_path: Đường dẫn file cơ sở dữ liệu (mặc định: DB_PATH)
+        check_same_thread: Truyền cho sqlite3.connect, đặt False khi dùng chung giữa các luồng
+
+    Trả về:
+        sqlite3.Connection ở chế độ autocommit (isolation_level=None)
+    """
+    conn = sqlite3.connect(db_path or DB_PATH, isolation_level=None, check_same_thread=check_same_thread)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def _int_or_none(value):
+    # Chuyển giá trị số (kể cả kiểu numpy) sang int của Python; None/NaN thành None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+class SnapshotWriter:
+    """
+    Bộ ghi dữ liệu hàng loạt vào lược đồ repos/runs/snapshots
+
+    Giữ một kết nối lâu dài, ghi theo lô bằng executemany trong các transaction
+    lớn và lưu đệm id của repos/runs để không phải tra lại cho mỗi dòng.
+
+    Việc ghi là idempotent: mỗi lần thu thập được xác định bởi run_key, và mỗi
+    (run, repo, listing, period) chỉ có một dòng. Ghi lại cùng một run_key (ví
+    dụ khi chạy lại sau lỗi) sẽ cập nhật các dòng đã có thay vì thêm dòng mới.
+
+    Ví dụ:
+        with SnapshotWriter() as writer:
+            writer.write(records, scrape_date="2024-01-01 00:00:00", run_key="2024-01-01T00")
+    """
+
+    def __init__(self, db_path=None, batch_size=DEFAULT_BATCH_SIZE, check_same_thread=True):
+        self.db_path = db_path or DB_PATH
+        self.batch_size = batch_size
+        self.conn = get_connection(self.db_path, check_same_thread=check_same_thread)
+        for pragma in WRITER_PRAGMAS:
+            self.conn.execute(pragma)
+        self._run_ids = {}
+        # full_name -> (repo_id, description, language, link)
+        self._repos = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def checkpoint(self):
+        """
+        Ghi nội dung WAL vào file cơ sở dữ liệu và thu gọn WAL; bộ ghi dùng lâu
+        dài (ví dụ trong bộ lập lịch) nên gọi sau mỗi lần chạy
+        """
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        if self.conn is not None:
+            self.checkpoint()
+            self.conn.close()
+            self.conn = None
+
+    def write(self, records, scrape_date=None, run_key=None, complete=False, batch_size=None):
+        """
+        Ghi các bản ghi repository vào cơ sở dữ liệu
+
+        Tham số:
+            records: Iterable các dict có các khóa full_name, description, language,
+                     stars, star_change, contributor_count, link và tùy chọn
+                     scrape_date, run_key, listing, period, rank
+            scrape_date: Thời điểm thu thập dùng cho các bản ghi không có scrape_date
+            run_key: Mã lần thu thập dùng cho các bản ghi không có run_key
+                     (mặc định: dùng scrape_date của bản ghi)
+            complete: Đánh dấu các lần chạy vừa ghi là đã hoàn tất (completed_at)
+                      sau khi ghi xong toàn bộ records, đồng thời phát hiện bất
+                      thường star_change và cập nhật thống kê (star_anomalies)
+            batch_size: Số dòng mỗi transaction (mặc định: self.batch_size); records
+                        được đọc dần nên có thể là generator, mỗi lô đã commit được
+                        giữ lại nếu records bị lỗi giữa chừng
+
+        Trả về:
+            Số dòng đã ghi (thêm mới hoặc cập nhật)
+        """
+        total = 0
+        written_runs = set()
+        batch_size = batch_size or self.batch_size
+        records = iter(records)
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            with metrics_utils.span('db_write', rows=len(batch)):
+                total += self._write_batch(batch, scrape_date, run_key, written_runs)
+        if complete and written_runs:
+            completed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            c = self.conn.cursor()
+            with metrics_utils.span('db_complete'):
+                c.execute("BEGIN IMMEDIATE")
+                try:
+                    # Thống kê star_change chỉ được cập nhật ở lần hoàn tất đầu tiên của
+                    # mỗi lần chạy (ghi lại cùng run_key không tính mẫu hai lần)
+                    placeholders = ','.join('?' * len(written_runs))
+                    first_completed = [row[0] for row in c.execute(
+                        f"SELECT id FROM runs WHERE id IN ({placeholders}) AND completed_at IS NULL "
+                        f"ORDER BY scrape_date, id", sorted(written_runs))]
+                    c.executemany("UPDATE runs SET completed_at = ? WHERE id = ?",
+                                  [(completed_at, run_id) for run_id in written_runs])
+                    for run_id in first_completed:
+                        _update_star_stats(c, run_id)
+                    c.execute("COMMIT")
+                except BaseException:
+                    c.execute("ROLLBACK")
+                    raise
+        return total
+
+    def _write_batch(self, batch, default_scrape_date, default_run_key, written_runs):
+        c = self.conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            self._resolve_repos(c, batch)
+            repos = self._repos
+            run_ids = self._run_ids
+            rows = []
+            append = rows.append
+            for record in batch:
+                get = record.get
+                scrape_date = get('scrape_date') or default_scrape_date
+                key = get('run_key') or default_run_key or scrape_date
+                run_id = run_ids.get(key)
+                if run_id is None:
+                    run_id = run_ids[key] = self._get_run_id(c, key, scrape_date)
+                stars, star_change, contributors = get('stars'), get('star_change'), get('contributor_count')
+                rank = get('rank')
+                append((
+                    repos[record['full_name']][0], run_id,
+                    get('listing') or 'all', get('period') or 'daily',
+                    stars if type(stars) is int else _int_or_none(stars),
+                    star_change if type(star_change) is int else _int_or_none(star_change),
+                    contributors if type(contributors) is int else _int_or_none(contributors),
+                    rank if type(rank) is int else _int_or_none(rank),
+                ))
+            c.executemany('''
+                INSERT INTO snapshots (repo_id, run_id, listing, period, stars, star_change, contributor_count, rank)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(run_id, repo_id, listing, period) DO UPDATE SET
+                    stars = excluded.stars,
+                    star_change = excluded.star_change,
+                    contributor_count = COALESCE(excluded.contributor_count, contributor_count),
+                    rank = excluded.rank
+            ''', rows)
+            touched = {row[1] for row in rows}
+            c.executemany("UPDATE runs SET revision = revision + 1 WHERE id = ?", [(run_id,) for run_id in touched])
+            _refresh_rollups(c, touched)
+            c.execute("COMMIT")
+            written_runs.update(touched)
+        except BaseException:
+            c.execute("ROLLBACK")
+            # Id đã lưu đệm có thể thuộc về transaction vừa bị hủy
+            self._run_ids.clear()
+            self._repos.clear()
+            raise
+        return len(rows)
+
+    def _resolve_repos(self, c, batch):
+        # Thêm/cập nhật repos mới hoặc có thông tin thay đổi, rồi lấy id của các repo mới
+        pending = {}
+        repos = self._repos
+        for record in batch:
+            name = record['full_name']
+            get = record.get
+            cached = repos.get(name)
+            if (cached is None or cached[1] != get('description') or cached[2] != get('language')
+                    or cached[3] != get('link')):
+                pending[name] = (get('description'), get('language'), get('link'))
+        if not pending:
+            return
+
+        c.executemany('''
+            INSERT INTO repos (full_name, description, language, link) VALUES (?, ?, ?, ?)
+            ON CONFLICT(full_name) DO UPDATE SET
+                description = excluded.description,
+                language = excluded.language,
+                link = excluded.link
+        ''', [(name, *info) for name, info in pending.items()])
+
+        names = list(pending)
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            for repo_id, name in c.execute(f"SELECT id, full_name FROM repos WHERE full_name IN ({placeholders})", chunk):
+                self._repos[name] = (repo_id, *pending[name])
+
+    @staticmethod
+    def _get_run_id(c, run_key, scrape_date):
+        # Lấy id của lần thu thập theo run_key, tạo mới nếu chưa có.
+        # Lần chạy lại giữ nguyên scrape_date của lần chạy đầu tiên.
+        row = c.execute("SELECT id FROM runs WHERE run_key = ?", (run_key,)).fetchone()
+        if row:
+            return row[0]
+        c.execute("INSERT INTO runs (scrape_date, run_key) VALUES (?, ?)", (scrape_date, run_key))
+        return c.lastrowid
+
+_writers = {}
+
+def get_writer(db_path=None):
+    """
+    Lấy SnapshotWriter dùng chung trong tiến trình cho một file cơ sở dữ liệu
+
+    Kết nối và bộ đệm id được giữ lại giữa các lần gọi, phù hợp cho tiến trình
+    chạy lâu (ví dụ bộ lập lịch) ghi nhiều lần.
+    """
+    db_path = db_path or DB_PATH
+    writer = _writers.get(db_path)
+    if writer is None or writer.conn is None:
+        writer = _writers[db_path] = SnapshotWriter(db_path)
+    return writer
 
-def append_data_to_db(df):
+def append_data_to_db(df, run_key=None):
     """
     Thêm dữ liệu mới vào cơ sở dữ liệu
-    
+
     Tham số:
         df: DataFrame chứa thông tin các repository cần lưu
+        run_key: Mã lần thu thập; ghi lại cùng run_key sẽ cập nhật thay vì nhân đôi dữ liệu
     """
-    conn = sqlite3.connect(DB_PATH)
-    df.to_sql('repositories', conn, if_exists='append', index=False)
-    conn.close()
+    if df.empty:
+        return
+    get_writer().write(df.to_dict('records'), run_key=run_key, complete=True)
 
-def get_data_from_db(days=7):
+def _snapshot_filters(start_date=None, end_date=None, languages=None, language_column="COALESCE(r.language, '')"):
+    # Dựng điều kiện WHERE có tham số cho khoảng ngày (theo runs.scrape_date,
+    # đi qua idx_runs_scrape_date) và danh sách ngôn ngữ; ngày kết thúc được tính trọn ngày
+    clauses, params = [], []
+    if start_date:
+        clauses.append("ru.scrape_date >= ?")
+        params.append(str(start_date))
+    if end_date:
+        clauses.append("ru.scrape_date < date(?, '+1 day')")
+        params.append(str(end_date))
+    if languages:
+        clauses.append(f"{language_column} IN ({','.join('?' * len(languages))})")
+        params.extend(languages)
+    return ' AND '.join(clauses) or '1', params
+
+def get_data_from_db(days=7, languages=None):
     """
     Lấy dữ liệu từ cơ sở dữ liệu trong khoảng thời gian chỉ định
-    
+
     Tham số:
         days: Số ngày cần lấy dữ liệu (mặc định: 7 ngày)
-    
+        languages: Chỉ lấy các ngôn ngữ này ('' là không xác định) (mặc định: tất cả)
+
     Trả về:
         DataFrame chứa thông tin các repository
     """
+    import pandas as pd
+
     conn = sqlite3.connect(DB_PATH)
     cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
-    
-    query = f"SELECT * FROM repositories WHERE scrape_date >= '{cutoff_date}'"
-    df = pd.read_sql_query(query, conn)
+    where, params = _snapshot_filters(start_date=cutoff_date, languages=languages)
+
+    query = f"SELECT {SNAPSHOT_COLUMNS} {SNAPSHOTS_BY_RUN} WHERE {where} ORDER BY s.id"
+    df = pd.read_sql_query(query, conn, params=params)
     conn.close()
-    
+
     return df
 
+def get_latest_snapshots(conn, start_date=None, end_date=None, languages=None):
+    """
+    Lấy snapshot mới nhất của mỗi repository trong khoảng ngày và ngôn ngữ chỉ định
+
+    Tham số:
+        conn: Kết nối SQLite đang mở
+        start_date, end_date: Khoảng ngày thu thập "YYYY-MM-DD", tính cả hai đầu (mặc định: không giới hạn)
+        languages: Danh sách ngôn ngữ, '' là không xác định (mặc định: tất cả)
+
+    Trả về:
+        DataFrame cùng các cột với get_data_from_db, mỗi repository một dòng
+    """
+    import pandas as pd
+
+    where, params = _snapshot_filters(start_date, end_date, languages)
+    query = f'''
+        SELECT {SNAPSHOT_COLUMNS}
+        FROM snapshots s
+        CROSS JOIN runs ru ON ru.id = s.run_id
+        CROSS JOIN repos r ON r.id = s.repo_id
+        WHERE s.id IN (SELECT MAX(s.id) {SNAPSHOTS_BY_RUN} WHERE {where} GROUP BY s.repo_id)
+        ORDER BY s.id
+    '''
+    return pd.read_sql_query(query, conn, params=params)
+
+def get_run_revisions(conn):
+    """
+    Lấy số phiên bản dữ liệu của mọi lần chạy
+
+    revision tăng mỗi khi snapshots của lần chạy được ghi (kể cả ghi đè cùng
+    run_key) hoặc được gộp bởi retention, nên người giữ bản sao dữ liệu (file
+    đã xuất, cache của dashboard) biết lần chạy nào cần đọc lại.
+
+    Trả về:
+        dict run_id -> revision
+    """
+    return dict(conn.execute("SELECT id, revision FROM runs"))
+
+def get_snapshots_since(conn, last_id=0, run_ids=()):
+    """
+    Lấy các dòng snapshot mới kể từ một mốc đã đọc (dùng cho việc tải tăng dần)
+
+    Nên gọi trong một transaction đọc (cùng get_run_revisions) để các truy vấn
+    thấy cùng một trạng thái của cơ sở dữ liệu.
+
+    Tham số:
+        conn: Kết nối SQLite đang mở
+        last_id: id snapshot lớn nhất đã đọc; chỉ lấy các dòng có id lớn hơn
+        run_ids: Các lần chạy cần đọc lại toàn bộ vì đã được ghi lại sau lần
+                 đọc trước (revision đã đổi, xem get_run_revisions)
+
+    Trả về:
+        DataFrame cùng các cột với get_data_from_db, sắp xếp theo id
+    """
+    import pandas as pd
+
+    # Dòng mới đi theo khoảng rowid của snapshots, lần chạy cần đọc lại đi theo
+    # idx_snapshots_run_repo; cả hai đều không quét lại toàn bộ lịch sử
+    frames = [pd.read_sql_query(f'''
+        SELECT {SNAPSHOT_COLUMNS}
+        FROM snapshots s
+        CROSS JOIN runs ru ON ru.id = s.run_id
+        CROSS JOIN repos r ON r.id = s.repo_id
+        WHERE s.id > ?
+        ORDER BY s.id
+    ''', conn, params=(last_id,))]
+    run_ids = list(run_ids)
+    for start in range(0, len(run_ids), 500):
+        chunk = run_ids[start:start + 500]
+        frames.append(pd.read_sql_query(f'''
+            SELECT {SNAPSHOT_COLUMNS} {SNAPSHOTS_BY_RUN}
+            WHERE ru.id IN ({','.join('?' * len(chunk))}) AND s.id <= ?
+        ''', conn, params=(*chunk, last_id)))
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True).sort_values('id', ignore_index=True)
+
+def get_star_history(conn, full_names=None, start_date=None, end_date=None, languages=None):
+    """
+    Lấy chuỗi thời gian số star của từng repository
+
+    Mỗi (repository, lần chạy) một dòng; repository xuất hiện ở nhiều trang
+    trending trong cùng lần chạy được gộp (stars, star_change lớn nhất, rank
+    tốt nhất).
+
+    Tham số:
+        conn: Kết nối SQLite đang mở
+        full_names: Tên một hoặc nhiều repository (mặc định: tất cả)
+        start_date, end_date, languages: Bộ lọc như get_latest_snapshots
+
+    Trả về:
+        DataFrame có index (full_name, scrape_date) đã sắp xếp, gồm các cột
+        stars, star_change, rank; ví dụ history.loc['owner/repo', 'stars']
+    """
+    import pandas as pd
+
+    where, params = _snapshot_filters(start_date, end_date, languages)
+    if isinstance(full_names, str):
+        full_names = [full_names]
+    if full_names:
+        where += f" AND r.full_name IN ({','.join('?' * len(full_names))})"
+        params = params + list(full_names)
+    query = f'''
+        SELECT r.full_name, ru.scrape_date, MAX(s.stars) AS stars,
+               MAX(s.star_change) AS star_change, MIN(s.rank) AS rank
+        {SNAPSHOTS_BY_RUN}
+        WHERE {where} AND ru.scrape_date IS NOT NULL
+        GROUP BY s.repo_id, s.run_id
+    '''
+    df = pd.read_sql_query(query, conn, params=params)
+    df['scrape_date'] = pd.to_datetime(df['scrape_date'])
+    return df.set_index(['full_name', 'scrape_date']).sort_index()
+
+def get_star_history_arrays(conn, start_date=None, end_date=None, languages=None, repo_ids=None):
+    """
+    Lấy lịch sử số star của mọi repository dưới dạng mảng NumPy liền nhau
+
+    Các mẫu được sắp theo (repo_id, thời điểm); mẫu của repository thứ i nằm
+    trong khoảng offsets[i]:offsets[i + 1]. Mỗi (repository, lần chạy) một mẫu,
+    các dòng có stars NULL bị bỏ qua. Dùng cho star_metrics.
+
+    Tham số:
+        conn: Kết nối SQLite đang mở
+        start_date, end_date, languages: Bộ lọc như get_latest_snapshots
+        repo_ids: Chỉ lấy các repository này (mặc định: tất cả)
+
+    Trả về:
+        dict gồm repo_ids (int64, tăng dần), offsets (int64, dài hơn repo_ids
+        một phần tử), timestamps (int64, giây, theo giờ ghi trong scrape_date)
+        và stars (int64)
+    """
+    import numpy as np
+    import pandas as pd
+
+    date_where, date_params = _snapshot_filters(start_date, end_date)
+    runs = conn.execute(
+        f"SELECT ru.id, ru.scrape_date FROM runs ru WHERE {date_where} AND ru.scrape_date IS NOT NULL",
+        date_params
+    ).fetchall()
+    empty = np.empty(0, dtype=np.int64)
+    if not runs:
+        return {'repo_ids': empty, 'offsets': np.zeros(1, dtype=np.int64), 'timestamps': empty, 'stars': empty}
+
+    # Bảng tra run_id -> thời điểm (giây); runs ít dòng nên chuyển đổi ngày tháng một lần ở đây
+    run_ids = np.array([row[0] for row in runs], dtype=np.int64)
+    run_seconds = pd.to_datetime([row[1] for row in runs]).values.astype('datetime64[s]').astype(np.int64)
+    run_lookup = np.full(run_ids.max() + 1, -1, dtype=np.int64)
+    run_lookup[run_ids] = run_seconds
+
+    clauses, params = ["s.stars IS NOT NULL"], []
+    if start_date or end_date:
+        clauses.append(f"s.run_id IN (SELECT ru.id FROM runs ru WHERE {date_where})")
+        params.extend(date_params)
+    if languages:
+        clauses.append(f"s.repo_id IN (SELECT id FROM repos WHERE COALESCE(language, '') "
+                       f"IN ({','.join('?' * len(languages))}))")
+        params.extend(languages)
+    if repo_ids is not None:
+        clauses.append(f"s.repo_id IN ({','.join('?' * len(repo_ids))})")
+        params.extend(int(repo_id) for repo_id in repo_ids)
+    # GROUP BY đi theo idx_snapshots_repo nên kết quả đã theo thứ tự (repo_id, run_id)
+    rows = conn.execute(f'''
+        SELECT s.repo_id, s.run_id, MAX(s.stars) FROM snapshots s
+        WHERE {' AND '.join(clauses)}
+        GROUP BY s.repo_id, s.run_id
+    ''', params).fetchall()
+    data = np.array(rows, dtype=np.int64).reshape(-1, 3)
+    repos, timestamps, stars = data[:, 0], run_lookup[np.minimum(data[:, 1], len(run_lookup) - 1)], data[:, 2]
+    keep = (data[:, 1] < len(run_lookup)) & (timestamps >= 0)
+    if not keep.all():
+        repos, timestamps, stars = repos[keep], timestamps[keep], stars[keep]
+
+    # run_id thường tăng theo thời gian; chỉ sắp lại khi có lần chạy được ghi lùi ngày
+    if np.any((repos[1:] == repos[:-1]) & (timestamps[1:] < timestamps[:-1])):
+        order = np.lexsort((timestamps, repos))
+        repos, timestamps, stars = repos[order], timestamps[order], stars[order]
+
+    starts = np.flatnonzero(np.concatenate(([True], repos[1:] != repos[:-1]))) if len(repos) else empty
+    return {
+        'repo_ids': repos[starts],
+        'offsets': np.append(starts, len(repos)).astype(np.int64),
+        'timestamps': timestamps,
+        'stars': stars,
+    }
+
+def get_languages(conn):
+    """
+    Lấy danh sách ngôn ngữ đã xuất hiện, phổ biến nhất trước ('' là không xác định)
+    """
+    return [row[0] for row in conn.execute("SELECT language FROM language_stats ORDER BY repo_count DESC")]
+
+# Các dòng của run_language_stats thỏa bộ lọc, duyệt runs trước theo idx_runs_scrape_date
+_FILTERED_ROLLUPS = '''
+    SELECT ru.scrape_date, st.language, st.repo_count, st.star_change_sum, st.contributor_sum,
+           st.contributor_rows
+    FROM runs ru
+    CROSS JOIN run_language_stats st ON st.run_id = ru.id
+    WHERE {where}
+'''
+
+def get_language_trend(conn, top_n=10, start_date=None, end_date=None, languages=None):
+    """
+    Lấy số repository theo (thời điểm thu thập, ngôn ngữ) từ bảng tổng hợp
+
+    Tham số:
+        conn: Kết nối SQLite đang mở
+        top_n: Số ngôn ngữ có nhiều lượt xuất hiện nhất (trong phạm vi lọc) cần lấy
+        start_date, end_date, languages: Bộ lọc như get_latest_snapshots
+
+    Trả về:
+        DataFrame gồm các cột scrape_date, language, count
+    """
+    import pandas as pd
+
+    where, params = _snapshot_filters(start_date, end_date, languages, language_column='st.language')
+    query = f'''
+        WITH filtered AS ({_FILTERED_ROLLUPS.format(where=where)})
+        SELECT scrape_date, language, SUM(repo_count) AS count
+        FROM filtered
+        WHERE language IN (
+            SELECT language FROM filtered GROUP BY language ORDER BY SUM(repo_count) DESC LIMIT ?
+        )
+        GROUP BY scrape_date, language
+        ORDER BY scrape_date, language
+    '''
+    return pd.read_sql_query(query, conn, params=params + [top_n])
+
+def get_language_star_change(conn, top_n=10, start_date=None, end_date=None, languages=None):
+    """
+    Lấy trung bình thay đổi star theo ngôn ngữ từ bảng tổng hợp
+
+    Tham số:
+        conn: Kết nối SQLite đang mở
+        top_n: Số ngôn ngữ có trung bình cao nhất cần lấy
+        start_date, end_date, languages: Bộ lọc như get_latest_snapshots
+
+    Trả về:
+        DataFrame gồm các cột language, avg_stars
+    """
+    import pandas as pd
+
+    if not (start_date or end_date or languages):
+        # Không lọc: đọc thẳng tổng tích lũy theo ngôn ngữ
+        query = '''
+            SELECT language, CAST(star_change_sum AS REAL) / repo_count AS avg_stars
+            FROM language_stats
+            ORDER BY avg_stars DESC
+            LIMIT ?
+        '''
+        return pd.read_sql_query(query, conn, params=(top_n,))
+
+    where, params = _snapshot_filters(start_date, end_date, languages, language_column='st.language')
+    query = f'''
+        SELECT language, CAST(SUM(star_change_sum) AS REAL) / SUM(repo_count) AS avg_stars
+        FROM ({_FILTERED_ROLLUPS.format(where=where)})
+        GROUP BY language
+        ORDER BY avg_stars DESC
+        LIMIT ?
+    '''
+    return pd.read_sql_query(query, conn, params=params + [top_n])
+
+def get_summary_stats(conn, start_date=None, end_date=None, languages=None):
+    """
+    Lấy các số liệu tổng quan từ bảng tổng hợp
+
+    Tham số:
+        conn: Kết nối SQLite đang mở
+        start_date, end_date, languages: Bộ lọc như get_latest_snapshots (mặc định: toàn bộ lịch sử)
+
+    Trả về:
+        dict gồm total_rows, total_star_change, avg_contributors (chỉ tính các dòng lấy được
+        số người đóng góp), unique_languages
+    """
+    if not (start_date or end_date or languages):
+        total_rows, total_star_change, contributor_sum, contributor_rows = conn.execute('''
+            SELECT COALESCE(SUM(repo_count), 0), COALESCE(SUM(star_change_sum), 0), COALESCE(SUM(contributor_sum), 0),
+                   COALESCE(SUM(contributor_rows), 0)
+            FROM run_stats
+        ''').fetchone()
+        unique_languages = conn.execute("SELECT COUNT(*) FROM language_stats").fetchone()[0]
+    else:
+        where, params = _snapshot_filters(start_date, end_date, languages, language_column='st.language')
+        total_rows, total_star_change, contributor_sum, contributor_rows, unique_languages = conn.execute(f'''
+            SELECT COALESCE(SUM(repo_count), 0), COALESCE(SUM(star_change_sum), 0),
+                   COALESCE(SUM(contributor_sum), 0), COALESCE(SUM(contributor_rows), 0), COUNT(DISTINCT language)
+            FROM ({_FILTERED_ROLLUPS.format(where=where)})
+        ''', params).fetchone()
+    return {
+        'total_rows': total_rows,
+        'total_star_change': total_star_change,
+        'avg_contributors': contributor_sum / contributor_rows if contributor_rows else 0.0,
+        'unique_languages': unique_languages,
+    }
+
+def get_latest_complete_runs(conn, n=2):
+    """
+    Lấy các lần chạy đã hoàn tất gần nhất (completed_at khác NULL, có dữ liệu)
+
+    Lần chạy đang ghi dở hoặc bị dừng giữa chừng không bao giờ được trả về.
+
+    Tham số:
+        conn: Kết nối SQLite đang mở
+        n: Số lần chạy cần lấy
+
+    Trả về:
+        Danh sách run_id, mới nhất trước
+    """
+    return [row[0] for row in conn.execute('''
+        SELECT ru.id FROM runs ru
+        WHERE ru.completed_at IS NOT NULL
+          AND EXISTS (SELECT 1 FROM run_stats st WHERE st.run_id = ru.id AND st.repo_count > 0)
+        ORDER BY ru.scrape_date DESC, ru.id DESC
+        LIMIT ?
+    ''', (n,))]
+
+def run_needs_notification(conn, run_id):
+    """
+    Kiểm tra một lần chạy đã hoàn tất có thay đổi chưa được thông báo hay không
+
+    Lần chạy được ghi lại (cùng run_key) sau lần thông báo trước có completed_at
+    mới hơn notified_at nên được thông báo lại.
+    """
+    row = conn.execute("SELECT completed_at, notified_at FROM runs WHERE id = ?", (run_id,)).fetchone()
+    return row is not None and (row[1] is None or row[1] < row[0])
+
+def mark_run_notified(conn, run_id):
+    """
+    Ghi nhận lần chạy đã được notifier xử lý (dù có thay đổi cần gửi hay không)
+    """
+    conn.execute("UPDATE runs SET notified_at = completed_at WHERE id = ?", (run_id,))
+
+def get_run_anomalies(conn, run_id, min_z=ANOMALY_Z_THRESHOLD):
+    """
+    Lấy các repository có star_change bất thường trong một lần chạy
+
+    Các bất thường được tính khi lần chạy hoàn tất (xem SnapshotWriter.write),
+    nên hàm này chỉ đọc các dòng đã đánh dấu của lần chạy đó.
+
+    Tham số:
+        conn: Kết nối SQLite đang mở
+        run_id: Lần chạy cần lấy
+        min_z: z-score tối thiểu (không nhỏ hơn ANOMALY_Z_THRESHOLD lúc ghi)
+
+    Trả về:
+        DataFrame gồm full_name, language, star_change, expected, z_score,
+        baseline ('repo' hoặc 'language'), z-score cao nhất trước
+    """
+    import pandas as pd
+
+    return pd.read_sql_query('''
+        SELECT r.full_name, COALESCE(r.language, '') AS language, a.star_change, a.expected,
+               a.z_score, a.baseline
+        FROM star_anomalies a
+        CROSS JOIN repos r ON r.id = a.repo_id
+        WHERE a.run_id = ? AND a.z_score >= ?
+        ORDER BY a.z_score DESC
+    ''', conn, params=(run_id, min_z))
+
+# Bảng tạm cho get_run_diff: các dòng của hai lần chạy, chỉ gồm các trang
+# (listing, period) có trong cả hai lần chạy, và tổng hợp theo repository;
+# khóa chính đóng vai trò chỉ mục cho các phép so sánh tập hợp
+_RUN_DIFF_TABLES = (
+    '''
+    CREATE TEMP TABLE diff_rows (
+        run_id INTEGER, repo_id INTEGER, listing TEXT, period TEXT,
+        stars INTEGER, star_change INTEGER, rank INTEGER,
+        PRIMARY KEY (run_id, repo_id, listing, period)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    INSERT INTO diff_rows
+    SELECT s.run_id, s.repo_id, s.listing, s.period, s.stars, s.star_change, {rank}
+    FROM snapshots s
+    WHERE s.run_id IN (:previous, :current)
+      AND (s.listing, s.period) IN (
+          SELECT listing, period FROM snapshots WHERE run_id = :previous
+          INTERSECT
+          SELECT listing, period FROM snapshots WHERE run_id = :current
+      )
+    ''',
+    '''
+    CREATE TEMP TABLE diff_repos (
+        run_id INTEGER, repo_id INTEGER, stars INTEGER, star_change INTEGER,
+        PRIMARY KEY (run_id, repo_id)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    INSERT INTO diff_repos
+    SELECT run_id, repo_id, MAX(stars), MAX(CASE WHEN period = 'daily' THEN star_change END)
+    FROM diff_rows GROUP BY run_id, repo_id
+    ''',
+)
+
+def get_run_diff(conn, previous_run_id, current_run_id, rank_threshold=5, shift_threshold=0.05):
+    """
+    So sánh hai lần chạy như hai tập hợp repository (khóa full_name)
+
+    Hai lần chạy được chép vào bảng tạm (đọc theo idx_snapshots_run_repo) rồi
+    các phép so sánh tập hợp chạy hoàn toàn trong SQLite; chỉ các dòng thực sự
+    thay đổi được trả về, nên không phải đọc toàn bộ hai lần chạy ra Python. Chỉ các trang (listing, period) có
+    trong cả hai lần chạy được so sánh, để việc thêm/bớt trang giữa hai lần chạy
+    không bị coi là repository mới hoặc rời trending. Thứ hạng lấy từ
+    snapshots.rank; dữ liệu cũ chưa có thứ hạng được xếp theo thứ tự ghi.
+
+    Tham số:
+        conn: Kết nối SQLite đang mở
+        previous_run_id, current_run_id: Lần chạy trước và lần chạy sau
+        rank_threshold: Số bậc thay đổi tối thiểu trong cùng một trang
+        shift_threshold: Thay đổi tỷ trọng tối thiểu của một ngôn ngữ (0.05 = 5 điểm phần trăm)
+
+    Trả về:
+        dict gồm các DataFrame:
+            entrants, dropouts: full_name, language, stars, star_change
+            rank_moves: full_name, listing, period, previous_rank, rank, rank_delta (dương là tăng hạng)
+            language_shifts: language, previous_share, share, shift (kể cả ngôn ngữ mới, previous_share = 0)
+    """
+    params = {'previous': previous_run_id, 'current': current_run_id}
+    legacy = conn.execute(
+        "SELECT 1 FROM snapshots WHERE run_id IN (:previous, :current) AND rank IS NULL LIMIT 1", params
+    ).fetchone()
+    # Chỉ dùng hàm cửa sổ (cần sắp xếp toàn bộ hai lần chạy) khi có dòng chưa có thứ hạng
+    rank = ("COALESCE(s.rank, ROW_NUMBER() OVER (PARTITION BY s.run_id, s.listing, s.period ORDER BY s.id))"
+            if legacy else "s.rank")
+    conn.execute("DROP TABLE IF EXISTS temp.diff_rows")
+    conn.execute("DROP TABLE IF EXISTS temp.diff_repos")
+    try:
+        for statement in _RUN_DIFF_TABLES:
+            conn.execute(statement.format(rank=rank), params)
+        return _run_diff_results(conn, params, rank_threshold, shift_threshold)
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.diff_rows")
+        conn.execute("DROP TABLE IF EXISTS temp.diff_repos")
+
+def _run_diff_results(conn, params, rank_threshold, shift_threshold):
+    import pandas as pd
+
+    # Các truy vấn kết quả của get_run_diff trên hai bảng tạm diff_rows, diff_repos
+    def query(sql, **extra):
+        return pd.read_sql_query(sql, conn, params={**params, **extra})
+
+    entrants = query('''
+        SELECT r.full_name, COALESCE(r.language, '') AS language, c.stars, c.star_change
+        FROM diff_repos c CROSS JOIN repos r ON r.id = c.repo_id
+        WHERE c.run_id = :current
+          AND NOT EXISTS (SELECT 1 FROM diff_repos p WHERE p.run_id = :previous AND p.repo_id = c.repo_id)
+        ORDER BY c.star_change DESC, c.stars DESC
+    ''')
+    dropouts = query('''
+        SELECT r.full_name, COALESCE(r.language, '') AS language, p.stars, p.star_change
+        FROM diff_repos p CROSS JOIN repos r ON r.id = p.repo_id
+        WHERE p.run_id = :previous
+          AND NOT EXISTS (SELECT 1 FROM diff_repos c WHERE c.run_id = :current AND c.repo_id = p.repo_id)
+        ORDER BY p.stars DESC
+    ''')
+    rank_moves = query('''
+        SELECT r.full_name, c.listing, c.period, p.rank AS previous_rank, c.rank,
+               p.rank - c.rank AS rank_delta
+        FROM diff_rows c
+        CROSS JOIN diff_rows p ON p.run_id = :previous AND p.repo_id = c.repo_id
+                              AND p.listing = c.listing AND p.period = c.period
+        CROSS JOIN repos r ON r.id = c.repo_id
+        WHERE c.run_id = :current AND ABS(p.rank - c.rank) >= :threshold
+        ORDER BY ABS(p.rank - c.rank) DESC, c.rank
+    ''', threshold=rank_threshold)
+    mix = query('''
+        SELECT COALESCE(r.language, '') AS language,
+               SUM(t.run_id = :previous) AS previous_count, SUM(t.run_id = :current) AS count
+        FROM diff_repos t
+        CROSS JOIN repos r ON r.id = t.repo_id
+        GROUP BY 1
+    ''')
+
+    # Tỷ trọng ngôn ngữ trong mỗi lần chạy (số ngôn ngữ nhỏ nên tính bằng pandas)
+    mix['previous_share'] = mix['previous_count'] / max(mix['previous_count'].sum(), 1)
+    mix['share'] = mix['count'] / max(mix['count'].sum(), 1)
+    mix['shift'] = mix['share'] - mix['previous_share']
+    language_shifts = (mix[(mix['shift'].abs() >= shift_threshold)
+                           | ((mix['previous_count'] == 0) & (mix['count'] > 0))]
+                       .sort_values('shift', ascending=False)
+                       [['language', 'previous_share', 'share', 'shift']]
+                       .reset_index(drop=True))
+
+    return {
+        'entrants': entrants,
+        'dropouts': dropouts,
+        'rank_moves': rank_moves,
+        'language_shifts': language_shifts,
+    }
+
 def get_latest_data():
     """
     Lấy dữ liệu mới nhất từ cơ sở dữ liệu
-    
+
+    Chỉ lần chạy đã hoàn tất được xét (xem get_latest_complete_runs), nên
+    lần chạy đang ghi dở không bao giờ trả về một phần dữ liệu.
+
     Trả về:
-        DataFrame chứa thông tin các repository của lần cập nhật gần nhất
+        DataFrame chứa thông tin các repository của lần cập nhật hoàn tất gần
+        nhất (rỗng nếu chưa có lần chạy nào hoàn tất)
     """
+    import pandas as pd
+
     conn = sqlite3.connect(DB_PATH)
-    query = "SELECT * FROM repositories WHERE scrape_date = (SELECT MAX(scrape_date) FROM repositories)"
-    df = pd.read_sql_query(query, conn)
+    run_ids = get_latest_complete_runs(conn, 1)
+    query = f'''
+        SELECT {SNAPSHOT_COLUMNS} {SNAPSHOTS_BY_RUN}
+        WHERE ru.id = ?
+        ORDER BY s.id
+    '''
+    df = pd.read_sql_query(query, conn, params=(run_ids[0] if run_ids else None,))
     conn.close()
-    
+
     return df
+
+if __name__ == '__main__':
+    # Chạy trực tiếp để tạo cơ sở dữ liệu hoặc chuyển cơ sở dữ liệu cũ sang lược đồ mới
+    init_db()
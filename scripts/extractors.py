@@ -0,0 +1,190 @@
+# scripts/extractors.py
+# Mô-đun trích xuất dữ liệu từ HTML của GitHub
+# Cung cấp nhiều backend có thể thay thế cho nhau: bs4 (bản tham chiếu) và lxml (nhanh)
+
+import html as html_lib
+import os
+import re
+import sys
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html
+except ImportError:  # lxml là phụ thuộc tùy chọn
+    lxml = None
+
+# Thư mục chứa các trang HTML mẫu dùng để kiểm tra các backend
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'fixtures')
+
+class Bs4Extractor:
+    """
+    Backend tham chiếu: dựng toàn bộ cây BeautifulSoup bằng html.parser
+    """
+
+    name = 'bs4'
+
+    def trending_rows(self, html):
+        """
+        Trích xuất các trường thô của từng repository trên trang trending
+
+        Trả về:
+            Danh sách dict gồm full_name, description, language, raw_stars, raw_star_change
+        """
+        soup = BeautifulSoup(html, "html.parser")
+        rows = []
+        for repo in soup.find_all("article", class_="Box-row"):
+            full_name_tag = repo.find("h2", class_="h3")
+            if full_name_tag is None:
+                continue
+            desc_tag = repo.find("p", class_="col-9")
+            lang_tag = repo.find("span", itemprop="programmingLanguage")
+            star_tag = repo.find("a", href=lambda href: href and href.endswith("/stargazers"))
+            star_change_tag = repo.find("span", class_="d-inline-block float-sm-right")
+            rows.append({
+                'full_name': full_name_tag.get_text(strip=True),
+                'description': desc_tag.get_text(strip=True) if desc_tag else "",
+                'language': lang_tag.get_text(strip=True) if lang_tag else "",
+                'raw_stars': star_tag.get_text(strip=True) if star_tag else "0",
+                'raw_star_change': star_change_tag.get_text(strip=True) if star_change_tag else "0",
+            })
+        return rows
+
+    def contributor_counter(self, html):
+        """
+        Lấy nội dung thẻ span.Counter đầu tiên trên trang contributors
+
+        Trả về:
+            Chuỗi nội dung của thẻ, hoặc None nếu không tìm thấy
+        """
+        soup = BeautifulSoup(html, "html.parser")
+        tag = soup.find("span", class_="Counter")
+        return tag.get_text(strip=True) if tag else None
+
+# Biểu thức XPath tương đương với các truy vấn class_ của BeautifulSoup
+def _has_class(name):
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+_ARTICLE_XPATH = f'//article[{_has_class("Box-row")}]'
+_NAME_XPATH = f'.//h2[{_has_class("h3")}]'
+_DESC_XPATH = f'.//p[{_has_class("col-9")}]'
+_LANG_XPATH = './/span[@itemprop="programmingLanguage"]'
+_STAR_CHANGE_XPATH = './/span[@class="d-inline-block float-sm-right"]'
+
+# Quét tuần tự các thẻ mở <span ...> trên trang contributors
+_SPAN_OPEN_RE = re.compile(r'<span\b([^>]*)>', re.IGNORECASE)
+_CLASS_ATTR_RE = re.compile(r'''\bclass\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))''', re.IGNORECASE)
+_TAG_RE = re.compile(r'<[^>]*>')
+_SPAN_CLOSE_RE = re.compile(r'</span\s*>', re.IGNORECASE)
+
+def _text(element):
+    # Tương đương get_text(strip=True) của BeautifulSoup
+    return ''.join(part.strip() for part in element.itertext())
+
+class LxmlExtractor:
+    """
+    Backend nhanh: trang trending được phân tích bằng lxml + XPath chỉ trên các
+    nút cần thiết; trang contributors được quét tuần tự và dừng ngay khi gặp
+    thẻ span.Counter đầu tiên, không dựng cây DOM.
+    """
+
+    name = 'lxml'
+
+    def trending_rows(self, html):
+        doc = lxml.html.document_fromstring(html)
+        rows = []
+        for repo in doc.xpath(_ARTICLE_XPATH):
+            name_tags = repo.xpath(_NAME_XPATH)
+            if not name_tags:
+                continue
+            desc_tags = repo.xpath(_DESC_XPATH)
+            lang_tags = repo.xpath(_LANG_XPATH)
+            star_tag = next(
+                (a for a in repo.iterdescendants('a') if (a.get('href') or '').endswith('/stargazers')),
+                None
+            )
+            star_change_tags = repo.xpath(_STAR_CHANGE_XPATH)
+            rows.append({
+                'full_name': _text(name_tags[0]),
+                'description': _text(desc_tags[0]) if desc_tags else "",
+                'language': _text(lang_tags[0]) if lang_tags else "",
+                'raw_stars': _text(star_tag) if star_tag is not None else "0",
+                'raw_star_change': _text(star_change_tags[0]) if star_change_tags else "0",
+            })
+        return rows
+
+    def contributor_counter(self, html):
+        for match in _SPAN_OPEN_RE.finditer(html):
+            class_match = _CLASS_ATTR_RE.search(match.group(1))
+            if not class_match:
+                continue
+            classes = next(group for group in class_match.groups() if group is not None)
+            if 'Counter' not in classes.split():
+                continue
+            close = _SPAN_CLOSE_RE.search(html, match.end())
+            inner = html[match.end():close.start() if close else len(html)]
+            return ''.join(html_lib.unescape(part).strip() for part in _TAG_RE.split(inner))
+        return None
+
+EXTRACTORS = {
+    'bs4': Bs4Extractor(),
+    'lxml': LxmlExtractor(),
+}
+
+def get_extractor(name=None):
+    """
+    Lấy backend trích xuất theo tên
+
+    Tham số:
+        name: "bs4" hoặc "lxml" (mặc định: biến môi trường SCRAPER_EXTRACTOR,
+              nếu không có thì dùng lxml khi đã cài đặt, ngược lại dùng bs4)
+
+    Trả về:
+        Đối tượng extractor tương ứng
+    """
+    name = name or os.getenv('SCRAPER_EXTRACTOR') or ('lxml' if lxml is not None else 'bs4')
+    if name not in EXTRACTORS:
+        raise ValueError(f"Backend trích xuất không hợp lệ: {name}")
+    if name == 'lxml' and lxml is None:
+        print("[CẢNH BÁO] Chưa cài đặt lxml, chuyển sang dùng backend bs4")
+        name = 'bs4'
+    return EXTRACTORS[name]
+
+def verify_extractors(fixtures_dir=FIXTURES_DIR, reference='bs4', candidates=None):
+    """
+    Kiểm tra các backend cho kết quả giống hệt backend tham chiếu trên các trang mẫu
+
+    Trang mẫu có tên bắt đầu bằng "trending" được so sánh bằng trending_rows,
+    các trang "contributors" được so sánh bằng contributor_counter (nội dung
+    thô của bộ đếm, trước khi chuyển thành số).
+
+    Trả về:
+        Danh sách các điểm khác biệt (rỗng nếu tất cả các backend tương đương)
+    """
+    candidates = candidates or [name for name in EXTRACTORS if name != reference]
+    mismatches = []
+    for file_name in sorted(os.listdir(fixtures_dir)):
+        if not file_name.endswith('.html'):
+            continue
+        with open(os.path.join(fixtures_dir, file_name), encoding='utf-8') as f:
+            html = f.read()
+        if file_name.startswith('trending'):
+            method = 'trending_rows'
+        elif file_name.startswith('contributors'):
+            method = 'contributor_counter'
+        else:
+            continue
+        expected = getattr(EXTRACTORS[reference], method)(html)
+        for name in candidates:
+            actual = getattr(get_extractor(name), method)(html)
+            if actual != expected:
+                mismatches.append(f"{file_name}: {name} khác {reference}\n  {reference}: {expected}\n  {name}: {actual}")
+    return mismatches
+
+if __name__ == '__main__':
+    mismatches = verify_extractors()
+    for mismatch in mismatches:
+        print(f"[LỖI] {mismatch}")
+    if mismatches:
+        sys.exit(1)
+    print("[INFO] Các backend trích xuất cho kết quả giống nhau trên tất cả trang mẫu")
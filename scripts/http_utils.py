@@ -0,0 +1,492 @@
+# Mô-đun chứa các tiện ích HTTP dùng chung cho scraper
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+import metrics_utils
+
+# Số kết nối tối đa được giữ lại trong pool cho mỗi host
+DEFAULT_POOL_SIZE = 16
+
+# Header mặc định gửi kèm mọi request
+DEFAULT_HEADERS = {
+    'User-Agent': 'github-trending-scraper (+https://github.com/PhamNhatKhanhs/github-trending-scraper)',
+    'Accept': 'text/html,application/xhtml+xml',
+}
+
+# Đường dẫn đến file cache phản hồi HTTP
+CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'db', 'http_cache.db')
+
+# Dung lượng tối đa của cache (byte), vượt quá sẽ xóa các mục ít dùng nhất
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Thời gian (giây) một trang được dùng lại mà không cần hỏi lại server, theo mẫu URL.
+# Mẫu đầu tiên khớp sẽ được dùng; 0 nghĩa là luôn gửi request có điều kiện.
+DEFAULT_CACHE_TTLS = [
+    (r'/contributors$', 6 * 3600),
+    (r'/trending', 0),
+]
+
+# Tốc độ gửi request tối đa mặc định (request/giây); None nghĩa là không giới hạn
+# tốc độ, chỉ điều chỉnh số request đồng thời
+DEFAULT_RATE = None
+
+# Số request được gửi dồn liên tiếp khi token bucket đầy
+DEFAULT_BURST = 5
+
+# Số lần thử lại một request bị giới hạn tốc độ hoặc gặp lỗi tạm thời
+DEFAULT_MAX_RETRIES = 3
+
+# Thời gian chờ (giây) trước lần thử lại thứ n: BACKOFF_BASE * 2^n, tối đa BACKOFF_MAX
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Mã trạng thái lỗi tạm thời phía server, được thử lại và làm giảm số request đồng thời
+RETRY_STATUSES = (500, 502, 503, 504)
+
+def create_session(pool_size=DEFAULT_POOL_SIZE, cache=None, offline=False, limiter=None):
+    """
+    Tạo một requests.Session dùng chung với connection pool đủ lớn
+
+    Mọi request ra mạng của session đi qua một RateLimiter dùng chung (xem
+    RateLimitedAdapter); phản hồi lấy từ cache không tốn lượt.
+
+    Tham số:
+        pool_size: Số kết nối tối đa giữ lại cho mỗi host, nên >= số luồng gọi song song
+        cache: ResponseCache dùng để lưu và kiểm tra lại phản hồi (mặc định: không dùng cache)
+        offline: Chỉ đọc từ cache, không gửi request nào ra mạng (cần có cache)
+        limiter: RateLimiter dùng chung (mặc định: không giới hạn tốc độ, tối đa
+                 pool_size request đồng thời)
+
+    Trả về:
+        requests.Session đã gắn RateLimitedAdapter với pool tương ứng, bộ giới hạn
+        được lưu ở thuộc tính rate_limiter
+    """
+    if cache is not None:
+        session = CachedSession(cache, offline=offline)
+    elif offline:
+        raise ValueError("Chế độ offline cần có cache")
+    else:
+        session = requests.Session()
+    if limiter is None:
+        limiter = RateLimiter(max_concurrency=pool_size)
+    session.rate_limiter = limiter
+    adapter = RateLimitedAdapter(limiter, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+class RateLimiter:
+    """
+    Bộ giới hạn tốc độ dùng chung cho mọi request của một session (an toàn đa luồng)
+
+    - Token bucket: trung bình tối đa rate request/giây, gửi dồn tối đa burst request
+    - AIMD: số request đồng thời và tốc độ tăng dần sau mỗi request thành công
+      (thêm khoảng 1 đơn vị mỗi vòng), giảm một nửa khi bị giới hạn tốc độ hoặc
+      gặp lỗi tạm thời, nên tự dừng ở mức cao nhất server chấp nhận; các phản hồi
+      lỗi của những request đã gửi trước lần giảm gần nhất không làm giảm thêm
+    - Khi server yêu cầu chờ (Retry-After, X-RateLimit-Reset), mọi luồng cùng tạm
+      dừng đến hết thời gian đó thay vì tiếp tục gửi và bị chặn lâu hơn
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, max_concurrency=DEFAULT_POOL_SIZE,
+                 min_rate=0.1):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.burst = max(1, burst)
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = float(self.max_concurrency)
+        self.stats = {'requests': 0, 'throttled': 0, 'errors': 0, 'retries': 0, 'paused_s': 0.0}
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """
+        Chờ đến khi được phép gửi thêm một request
+
+        Trả về:
+            Thời điểm được phép gửi, truyền lại cho release
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    self._cond.wait(self._paused_until - now)
+                elif self._in_flight >= int(self.concurrency):
+                    self._cond.wait()
+                elif self.rate is not None and self._tokens < 1:
+                    self._cond.wait((1 - self._tokens) / self.rate)
+                else:
+                    break
+            self._tokens -= 1
+            self._in_flight += 1
+            self.stats['requests'] += 1
+            return now
+
+    def release(self, ticket, outcome='ok', retry_after=None):
+        """
+        Trả lượt sau khi nhận phản hồi và điều chỉnh tốc độ theo kết quả
+
+        Tham số:
+            ticket: Giá trị acquire đã trả về cho request này
+            outcome: 'ok', 'throttled' (bị giới hạn tốc độ) hoặc 'error' (lỗi tạm thời)
+            retry_after: Số giây server yêu cầu chờ trước request tiếp theo
+        """
+        with self._cond:
+            self._in_flight -= 1
+            if outcome == 'ok':
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+                if self.rate is not None:
+                    self.rate = min(self.max_rate, self.rate + 1 / max(self.rate, 1.0))
+            else:
+                self.stats['throttled' if outcome == 'throttled' else 'errors'] += 1
+                if ticket > self._last_decrease:
+                    self._last_decrease = time.monotonic()
+                    self.concurrency = max(1.0, self.concurrency / 2)
+                    if self.rate is not None:
+                        self.rate = max(self.min_rate, self.rate / 2)
+            if retry_after:
+                now = time.monotonic()
+                until = now + retry_after
+                if until > self._paused_until:
+                    self.stats['paused_s'] += until - max(now, self._paused_until)
+                    self._paused_until = until
+                    # Bỏ số token dồn lại để không gửi cả loạt ngay khi hết tạm dừng
+                    self._tokens = 0.0
+                    self._updated = until
+            self._cond.notify_all()
+
+    def record_retry(self):
+        with self._cond:
+            self.stats['retries'] += 1
+
+    def snapshot(self):
+        """
+        Trả về thống kê kèm tốc độ và số request đồng thời hiện tại
+        """
+        with self._cond:
+            stats = dict(self.stats, concurrency=int(self.concurrency))
+            stats['paused_s'] = round(stats['paused_s'], 1)
+            if self.rate is not None:
+                stats['rate'] = round(self.rate, 2)
+            return stats
+
+    def _refill(self, now):
+        if self.rate is None or now <= self._updated:
+            return
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+def is_rate_limited(response):
+    """
+    Kiểm tra phản hồi có phải do bị giới hạn tốc độ hay không
+
+    Ngoài 429, GitHub trả 403 cho giới hạn tốc độ chính (X-RateLimit-Remaining: 0)
+    và giới hạn phụ (secondary rate limit, có Retry-After hoặc thông báo trong nội dung).
+    """
+    if response.status_code == 429:
+        return True
+    if response.status_code != 403:
+        return False
+    headers = response.headers
+    if 'Retry-After' in headers or headers.get('X-RateLimit-Remaining') == '0':
+        return True
+    return b'rate limit' in response.content[:4096].lower()
+
+def retry_after_seconds(response):
+    """
+    Số giây server yêu cầu chờ, theo Retry-After (số giây hoặc ngày giờ HTTP)
+    hoặc X-RateLimit-Reset (epoch) khi đã hết lượt
+
+    Trả về:
+        Số giây (>= 0) hoặc None nếu phản hồi không chỉ định
+    """
+    value = response.headers.get('Retry-After')
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    reset = response.headers.get('X-RateLimit-Reset')
+    if reset and response.headers.get('X-RateLimit-Remaining') == '0':
+        try:
+            return max(0.0, float(reset) - time.time())
+        except ValueError:
+            pass
+    return None
+
+def _backoff(attempt):
+    # Thời gian chờ tăng theo cấp số nhân, lệch ngẫu nhiên để các luồng không thử lại cùng lúc
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    HTTPAdapter gửi mọi request qua một RateLimiter
+
+    Phản hồi bị giới hạn tốc độ (429, 403 rate limit) tạm dừng toàn bộ session
+    theo Retry-After (hoặc backoff nếu không có) rồi được thử lại; lỗi tạm thời
+    (5xx, lỗi kết nối, timeout) được thử lại sau backoff. Sau max_retries lần
+    thử lại, phản hồi hoặc ngoại lệ cuối cùng được trả về cho người gọi.
+    """
+
+    def __init__(self, limiter, retries=DEFAULT_MAX_RETRIES, **kwargs):
+        super().__init__(**kwargs)
+        self.limiter = limiter
+        self.retries = retries
+
+    def send(self, request, **kwargs):
+        attempt = 0
+        while True:
+            ticket = self.limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = super().send(request, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                metrics_utils.record_http(time.perf_counter() - started, 'error')
+                self.limiter.release(ticket, 'error')
+                if attempt >= self.retries:
+                    raise
+                delay = _backoff(attempt)
+            else:
+                metrics_utils.record_http(time.perf_counter() - started, response.status_code)
+                if is_rate_limited(response):
+                    delay = retry_after_seconds(response)
+                    if delay is None:
+                        delay = _backoff(attempt)
+                    # Thời gian chờ được áp cho cả session qua bộ giới hạn
+                    self.limiter.release(ticket, 'throttled', retry_after=delay)
+                    delay = 0
+                elif response.status_code in RETRY_STATUSES:
+                    self.limiter.release(ticket, 'error')
+                    delay = _backoff(attempt)
+                else:
+                    self.limiter.release(ticket, 'ok')
+                    return response
+                if attempt >= self.retries:
+                    return response
+                response.close()
+            self.limiter.record_retry()
+            attempt += 1
+            if delay:
+                time.sleep(delay)
+
+class ResponseCache:
+    """
+    Cache phản hồi HTTP lưu trên đĩa (SQLite), khóa theo URL
+
+    Mỗi mục lưu nội dung cùng ETag/Last-Modified để kiểm tra lại bằng request
+    có điều kiện. Khi tổng dung lượng vượt max_bytes, các mục lâu không được
+    dùng nhất sẽ bị xóa (LRU).
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=DEFAULT_CACHE_MAX_BYTES, ttls=None):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in (ttls if ttls is not None else DEFAULT_CACHE_TTLS)]
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'stored': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+        # stats được cập nhật từ nhiều luồng (thu thập song song), khóa riêng để
+        # việc đếm không phải chờ các thao tác SQLite đang giữ _lock
+        self._stats_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                status_code INTEGER,
+                headers TEXT,
+                body BLOB,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL,
+                accessed_at REAL,
+                size INTEGER
+            )
+        ''')
+        # (accessed_at, url) cho thứ tự LRU xác định, đọc lần lượt theo chỉ mục
+        self._conn.execute('DROP INDEX IF EXISTS idx_responses_accessed')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_lru ON responses(accessed_at, url)')
+        self._conn.commit()
+        # Tổng dung lượng các mục, tính một lần khi mở rồi cập nhật theo từng lần
+        # ghi/xóa để put không phải quét cả bảng
+        self._total_bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def ttl_for(self, url):
+        """
+        Trả về TTL (giây) áp dụng cho URL theo mẫu đầu tiên khớp (mặc định: 0)
+        """
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return 0
+
+    def count(self, stat, value=1):
+        # Cộng value vào một mục của stats
+        with self._stats_lock:
+            self.stats[stat] += value
+
+    def snapshot(self):
+        """
+        Trả về bản sao của stats
+        """
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def get(self, url):
+        """
+        Lấy mục cache của URL và cập nhật thời điểm truy cập
+
+        Trả về:
+            dict chứa status_code, headers, body, etag, last_modified, fetched_at hoặc None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT status_code, headers, body, etag, last_modified, fetched_at FROM responses WHERE url = ?',
+                (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute('UPDATE responses SET accessed_at = ? WHERE url = ?', (time.time(), url))
+            self._conn.commit()
+        return {
+            'status_code': row[0],
+            'headers': json.loads(row[1]),
+            'body': row[2],
+            'etag': row[3],
+            'last_modified': row[4],
+            'fetched_at': row[5],
+        }
+
+    def put(self, url, response):
+        """
+        Lưu phản hồi thành công vào cache rồi dọn bớt nếu vượt dung lượng
+        """
+        body = response.content
+        now = time.time()
+        with self._lock:
+            previous = self._conn.execute('SELECT size FROM responses WHERE url = ?', (url,)).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, response.status_code, json.dumps(dict(response.headers)), body,
+                 response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                 now, now, len(body))
+            )
+            self._total_bytes += len(body) - (previous[0] if previous else 0)
+            self._evict()
+            self._conn.commit()
+        self.count('stored')
+
+    def touch(self, url):
+        """
+        Đánh dấu mục cache vừa được server xác nhận còn mới (phản hồi 304)
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute('UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE url = ?', (now, now, url))
+            self._conn.commit()
+
+    def _evict(self):
+        # Xóa các mục ít được dùng gần đây nhất cho đến khi dưới giới hạn dung lượng:
+        # đọc lần lượt theo chỉ mục LRU đến khi đủ dung lượng cần giải phóng, rồi
+        # xóa đúng số mục đó bằng một câu lệnh
+        if self._total_bytes <= self.max_bytes:
+            return
+        evicted = freed = 0
+        for (size,) in self._conn.execute('SELECT size FROM responses ORDER BY accessed_at, url'):
+            if self._total_bytes - freed <= self.max_bytes:
+                break
+            evicted += 1
+            freed += size
+        self._conn.execute(
+            'DELETE FROM responses WHERE url IN (SELECT url FROM responses ORDER BY accessed_at, url LIMIT ?)',
+            (evicted,)
+        )
+        self._total_bytes -= freed
+        self.count('evicted', evicted)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class CachedSession(requests.Session):
+    """
+    requests.Session dùng ResponseCache cho các request GET
+
+    - Mục còn trong TTL: trả về ngay từ cache, không gửi request
+    - Mục đã hết TTL: gửi request có điều kiện (If-None-Match/If-Modified-Since),
+      phản hồi 304 được phục vụ từ cache
+    - Chế độ offline: chỉ phục vụ từ cache, thiếu dữ liệu thì báo lỗi kết nối
+    """
+
+    def __init__(self, cache, offline=False):
+        super().__init__()
+        self.cache = cache
+        self.offline = offline
+
+    def get(self, url, **kwargs):
+        entry = self.cache.get(url)
+
+        if self.offline:
+            if entry is None:
+                self._count('misses', 'miss')
+                raise requests.ConnectionError(f"Không có dữ liệu cache cho {url} (chế độ offline)")
+            self._count('hits', 'hit')
+            return _build_response(url, entry)
+
+        if entry is not None and time.time() - entry['fetched_at'] < self.cache.ttl_for(url):
+            self._count('hits', 'hit')
+            return _build_response(url, entry)
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = super().get(url, headers=headers, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            self._count('revalidated', 'revalidated')
+            self.cache.touch(url)
+            return _build_response(url, entry)
+
+        self._count('misses', 'miss')
+        if response.status_code == 200:
+            self.cache.put(url, response)
+        return response
+
+    def _count(self, stat, result):
+        # Ghi nhận một lần tra cache vào stats của cache và số liệu của tiến trình
+        self.cache.count(stat)
+        metrics_utils.record_cache('http', result)
+
+def _build_response(url, entry):
+    # Dựng lại đối tượng requests.Response từ một mục cache
+    response = requests.Response()
+    response.url = url
+    response.status_code = entry['status_code']
+    response.headers = CaseInsensitiveDict(entry['headers'])
+    response._content = entry['body']
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers) or 'utf-8'
+    return response
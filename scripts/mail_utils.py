@@ -0,0 +1,396 @@
+# scripts/mail_utils.py
+# Mô-đun gửi email thông báo qua hàng đợi (bảng notification_outbox)
+# Thông báo được ghi vào hàng đợi trước; OutboxWorker lấy ra từng lô, gộp các
+# thông báo của cùng một người nhận thành một email và gửi cả lô trên cùng một
+# kết nối SMTP đã đăng nhập. Lần gửi lỗi được thử lại với thời gian chờ tăng dần.
+
+import os
+import random
+import smtplib
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from dotenv import load_dotenv
+from db_utils import get_connection, init_db
+
+load_dotenv()
+
+# Máy chủ SMTP mặc định (Gmail); có thể đổi bằng biến môi trường SMTP_HOST,
+# SMTP_PORT, SMTP_STARTTLS, ví dụ trỏ tới máy chủ thử nghiệm aiosmtpd cục bộ
+DEFAULT_SMTP_HOST = 'smtp.gmail.com'
+DEFAULT_SMTP_PORT = 587
+
+# Số người nhận (tức số email) tối đa được gửi trong một lô, trên cùng một kết nối
+DEFAULT_BATCH_SIZE = 200
+
+# Số lần gửi tối đa trước khi thông báo bị đánh dấu failed
+DEFAULT_MAX_ATTEMPTS = 6
+
+# Thời gian chờ (giây) trước lần thử lại đầu tiên, nhân đôi sau mỗi lần lỗi
+BASE_RETRY_DELAY = 60
+MAX_RETRY_DELAY = 6 * 3600
+
+# Thời gian (giây) một lô được giữ ở trạng thái sending; nếu tiến trình gửi bị
+# dừng giữa chừng, các thông báo chưa gửi xong được lấy ra gửi lại sau thời hạn này
+CLAIM_TIMEOUT = 600
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Lỗi của riêng một email (người nhận/nội dung bị từ chối); các lỗi khác được
+# coi là lỗi kết nối và làm dừng cả lô
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+# Mã trả lời SMTP khi chưa đăng nhập/đăng nhập sai (530 Authentication required,
+# 535 Authentication credentials invalid): lỗi cấu hình chứ không phải lỗi của
+# email, nên được xử lý như lỗi kết nối và thử lại đến khi cấu hình được sửa
+AUTH_ERROR_CODES = (530, 535)
+
+def smtp_config_error():
+    """
+    Kiểm tra cấu hình gửi email trong biến môi trường
+
+    SENDER_PASSWORD chỉ được bỏ trống khi SMTP_HOST được đặt rõ ràng (máy chủ
+    không cần đăng nhập, ví dụ aiosmtpd cục bộ); máy chủ mặc định (Gmail) từ
+    chối mọi email chưa đăng nhập.
+
+    Trả về:
+        Thông báo lỗi, hoặc None nếu cấu hình hợp lệ
+    """
+    if not os.getenv('SENDER_EMAIL'):
+        return "Thiếu SENDER_EMAIL"
+    if not os.getenv('SENDER_PASSWORD') and not os.getenv('SMTP_HOST'):
+        return f"Thiếu SENDER_PASSWORD để đăng nhập {DEFAULT_SMTP_HOST} (chỉ bỏ trống khi đặt SMTP_HOST)"
+    return None
+
+class SMTPTransport:
+    """
+    Kết nối SMTP dùng lại cho nhiều email
+
+    Kết nối (kèm STARTTLS và đăng nhập) chỉ được mở ở lần gửi đầu tiên và giữ
+    đến khi close; nếu server ngắt kết nối giữa chừng, kết nối được mở lại một lần.
+
+    Bất kỳ đối tượng nào có send(message) và close() đều dùng được thay cho
+    SMTPTransport trong OutboxWorker (ví dụ để ghi email ra file khi thử nghiệm).
+    """
+
+    def __init__(self, host=DEFAULT_SMTP_HOST, port=DEFAULT_SMTP_PORT, username=None, password=None,
+                 starttls=True, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        # Số lần đã mở kết nối, dùng để theo dõi chi phí kết nối
+        self.connections = 0
+        self._smtp = None
+
+    @classmethod
+    def from_env(cls):
+        """
+        Tạo transport từ biến môi trường SMTP_HOST, SMTP_PORT, SMTP_STARTTLS
+        (0 để tắt), SENDER_EMAIL và SENDER_PASSWORD (bỏ trống để không đăng nhập,
+        chỉ khi đặt SMTP_HOST)
+
+        Ngoại lệ:
+            ValueError: Cấu hình không hợp lệ (xem smtp_config_error)
+        """
+        error = smtp_config_error()
+        if error:
+            raise ValueError(error)
+        return cls(
+            host=os.getenv('SMTP_HOST', DEFAULT_SMTP_HOST),
+            port=int(os.getenv('SMTP_PORT', DEFAULT_SMTP_PORT)),
+            username=os.getenv('SENDER_EMAIL'),
+            password=os.getenv('SENDER_PASSWORD'),
+            starttls=os.getenv('SMTP_STARTTLS', '1') != '0',
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.password:
+                smtp.login(self.username, self.password)
+        except BaseException:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self.connections += 1
+
+    def send(self, message):
+        if self._smtp is None:
+            self._connect()
+        try:
+            self._smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            # Server đóng kết nối đang rảnh: mở lại và gửi lại một lần
+            self._smtp = None
+            self._connect()
+            self._smtp.send_message(message)
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self._smtp.close()
+            self._smtp = None
+
+def enqueue(conn, recipients, subject, body):
+    """
+    Ghi một thông báo vào hàng đợi, mỗi người nhận một dòng
+
+    Tham số:
+        conn: Kết nối SQLite đang mở
+        recipients: Danh sách địa chỉ email người nhận
+        subject: Tiêu đề email
+        body: Nội dung email (văn bản thuần)
+
+    Trả về:
+        Số dòng đã thêm vào hàng đợi
+    """
+    now = datetime.now().strftime(TIME_FORMAT)
+    rows = [(recipient, subject, body, now, now) for recipient in dict.fromkeys(recipients)]
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany('''
+            INSERT INTO notification_outbox (recipient, subject, body, created_at, next_attempt_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', rows)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return len(rows)
+
+def build_digest(sender, recipient, items):
+    """
+    Gộp các thông báo của một người nhận thành một email
+
+    Tham số:
+        sender: Địa chỉ người gửi
+        recipient: Địa chỉ người nhận
+        items: Danh sách (subject, body) theo thứ tự thêm vào hàng đợi
+
+    Trả về:
+        email.message.EmailMessage
+    """
+    message = EmailMessage()
+    message['From'] = sender
+    message['To'] = recipient
+    subject = items[-1][0]
+    if len(items) > 1:
+        subject = f"{subject} (+{len(items) - 1} thông báo khác)"
+    message['Subject'] = subject
+    separator = "\n\n" + "-" * 40 + "\n\n"
+    message.set_content(separator.join(
+        body if len(items) == 1 else f"{item_subject}\n\n{body}" for item_subject, body in items
+    ))
+    return message
+
+class OutboxWorker:
+    """
+    Gửi các thông báo đến hạn trong hàng đợi
+
+    Mỗi lô gồm tối đa batch_size người nhận và được gửi trên một kết nối của
+    transport; mọi thông báo đến hạn của cùng một người nhận được gộp thành một email. Email bị từ chối vĩnh viễn (lỗi 5xx của
+    riêng email đó) được đánh dấu failed ngay; các lỗi khác được thử lại sau
+    BASE_RETRY_DELAY * 2^(số lần đã thử) giây, tối đa max_attempts lần.
+
+    Ví dụ:
+        worker = OutboxWorker(conn, transport=SMTPTransport('localhost', 8025, starttls=False))
+        worker.run()
+    """
+
+    def __init__(self, conn, transport=None, sender=None, batch_size=DEFAULT_BATCH_SIZE,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=BASE_RETRY_DELAY, max_delay=MAX_RETRY_DELAY):
+        self.conn = conn
+        self.transport = transport
+        self.sender = sender or os.getenv('SENDER_EMAIL')
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = {'sent': 0, 'emails': 0, 'retried': 0, 'failed': 0, 'connection_errors': 0}
+
+    def run(self):
+        """
+        Gửi tất cả thông báo đang đến hạn, từng lô một; dừng sớm khi gặp lỗi kết
+        nối để không thử kết nối lại cho từng lô còn lại
+
+        Trả về:
+            dict thống kê: sent (số thông báo), emails (số email), retried, failed,
+            connection_errors
+        """
+        while self.run_once() == self.batch_size and not self.stats['connection_errors']:
+            pass
+        return self.stats
+
+    def run_once(self):
+        """
+        Lấy ra và gửi một lô thông báo đến hạn
+
+        Trả về:
+            Số người nhận (số email) trong lô
+        """
+        transport = self.transport
+        if transport is None:
+            # Kiểm tra cấu hình trước khi lấy thông báo ra khỏi hàng đợi
+            try:
+                transport = SMTPTransport.from_env()
+            except ValueError as e:
+                if self._has_due():
+                    print(f"[LỖI] Không thể gửi thông báo: {e}. Vui lòng kiểm tra file .env")
+                    self.stats['connection_errors'] += 1
+                return 0
+
+        claimed = self._claim()
+        if not claimed:
+            return 0
+
+        # Gộp theo người nhận, giữ thứ tự thêm vào hàng đợi
+        digests = {}
+        for row in claimed:
+            digests.setdefault(row[1], []).append(row)
+
+        pending = list(digests.items())
+        try:
+            while pending:
+                recipient, rows = pending[0]
+                message = build_digest(self.sender, recipient, [(row[2], row[3]) for row in rows])
+                try:
+                    transport.send(message)
+                except MESSAGE_ERRORS as e:
+                    if _is_auth_error(e):
+                        # Xử lý như lỗi kết nối bên dưới
+                        raise
+                    self._retry(rows, e, permanent=_is_permanent(e))
+                else:
+                    self._mark_sent(rows)
+                pending.pop(0)
+        except (smtplib.SMTPException, OSError) as e:
+            # Lỗi kết nối: dời cả phần còn lại của lô sang lần thử sau; lỗi đăng
+            # nhập không tính vào số lần thử tối đa để thông báo không bị bỏ
+            # trong khi chờ sửa cấu hình
+            print(f"[LỖI] Không thể gửi thông báo: {e}")
+            self.stats['connection_errors'] += 1
+            for _, rows in pending:
+                self._retry(rows, e, give_up=not _is_auth_error(e))
+        finally:
+            transport.close()
+        return len(digests)
+
+    def _has_due(self):
+        # Còn thông báo đến hạn gửi trong hàng đợi hay không
+        return self.conn.execute('''
+            SELECT 1 FROM notification_outbox
+            WHERE status IN ('pending', 'sending') AND next_attempt_at <= ? LIMIT 1
+        ''', (datetime.now().strftime(TIME_FORMAT),)).fetchone() is not None
+
+    def _claim(self):
+        # Lấy mọi thông báo đến hạn của tối đa batch_size người nhận (ai chờ lâu
+        # nhất trước) và đánh dấu sending trong một transaction để hai tiến trình
+        # gửi không lấy trùng; next_attempt_at được dời thêm CLAIM_TIMEOUT làm thời hạn giữ
+        now = datetime.now()
+        due = "status IN ('pending', 'sending') AND next_attempt_at <= :now"
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.conn.execute(f'''
+                SELECT id, recipient, subject, body, attempts FROM notification_outbox
+                WHERE {due} AND recipient IN (
+                    SELECT recipient FROM notification_outbox WHERE {due}
+                    GROUP BY recipient ORDER BY MIN(id) LIMIT :limit
+                )
+                ORDER BY id
+            ''', {'now': now.strftime(TIME_FORMAT), 'limit': self.batch_size}).fetchall()
+            lease = (now + timedelta(seconds=CLAIM_TIMEOUT)).strftime(TIME_FORMAT)
+            self.conn.executemany(
+                "UPDATE notification_outbox SET status = 'sending', next_attempt_at = ? WHERE id = ?",
+                [(lease, row[0]) for row in rows]
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def _mark_sent(self, rows):
+        self.conn.executemany(
+            "UPDATE notification_outbox SET status = 'sent', attempts = attempts + 1, sent_at = ? WHERE id = ?",
+            [(datetime.now().strftime(TIME_FORMAT), row[0]) for row in rows]
+        )
+        self.stats['sent'] += len(rows)
+        self.stats['emails'] += 1
+
+    def _retry(self, rows, error, permanent=False, give_up=True):
+        # Hẹn lần gửi tiếp theo, hoặc đánh dấu failed nếu lỗi vĩnh viễn/hết số lần
+        # thử (give_up=False: luôn thử lại)
+        now = datetime.now()
+        updates = []
+        for row_id, recipient, _, _, attempts in rows:
+            attempts += 1
+            if permanent or (give_up and attempts >= self.max_attempts):
+                status, next_attempt = 'failed', now
+                self.stats['failed'] += 1
+                print(f"[LỖI] Bỏ thông báo {row_id} gửi tới {recipient} sau {attempts} lần thử: {error}")
+            else:
+                # Thêm nhiễu ngẫu nhiên để các thông báo lỗi cùng lúc không thử lại cùng lúc
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1)) * random.uniform(1.0, 1.2)
+                status, next_attempt = 'pending', now + timedelta(seconds=delay)
+                self.stats['retried'] += 1
+            updates.append((status, attempts, next_attempt.strftime(TIME_FORMAT), str(error), row_id))
+        self.conn.executemany('''
+            UPDATE notification_outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?
+            WHERE id = ?
+        ''', updates)
+
+def _is_auth_error(error):
+    # Lỗi do chưa đăng nhập/đăng nhập sai, không phải do email bị từ chối
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return True
+    return isinstance(error, smtplib.SMTPSenderRefused) and error.smtp_code in AUTH_ERROR_CODES
+
+def _is_permanent(error):
+    # Mã lỗi 5xx: server đã từ chối hẳn email, gửi lại cũng không thành công
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(500 <= code < 600 for code, _ in error.recipients.values())
+    return 500 <= getattr(error, 'smtp_code', 0) < 600
+
+def deliver_pending(conn=None, transport=None):
+    """
+    Gửi tất cả thông báo đến hạn trong hàng đợi
+
+    Tham số:
+        conn: Kết nối SQLite (mặc định: mở kết nối mới tới DB_PATH)
+        transport: Transport dùng để gửi (mặc định: SMTPTransport.from_env())
+
+    Trả về:
+        dict thống kê của OutboxWorker.run
+    """
+    own_conn = conn is None
+    conn = conn or get_connection()
+    try:
+        stats = OutboxWorker(conn, transport=transport).run()
+    finally:
+        if own_conn:
+            conn.close()
+    if stats['emails'] or stats['retried'] or stats['failed']:
+        print(f"[INFO] Đã gửi {stats['sent']} thông báo trong {stats['emails']} email, "
+              f"{stats['retried']} thông báo sẽ được thử lại, {stats['failed']} thông báo bị bỏ")
+    return stats
+
+def main():
+    # Gửi lại các thông báo còn trong hàng đợi (ví dụ sau khi máy chủ SMTP gặp sự cố)
+    init_db()
+    deliver_pending()
+
+if __name__ == '__main__':
+    main()
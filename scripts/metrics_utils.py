@@ -0,0 +1,300 @@
+# scripts/metrics_utils.py
+# Đo đạc các đường nóng: thời gian từng giai đoạn, độ trễ và mã trạng thái HTTP,
+# số dòng đã xử lý và tỉ lệ trúng cache
+# Số liệu được giữ trong bộ nhớ của tiến trình và xuất ra định dạng văn bản của
+# Prometheus (endpoint /metrics của dashboard) hoặc JSON (các lần chạy theo lô).
+
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+
+# Tiền tố tên của mọi số liệu khi xuất cho Prometheus
+METRIC_PREFIX = 'github_trending_'
+
+# Biên trên (giây) của các ô histogram thời gian
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Biên trên của các ô histogram số điểm dữ liệu gửi xuống trình duyệt trong mỗi biểu đồ
+POINT_BUCKETS = (100, 1000, 5000, 10000, 20000, 50000, 100000)
+
+# Các số liệu được ghi nhận: tên -> (loại, mô tả)
+METRICS = {
+    'stage_duration_seconds': ('histogram', 'Thời gian chạy của từng giai đoạn'),
+    'stage_rows_total': ('counter', 'Số dòng đã xử lý của từng giai đoạn'),
+    'http_request_duration_seconds': ('histogram', 'Độ trễ của mỗi lần gửi request HTTP ra mạng'),
+    'http_responses_total': ('counter', 'Số phản hồi HTTP theo mã trạng thái (error: lỗi kết nối/timeout)'),
+    'cache_requests_total': ('counter', 'Số lần tra cache theo kết quả (hit, miss, revalidated)'),
+    'chart_points': ('histogram', 'Số điểm dữ liệu của mỗi biểu đồ được dựng (sau khi lấy mẫu)'),
+}
+
+# Kết quả tra cache được tính là trúng khi tính tỉ lệ
+CACHE_HIT_RESULTS = ('hit', 'revalidated')
+
+class _Histogram:
+    # Histogram với các ô cố định (đếm theo ô, chưa cộng dồn), tổng và giá trị lớn nhất
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'max')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # Ước lượng phân vị bằng nội suy tuyến tính trong ô chứa nó (như
+        # histogram_quantile của Prometheus), không vượt quá giá trị lớn nhất
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                return min(lower + (bound - lower) * (rank - seen) / count, self.max)
+            seen += count
+            lower = bound
+        return self.max
+
+class Span:
+    """
+    Một lần chạy của giai đoạn đang được đo, xem MetricsRegistry.span
+
+    Gán rows khi số dòng chỉ biết được sau khi giai đoạn chạy xong.
+    """
+    __slots__ = ('stage', 'rows', 'started')
+
+    def __init__(self, stage, rows):
+        self.stage = stage
+        self.rows = rows
+        self.started = None
+
+class MetricsRegistry:
+    """
+    Bộ lưu số liệu dùng chung giữa các luồng
+
+    Mỗi số liệu (xem METRICS) có thể có nhiều chuỗi, phân biệt bằng nhãn
+    (ví dụ stage="db_write"). Các giá trị là cộng dồn từ khi tiến trình khởi
+    động (hoặc từ lần reset gần nhất).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self.started_at = time.time()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def span(self, stage, rows=0):
+        """
+        Đo thời gian của một giai đoạn trong khối with
+
+        Thời gian được ghi vào stage_duration_seconds và số dòng vào
+        stage_rows_total, kể cả khi khối with kết thúc bằng ngoại lệ.
+
+        Ví dụ:
+            with metrics.span('html_parse') as span:
+                rows = parse(html)
+                span.rows = len(rows)
+        """
+        return _SpanContext(self, Span(stage, rows))
+
+    def timed(self, stage, rows=0):
+        """
+        Decorator đo thời gian mỗi lần gọi hàm như một giai đoạn, mỗi lần gọi
+        được tính rows dòng
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(stage, rows=rows):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record_span(self, span, elapsed):
+        self.observe('stage_duration_seconds', elapsed, stage=span.stage)
+        if span.rows:
+            self.inc('stage_rows_total', span.rows, stage=span.stage)
+
+    def record_http(self, elapsed, status):
+        # Một lần gửi request ra mạng; status là mã HTTP hoặc 'error'
+        self.observe('http_request_duration_seconds', elapsed)
+        self.inc('http_responses_total', status=str(status))
+
+    def record_cache(self, cache, result, count=1):
+        self.inc('cache_requests_total', count, cache=cache, result=result)
+
+    def record_chart_points(self, chart, points):
+        # Số điểm của một biểu đồ vừa dựng; kích thước figure tỷ lệ với số này
+        self.observe('chart_points', points, buckets=POINT_BUCKETS, chart=chart)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started_at = time.time()
+
+    def render_prometheus(self):
+        """
+        Xuất mọi số liệu theo định dạng văn bản của Prometheus (text/plain; version=0.0.4)
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (h.buckets, list(h.counts), h.sum, h.count) for key, h in self._histograms.items()}
+
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            full_name = METRIC_PREFIX + name
+            series = sorted(key for key in (counters if kind == 'counter' else histograms) if key[0] == name)
+            if not series:
+                continue
+            lines.append(f'# HELP {full_name} {description}')
+            lines.append(f'# TYPE {full_name} {kind}')
+            for key in series:
+                labels = key[1]
+                if kind == 'counter':
+                    lines.append(f'{full_name}{_labels(labels)} {_number(counters[key])}')
+                    continue
+                buckets, counts, total, count = histograms[key]
+                cumulative = 0
+                for bound, bucket_count in zip((*buckets, '+Inf'), counts):
+                    cumulative += bucket_count
+                    lines.append(f'{full_name}_bucket{_labels(labels, le=bound)} {cumulative}')
+                lines.append(f'{full_name}_sum{_labels(labels)} {_number(total)}')
+                lines.append(f'{full_name}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """
+        Tóm tắt số liệu dạng dict (dùng để xuất JSON)
+
+        Trả về:
+            dict gồm:
+            - stages: mỗi giai đoạn có count, total_s, mean_ms, p50_ms, p99_ms,
+              max_ms, rows và rows_per_s (số dòng chia tổng thời gian của giai đoạn,
+              cộng dồn giữa các luồng nếu giai đoạn chạy song song)
+            - http: requests, latency (như một giai đoạn) và status (mã -> số phản hồi)
+            - caches: mỗi cache có số lần theo kết quả và hit_rate
+            Phân vị được ước lượng từ các ô histogram (nội suy trong ô).
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (_summarize(h), h.count) for key, h in self._histograms.items()}
+
+        stages = {}
+        for (name, labels), (summary, _) in sorted(histograms.items()):
+            if name != 'stage_duration_seconds':
+                continue
+            stage = dict(labels)['stage']
+            rows = counters.get(('stage_rows_total', labels), 0)
+            summary['rows'] = rows
+            summary['rows_per_s'] = round(rows / summary['total_s'], 1) if rows and summary['total_s'] else None
+            stages[stage] = summary
+
+        http_latency = histograms.get(('http_request_duration_seconds', ()))
+        status = {dict(labels)['status']: value for (name, labels), value in sorted(counters.items())
+                  if name == 'http_responses_total'}
+
+        caches = {}
+        for (name, labels), value in sorted(counters.items()):
+            if name == 'cache_requests_total':
+                labels = dict(labels)
+                caches.setdefault(labels['cache'], {})[labels['result']] = value
+        for results in caches.values():
+            hits = sum(results.get(result, 0) for result in CACHE_HIT_RESULTS)
+            results['hit_rate'] = round(hits / sum(results.values()), 4)
+
+        return {
+            'uptime_s': round(time.time() - self.started_at, 1),
+            'stages': stages,
+            'http': {
+                'requests': http_latency[1] if http_latency else 0,
+                'latency': http_latency[0] if http_latency else None,
+                'status': status,
+            },
+            'caches': caches,
+        }
+
+    def dump_json(self, path):
+        """
+        Ghi snapshot() ra file JSON (ghi vào file tạm rồi đổi tên)
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        os.replace(tmp_path, path)
+
+class _SpanContext:
+    __slots__ = ('registry', 'span')
+
+    def __init__(self, registry, span):
+        self.registry = registry
+        self.span = span
+
+    def __enter__(self):
+        self.span.started = time.perf_counter()
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.record_span(self.span, time.perf_counter() - self.span.started)
+        return False
+
+def _summarize(histogram):
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+    return {
+        'count': histogram.count,
+        'total_s': round(histogram.sum, 6),
+        'mean_ms': ms(histogram.sum / histogram.count) if histogram.count else None,
+        'p50_ms': ms(histogram.quantile(0.5)),
+        'p99_ms': ms(histogram.quantile(0.99)),
+        'max_ms': ms(histogram.max),
+    }
+
+def _labels(labels, **extra):
+    items = [*labels, *extra.items()]
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in items)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + '}'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# Bộ lưu mặc định của tiến trình, dùng bởi các hàm bên dưới
+REGISTRY = MetricsRegistry()
+
+span = REGISTRY.span
+timed = REGISTRY.timed
+record_http = REGISTRY.record_http
+record_cache = REGISTRY.record_cache
+record_chart_points = REGISTRY.record_chart_points
+render_prometheus = REGISTRY.render_prometheus
+snapshot = REGISTRY.snapshot
+dump_json = REGISTRY.dump_json
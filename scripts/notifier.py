@@ -1,121 +1,197 @@
 # scripts/notifier.py
 # Mô-đun gửi thông báo về những thay đổi đáng chú ý trên GitHub Trending
-# Phân tích và gửi email thông báo về các ngôn ngữ mới, sự thay đổi số sao và chủ đề mới
+# So sánh hai lần thu thập đã hoàn tất gần nhất: repository mới/rời trending,
+# thay đổi thứ hạng và thay đổi tỷ trọng ngôn ngữ; cùng các repository có số star
+# tăng bất thường so với lịch sử của chính nó hoặc của ngôn ngữ (z-score)
 
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from datetime import datetime, timedelta
-import pandas as pd
+from datetime import datetime
 import sqlite3
 from dotenv import load_dotenv
-from db_utils import DB_PATH
+from db_utils import (ANOMALY_Z_THRESHOLD, get_connection, get_latest_complete_runs, get_run_anomalies,
+                      get_run_diff, init_db, mark_run_notified, run_needs_notification)
+from mail_utils import deliver_pending, enqueue, smtp_config_error
 
 load_dotenv()
 
-def get_trend_changes():
+# Ngưỡng của các thay đổi được coi là đáng chú ý
+STAR_ANOMALY_Z_THRESHOLD = ANOMALY_Z_THRESHOLD  # z-score của star_change (xem db_utils)
+RANK_MOVE_THRESHOLD = 5           # số bậc thay đổi trong cùng một trang trending
+LANGUAGE_SHIFT_THRESHOLD = 0.05   # thay đổi tỷ trọng của một ngôn ngữ (5 điểm phần trăm)
+
+# Số dòng tối đa của mỗi mục trong thông báo, phần còn lại được gộp thành một dòng
+MAX_ITEMS_PER_SECTION = 10
+
+UNKNOWN_LANGUAGE = 'Không xác định'
+
+def _section(title, lines):
+    # Giới hạn số dòng của một mục, phần còn lại được gộp thành một dòng
+    if not lines:
+        return []
+    shown = lines[:MAX_ITEMS_PER_SECTION]
+    if len(lines) > len(shown):
+        shown.append(f"... và {len(lines) - len(shown)} thay đổi khác")
+    return [f"{title}:\n" + "\n".join(f"- {line}" for line in shown)]
+
+def format_changes(diff, anomalies):
     """
-    Phân tích và lấy các thay đổi đáng chú ý từ dữ liệu GitHub Trending
-    
+    Chuyển kết quả của get_run_diff và get_run_anomalies thành danh sách đoạn văn bản cho thông báo
+
     Trả về:
-        Danh sách các thay đổi quan trọng (ngôn ngữ mới, tăng số sao, chủ đề mới)
+        Danh sách các đoạn, mỗi loại thay đổi một đoạn (rỗng nếu không có gì đáng chú ý)
     """
+    def language(value):
+        return value or UNKNOWN_LANGUAGE
+
+    shifts = diff['language_shifts']
+    new_languages = shifts[shifts['previous_share'] == 0]
+    shifted = shifts[shifts['previous_share'] > 0]
+    entrants, dropouts = diff['entrants'], diff['dropouts']
+    moves = diff['rank_moves']
+
+    changes = []
+    changes += _section("Ngôn ngữ mới trong trending",
+                        [language(value) for value in new_languages['language']])
+    changes += _section("Repository có số star tăng bất thường", [
+        f"{name} tăng {int(star_change)} star/ngày "
+        f"({'thường' if baseline == 'repo' else f'repository {language(lang)} thường'} "
+        f"khoảng {expected:.0f}, z = {z:.1f})"
+        for name, lang, star_change, expected, z, baseline in zip(
+            anomalies['full_name'], anomalies['language'], anomalies['star_change'],
+            anomalies['expected'], anomalies['z_score'], anomalies['baseline'])
+    ])
+    changes += _section(f"Repository mới vào trending ({len(entrants)})", [
+        f"{name} ({language(lang)})" for name, lang in zip(entrants['full_name'], entrants['language'])
+    ])
+    changes += _section(f"Repository rời khỏi trending ({len(dropouts)})", [
+        f"{name} ({language(lang)})" for name, lang in zip(dropouts['full_name'], dropouts['language'])
+    ])
+    changes += _section("Thay đổi thứ hạng", [
+        f"{name} [{listing}/{period}]: #{int(previous)} -> #{int(rank)}"
+        for name, listing, period, previous, rank in zip(
+            moves['full_name'], moves['listing'], moves['period'], moves['previous_rank'], moves['rank'])
+    ])
+    changes += _section("Thay đổi tỷ trọng ngôn ngữ", [
+        f"{language(lang)}: {previous:.0%} -> {share:.0%}"
+        for lang, previous, share in zip(shifted['language'], shifted['previous_share'], shifted['share'])
+    ])
+    return changes
+
+def get_trend_changes(conn=None, runs=None):
+    """
+    Phân tích và lấy các thay đổi đáng chú ý giữa hai lần thu thập đã hoàn tất gần nhất
+
+    Tham số:
+        conn: Kết nối SQLite dùng chung (mặc định: mở kết nối mới và đóng sau khi đọc)
+        runs: Tuple (current_run, previous_run) cần so sánh (mặc định: hai lần chạy
+              đã hoàn tất gần nhất); main truyền vào để lần chạy được đánh dấu đã
+              thông báo đúng là lần chạy đã được so sánh
+
+    Trả về:
+        Danh sách các thay đổi quan trọng (xem format_changes), hoặc None nếu
+        chưa đủ hai lần chạy hoặc không đọc được dữ liệu
+    """
+    own_conn = conn is None
     try:
-        conn = sqlite3.connect(DB_PATH)
-        df = pd.read_sql("""
-            SELECT * FROM repositories 
-            WHERE scrape_date >= date('now', '-1 day')
-            ORDER BY scrape_date DESC
-        """, conn)
-        conn.close()
-    except Exception as e:
+        conn = conn or get_connection()
+        try:
+            run_ids = runs or get_latest_complete_runs(conn, 2)
+            if len(run_ids) < 2:
+                print("[INFO] Cần ít nhất hai lần thu thập đã hoàn tất để so sánh")
+                return None
+            current_run, previous_run = run_ids
+            diff = get_run_diff(conn, previous_run, current_run, rank_threshold=RANK_MOVE_THRESHOLD,
+                                shift_threshold=LANGUAGE_SHIFT_THRESHOLD)
+            anomalies = get_run_anomalies(conn, current_run, min_z=STAR_ANOMALY_Z_THRESHOLD)
+        finally:
+            if own_conn:
+                conn.close()
+    except sqlite3.Error as e:
         print(f"[LỖI] Không thể lấy dữ liệu thay đổi: {e}")
         return None
-    
-    if df.empty:
-        return None
-        
-    # Phân tích các thay đổi quan trọng
-    significant_changes = []
-    
-    # 1. Các ngôn ngữ mới trong trending
-    if not df.empty and len(df) > 1:
-        latest_languages = set(df.iloc[0]['language'].split(',') if df.iloc[0]['language'] else [])
-        previous_languages = set(df.iloc[-1]['language'].split(',') if df.iloc[-1]['language'] else [])
-        new_languages = latest_languages - previous_languages
-        if new_languages:
-            significant_changes.append(f"Ngôn ngữ mới trong trending: {', '.join(new_languages)}")
-    
-    # 2. Repository có số star tăng đột biến
-    high_star_changes = df[df['star_change'] > 1000][['full_name', 'star_change']]
-    if not high_star_changes.empty:
-        for _, repo in high_star_changes.iterrows():
-            significant_changes.append(
-                f"Repository {repo['full_name']} tăng {repo['star_change']} star"
-            )
-    
-    # 3. Chủ đề mới trong trending
-    if not df.empty and len(df) > 1:
-        latest_topics = set()
-        previous_topics = set()
-        if not pd.isna(df.iloc[0]['topics']):
-            latest_topics.update(t.strip() for t in df.iloc[0]['topics'].split(',') if t.strip())
-        if not pd.isna(df.iloc[-1]['topics']):
-            previous_topics.update(t.strip() for t in df.iloc[-1]['topics'].split(',') if t.strip())
-        new_topics = latest_topics - previous_topics
-        if new_topics:
-            significant_changes.append(f"Chủ đề mới trong trending: {', '.join(new_topics)}")
-    
-    return significant_changes
-
-def send_notification(changes):
+
+    return format_changes(diff, anomalies)
+
+def send_notification(changes, conn=None):
     """
     Gửi email thông báo về các thay đổi đáng chú ý
-    
+
+    Thông báo được ghi vào hàng đợi cho từng người nhận trước khi gửi, nên lỗi
+    gửi không làm mất thông báo: các thông báo chưa gửi được sẽ được thử lại ở
+    lần chạy sau (hoặc bằng python scripts/mail_utils.py).
+
     Tham số:
         changes: Danh sách các thay đổi cần thông báo
+        conn: Kết nối SQLite dùng chung (mặc định: mở kết nối mới)
+
+    Trả về:
+        True nếu thông báo đã được thêm vào hàng đợi
     """
     if not changes:
-        return
-        
-    sender_email = os.getenv('SENDER_EMAIL')
-    sender_password = os.getenv('SENDER_PASSWORD')
-    recipient_email = os.getenv('RECIPIENT_EMAIL')
-    
-    if not all([sender_email, sender_password, recipient_email]):
-        print("[LỖI] Thiếu cấu hình email. Vui lòng kiểm tra file .env")
-        return
-    
-    msg = MIMEMultipart()
-    msg['From'] = sender_email
-    msg['To'] = recipient_email
-    msg['Subject'] = f'Thông Báo GitHub Trending - {datetime.now().strftime("%Y-%m-%d")}'
-    
+        return False
+
+    # RECIPIENT_EMAIL có thể chứa nhiều địa chỉ, phân cách bằng dấu phẩy
+    recipients = [email.strip() for email in os.getenv('RECIPIENT_EMAIL', '').split(',') if email.strip()]
+
+    # Không đưa vào hàng đợi khi chắc chắn không gửi được (ví dụ thiếu mật khẩu):
+    # lần chạy không được đánh dấu đã thông báo và sẽ được xử lý lại khi sửa cấu hình
+    config_error = smtp_config_error() or (None if recipients else "Thiếu RECIPIENT_EMAIL")
+    if config_error:
+        print(f"[LỖI] Thiếu cấu hình email: {config_error}. Vui lòng kiểm tra file .env")
+        return False
+
+    subject = f'Thông Báo GitHub Trending - {datetime.now().strftime("%Y-%m-%d")}'
     body = "\n\n".join(["Những Thay Đổi Quan Trọng Trên GitHub Trending:", *changes])
-    msg.attach(MIMEText(body, 'plain'))
-    
+
+    own_conn = conn is None
+    conn = conn or get_connection()
     try:
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        server.send_message(msg)
-        server.quit()
-        print("[INFO] Đã gửi email thông báo thành công")
-    except Exception as e:
-        print(f"[LỖI] Không thể gửi thông báo: {str(e)}")
-
-def main():
+        queued = enqueue(conn, recipients, subject, body)
+        print(f"[INFO] Đã thêm {queued} thông báo vào hàng đợi")
+        deliver_pending(conn)
+    finally:
+        if own_conn:
+            conn.close()
+    return True
+
+def main(conn=None):
     """
     Hàm chính để kiểm tra và gửi thông báo về các thay đổi
+
+    Mỗi lần thu thập chỉ được thông báo một lần: nếu lần thu thập mới nhất đã
+    được xử lý, hàm dừng ngay sau một truy vấn nhỏ (không tính diff, không nạp
+    pandas), nên có thể chạy bằng cron với chu kỳ ngắn.
+
+    Tham số:
+        conn: Kết nối SQLite dùng chung, ví dụ của bộ lập lịch (mặc định: mở kết nối mới)
     """
     print("=== Kiểm Tra Các Thay Đổi Quan Trọng ===")
-    changes = get_trend_changes()
-    if changes:
-        send_notification(changes)
-        print(f"Tìm thấy {len(changes)} thay đổi quan trọng")
-    else:
-        print("Không phát hiện thay đổi quan trọng nào")
+    init_db()
+    own_conn = conn is None
+    conn = conn or get_connection()
+    try:
+        # Chọn hai lần chạy một lần duy nhất: lần thu thập hoàn tất giữa chừng
+        # không làm lần chạy được so sánh khác lần chạy được đánh dấu
+        run_ids = get_latest_complete_runs(conn, 2)
+        if run_ids and not run_needs_notification(conn, run_ids[0]):
+            print("[INFO] Lần thu thập mới nhất đã được thông báo, không có gì mới")
+            return
+        if len(run_ids) < 2:
+            print("[INFO] Cần ít nhất hai lần thu thập đã hoàn tất để so sánh")
+            return
+        changes = get_trend_changes(conn, runs=tuple(run_ids))
+        if changes:
+            notified = send_notification(changes, conn)
+            print(f"Tìm thấy {len(changes)} thay đổi quan trọng")
+        else:
+            notified = changes is not None
+            print("Không phát hiện thay đổi quan trọng nào")
+        # Thông báo chưa vào được hàng đợi (ví dụ thiếu cấu hình) sẽ được thử lại ở lần chạy sau
+        if notified:
+            mark_run_notified(conn, run_ids[0])
+    finally:
+        if own_conn:
+            conn.close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,212 @@
+# scripts/retention.py
+# Giới hạn kích thước lịch sử snapshots theo độ tuổi của lần thu thập:
+# - trong full_days ngày gần nhất: giữ nguyên mọi lần chạy
+# - đến daily_days ngày: gộp thành một lần chạy mỗi ngày
+# - cũ hơn: gộp thành một lần chạy mỗi tuần (thứ Hai đến Chủ nhật)
+# - cũ hơn keep_days ngày (nếu đặt): xóa hẳn, có thể lưu trữ ra file trước
+# rồi thu nhỏ file cơ sở dữ liệu bằng incremental VACUUM.
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+import columnar_utils
+from db_utils import DB_PATH, delete_runs, get_connection, init_db, merge_runs
+
+# Số ngày giữ nguyên độ phân giải, giữ một lần chạy mỗi ngày, và giữ dữ liệu
+# (None: giữ dữ liệu theo tuần mãi mãi)
+RETENTION_FULL_DAYS = 30
+RETENTION_DAILY_DAYS = 365
+RETENTION_KEEP_DAYS = None
+
+# Số lần chạy bị xóa trong mỗi transaction, để scraper ghi song song không phải chờ lâu
+DELETE_BATCH_SIZE = 100
+
+def plan_retention(conn, full_days=RETENTION_FULL_DAYS, daily_days=RETENTION_DAILY_DAYS,
+                   keep_days=RETENTION_KEEP_DAYS, now=None):
+    """
+    Xác định các lần chạy cần gộp và cần xóa
+
+    Các mốc được làm tròn xuống đầu ngày (mốc tuần: thứ Hai) nên một ngày hoặc
+    một tuần chỉ được gộp khi đã nằm trọn ngoài khoảng giữ nguyên.
+
+    Tham số:
+        conn: Kết nối SQLite đang mở
+        full_days: Số ngày giữ nguyên mọi lần chạy (tối thiểu 1)
+        daily_days: Dữ liệu cũ hơn số ngày này được gộp theo tuần thay vì theo ngày
+        keep_days: Dữ liệu cũ hơn số ngày này bị xóa (None: không xóa)
+        now: Thời điểm tính độ tuổi (mặc định: hiện tại)
+
+    Trả về:
+        Tuple (groups, deleted): groups là danh sách các nhóm lần chạy (mỗi nhóm
+        từ hai lần chạy trở lên, theo ngày hoặc tuần) cần gộp, deleted là danh
+        sách lần chạy cần xóa
+    """
+    if full_days < 1:
+        raise ValueError("full_days phải lớn hơn hoặc bằng 1")
+    if daily_days < full_days or (keep_days is not None and keep_days < daily_days):
+        raise ValueError("Cần full_days <= daily_days <= keep_days")
+    today = (now or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    full_cutoff = today - timedelta(days=full_days)
+    weekly_cutoff = _week_start(today - timedelta(days=daily_days))
+    delete_cutoff = _week_start(today - timedelta(days=keep_days)) if keep_days is not None else None
+
+    buckets = {}
+    deleted = []
+    for run_id, scrape_date in conn.execute(
+            "SELECT id, scrape_date FROM runs WHERE scrape_date < ? ORDER BY scrape_date, id",
+            (full_cutoff.strftime('%Y-%m-%d'),)):
+        try:
+            scraped_at = datetime.fromisoformat(str(scrape_date))
+        except ValueError:
+            continue
+        if delete_cutoff is not None and scraped_at < delete_cutoff:
+            deleted.append(run_id)
+        elif scraped_at < weekly_cutoff:
+            buckets.setdefault(('week', _week_start(scraped_at)), []).append(run_id)
+        else:
+            buckets.setdefault(('day', scraped_at.date()), []).append(run_id)
+    groups = [run_ids for run_ids in buckets.values() if len(run_ids) > 1]
+    return groups, deleted
+
+def _week_start(moment):
+    # Đầu ngày thứ Hai của tuần chứa moment
+    return (moment - timedelta(days=moment.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+
+def apply_retention(conn, full_days=RETENTION_FULL_DAYS, daily_days=RETENTION_DAILY_DAYS,
+                    keep_days=RETENTION_KEEP_DAYS, archive_dir=None, now=None):
+    """
+    Gộp và xóa lịch sử cũ theo plan_retention
+
+    Mỗi nhóm được gộp trong một transaction riêng (xem db_utils.merge_runs), các
+    lần chạy bị xóa được xóa theo lô DELETE_BATCH_SIZE, nên scraper ghi song song
+    chỉ phải chờ một nhóm. Sau đó một dòng được ghi vào retention_log và file
+    đã xuất (columnar_utils) của các lần chạy bị thay đổi được cập nhật theo.
+
+    Tham số:
+        conn: Kết nối SQLite ở chế độ autocommit (xem db_utils.get_connection)
+        full_days, daily_days, keep_days, now: Như plan_retention
+        archive_dir: Nếu có, mọi lần chạy sắp bị gộp hoặc xóa được lưu trữ đầy
+                     đủ ra thư mục này (Parquet) trước khi thay đổi; cần pyarrow
+
+    Trả về:
+        dict gồm runs_merged, runs_deleted, rows_removed, archived
+    """
+    if archive_dir and columnar_utils.pa is None:
+        raise ImportError("Cần cài đặt pyarrow để lưu trữ dữ liệu trước khi xóa (pip install pyarrow)")
+    groups, deleted = plan_retention(conn, full_days, daily_days, keep_days, now)
+    stats = {'runs_merged': 0, 'runs_deleted': 0, 'rows_removed': 0, 'archived': 0}
+    if not groups and not deleted:
+        return stats
+
+    if archive_dir:
+        stats['archived'] = columnar_utils.archive_runs(
+            conn, [run_id for run_ids in groups for run_id in run_ids] + deleted, archive_dir)
+
+    changed = []
+    c = conn.cursor()
+    for run_ids in groups:
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            _, removed = merge_runs(c, run_ids)
+            c.execute("COMMIT")
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+        stats['runs_merged'] += len(run_ids) - 1
+        stats['rows_removed'] += removed
+        changed.extend(run_ids)
+    for start in range(0, len(deleted), DELETE_BATCH_SIZE):
+        batch = deleted[start:start + DELETE_BATCH_SIZE]
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            stats['rows_removed'] += delete_runs(c, batch)
+            c.execute("COMMIT")
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+        stats['runs_deleted'] += len(batch)
+        changed.extend(batch)
+
+    # File đã xuất được cập nhật trước khi ghi retention_log, vì dashboard tải
+    # lại từ các file này khi thấy retention_log thay đổi
+    columnar_utils.sync_exported_runs(conn, changed)
+    c.execute("INSERT INTO retention_log (ran_at, runs_merged, runs_deleted, rows_removed) VALUES (?, ?, ?, ?)",
+              (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), stats['runs_merged'], stats['runs_deleted'],
+               stats['rows_removed']))
+    return stats
+
+def compact(conn, db_path=DB_PATH):
+    """
+    Trả lại hệ điều hành các trang trống của file cơ sở dữ liệu
+
+    Cơ sở dữ liệu tạo trước khi có auto_vacuum được chuyển sang chế độ
+    INCREMENTAL bằng một lần VACUUM đầy đủ (ghi lại toàn bộ file, cần thêm dung
+    lượng đĩa bằng kích thước file); các lần sau chỉ chạy incremental_vacuum,
+    không ghi lại các trang đang dùng. WAL được checkpoint và thu gọn sau đó.
+
+    Trả về:
+        Tuple (kích thước trước, kích thước sau) của file (byte)
+    """
+    before = _file_size(db_path)
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        print("[INFO] Chuyển cơ sở dữ liệu sang auto_vacuum=INCREMENTAL (VACUUM đầy đủ một lần)...")
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    else:
+        # execute() chỉ chạy một bước của PRAGMA (giải phóng một trang);
+        # executescript chạy đến khi xong
+        conn.executescript("PRAGMA incremental_vacuum")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    return before, _file_size(db_path)
+
+def _file_size(db_path):
+    return sum(os.path.getsize(path) for path in (db_path, f'{db_path}-wal') if os.path.exists(path))
+
+def run_retention(conn, full_days=RETENTION_FULL_DAYS, daily_days=RETENTION_DAILY_DAYS,
+                  keep_days=RETENTION_KEEP_DAYS, archive_dir=None, vacuum=True):
+    """
+    Gộp/xóa lịch sử cũ rồi thu nhỏ file, in kết quả (dùng cho dòng lệnh và bộ lập lịch)
+    """
+    stats = apply_retention(conn, full_days=full_days, daily_days=daily_days, keep_days=keep_days,
+                            archive_dir=archive_dir)
+    print(f"[INFO] Đã gộp {stats['runs_merged']} lần chạy, xóa {stats['runs_deleted']} lần chạy, "
+          f"bỏ {stats['rows_removed']} dòng snapshots"
+          + (f", lưu trữ {stats['archived']} lần chạy vào {archive_dir}" if stats['archived'] else ''))
+    if vacuum:
+        before, after = compact(conn)
+        print(f"[INFO] Kích thước cơ sở dữ liệu: {before / 1048576:.1f} MB -> {after / 1048576:.1f} MB")
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Gộp/xóa lịch sử snapshots cũ và thu nhỏ cơ sở dữ liệu")
+    parser.add_argument("--full-days", type=int, default=RETENTION_FULL_DAYS,
+                        help="Số ngày gần nhất giữ nguyên mọi lần chạy")
+    parser.add_argument("--daily-days", type=int, default=RETENTION_DAILY_DAYS,
+                        help="Giữ một lần chạy mỗi ngày đến số ngày này, cũ hơn giữ một lần chạy mỗi tuần")
+    parser.add_argument("--keep-days", type=int, default=RETENTION_KEEP_DAYS,
+                        help="Xóa dữ liệu cũ hơn số ngày này (mặc định: không xóa)")
+    parser.add_argument("--archive-dir", help="Lưu trữ đầy đủ các lần chạy ra thư mục này (Parquet) trước khi gộp/xóa")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ in số lần chạy sẽ bị gộp/xóa")
+    parser.add_argument("--no-vacuum", action="store_true", help="Không thu nhỏ file sau khi gộp/xóa")
+    args = parser.parse_args()
+
+    init_db()
+    conn = get_connection()
+    try:
+        if args.dry_run:
+            groups, deleted = plan_retention(conn, args.full_days, args.daily_days, args.keep_days)
+            print(f"[INFO] Sẽ gộp {sum(len(run_ids) for run_ids in groups)} lần chạy thành {len(groups)}, "
+                  f"xóa {len(deleted)} lần chạy")
+            return
+        run_retention(conn, full_days=args.full_days, daily_days=args.daily_days, keep_days=args.keep_days,
+                      archive_dir=args.archive_dir, vacuum=not args.no_vacuum)
+    except (ValueError, ImportError) as e:
+        print(f"[LỖI] {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
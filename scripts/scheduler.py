@@ -0,0 +1,263 @@
+# scripts/scheduler.py
+# Bộ lập lịch chạy nền: thu thập -> phân tích -> thông báo trong cùng một tiến trình
+# Các thư viện (pandas, matplotlib, bs4/lxml) chỉ được nạp một lần; session HTTP,
+# cache phản hồi và kết nối SQLite được giữ lại giữa các lần chạy.
+
+import argparse
+import os
+import shlex
+import signal
+import threading
+import time
+from datetime import datetime
+
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MAX_INSTANCES
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.schedulers.blocking import BlockingScheduler
+
+import analysis
+import notifier
+import retention
+import scraper
+import metrics_utils
+from db_utils import SnapshotWriter, get_connection, init_db
+from extractors import get_extractor
+from mail_utils import BASE_RETRY_DELAY, deliver_pending
+
+# Chu kỳ thu thập mặc định (phút) và độ lệch ngẫu nhiên tối đa (giây) cộng vào
+# mỗi lần chạy để không gửi request đúng đầu giờ cùng các máy khác
+DEFAULT_INTERVAL_MINUTES = 60
+DEFAULT_JITTER_SECONDS = 300
+
+# Chu kỳ (phút) gửi lại các thông báo còn trong hàng đợi
+DEFAULT_DELIVER_INTERVAL_MINUTES = max(1, BASE_RETRY_DELAY // 60)
+
+# Chu kỳ (giờ) gộp/xóa lịch sử cũ và thu nhỏ cơ sở dữ liệu; 0: không chạy
+DEFAULT_RETENTION_INTERVAL_HOURS = 0
+
+# Giai đoạn tiếp theo được kích hoạt khi một giai đoạn chạy xong
+NEXT_STAGE = {
+    'scrape': 'analyze',
+    'analyze': 'notify',
+}
+
+class Pipeline:
+    """
+    Trạng thái dùng chung giữa các lần chạy của bộ lập lịch
+
+    Giữ session HTTP (connection pool và cache phản hồi), SnapshotWriter và một
+    kết nối đọc SQLite. Một lần chạy bắt đầu ở scrape và kết thúc khi notify
+    xong hoặc một giai đoạn bị lỗi; trong thời gian đó các lần scrape mới bị bỏ qua.
+    """
+
+    def __init__(self, scraper_args, metrics_json=None, retention_args=None):
+        self.scraper_args = scraper_args
+        self.metrics_json = metrics_json
+        # Tham số cho retention.run_retention (full_days, daily_days, keep_days, archive_dir)
+        self.retention_args = retention_args or {}
+        self._session = None
+        self._extractor = None
+        self._writer = None
+        self._conn = None
+        self._running = threading.Lock()
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = get_connection(check_same_thread=False)
+        return self._conn
+
+    def scrape(self):
+        """
+        Bắt đầu một lần chạy bằng giai đoạn thu thập
+
+        Trả về:
+            True nếu đã thu thập, False nếu bỏ qua vì lần chạy trước chưa xong
+        """
+        if not self._running.acquire(blocking=False):
+            print("[CẢNH BÁO] Lần chạy trước chưa xong, bỏ qua lần thu thập này")
+            return False
+        if self._session is None:
+            self._session = scraper.create_scrape_session(self.scraper_args)
+            self._extractor = get_extractor(self.scraper_args.extractor)
+            self._writer = SnapshotWriter(check_same_thread=False)
+        self._timed('scrape', scraper.run_scrape, self.scraper_args, session=self._session,
+                    extractor=self._extractor, writer=self._writer)
+        self._writer.checkpoint()
+        return True
+
+    def analyze(self):
+        self._timed('analyze', analysis.analyze_by_date)
+
+    def notify(self):
+        self._timed('notify', notifier.main, self.conn)
+
+    def deliver(self):
+        # Gửi lại các thông báo đến hạn thử lại trong hàng đợi
+        deliver_pending(self.conn)
+
+    def retain(self):
+        # Gộp/xóa lịch sử cũ giữa hai lần chạy; bỏ qua nếu một lần chạy đang dở
+        if not self._running.acquire(blocking=False):
+            print("[CẢNH BÁO] Lần chạy hiện tại chưa xong, để lần gộp lịch sử sau")
+            return
+        try:
+            self._timed('retain', retention.run_retention, self.conn, **self.retention_args)
+        finally:
+            self._running.release()
+
+    def finish(self):
+        # Kết thúc lần chạy hiện tại (sau notify hoặc khi một giai đoạn bị lỗi);
+        # số liệu đo đạc (cộng dồn từ khi khởi động) được ghi lại sau mỗi lần chạy
+        if self._running.locked():
+            if self.metrics_json:
+                metrics_utils.dump_json(self.metrics_json)
+            self._running.release()
+
+    def run_once(self):
+        """
+        Chạy cả ba giai đoạn nối tiếp ngay trong luồng hiện tại
+        """
+        try:
+            if self.scrape():
+                self.analyze()
+                self.notify()
+        finally:
+            self.finish()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._session is not None:
+            cache = getattr(self._session, 'cache', None)
+            if cache is not None:
+                cache.close()
+            self._session.close()
+        if self._conn is not None:
+            self._conn.close()
+
+    @staticmethod
+    def _timed(stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        print(f"[INFO] Giai đoạn {stage} xong sau {time.perf_counter() - start:.1f}s")
+        return result
+
+def build_scheduler(pipeline, interval=DEFAULT_INTERVAL_MINUTES, jitter=DEFAULT_JITTER_SECONDS,
+                    deliver_interval=DEFAULT_DELIVER_INTERVAL_MINUTES,
+                    retention_interval=DEFAULT_RETENTION_INTERVAL_HOURS, run_now=False):
+    """
+    Tạo bộ lập lịch cho pipeline
+
+    Mọi công việc chạy trên một luồng duy nhất nên các giai đoạn không bao giờ
+    chạy chồng lên nhau; lần chạy bị lỡ (ví dụ máy ngủ) được gộp thành một lần.
+    Chỉ scrape được lập lịch theo chu kỳ, analyze và notify được thêm vào ngay
+    khi giai đoạn trước chạy xong.
+
+    Tham số:
+        pipeline: Pipeline dùng chung
+        interval: Chu kỳ thu thập (phút)
+        jitter: Độ lệch ngẫu nhiên tối đa của mỗi lần thu thập (giây)
+        deliver_interval: Chu kỳ gửi lại thông báo trong hàng đợi (phút)
+        retention_interval: Chu kỳ gộp/xóa lịch sử cũ (giờ), 0 để tắt
+        run_now: Chạy lần đầu ngay khi khởi động
+
+    Trả về:
+        BlockingScheduler chưa khởi động
+    """
+    scheduler = BlockingScheduler(
+        executors={'default': ThreadPoolExecutor(max_workers=1)},
+        job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': interval * 60},
+    )
+    first_run = {'next_run_time': datetime.now()} if run_now else {}
+    scheduler.add_job(pipeline.scrape, 'interval', minutes=interval, jitter=jitter, id='scrape', **first_run)
+    scheduler.add_job(pipeline.deliver, 'interval', minutes=deliver_interval, id='deliver')
+    if retention_interval > 0:
+        scheduler.add_job(pipeline.retain, 'interval', hours=retention_interval, id='retain')
+
+    def on_job_event(event):
+        if event.code == EVENT_JOB_MAX_INSTANCES:
+            print(f"[CẢNH BÁO] Công việc {event.job_id} vẫn đang chạy, bỏ qua lần này")
+            return
+        if event.job_id in ('deliver', 'retain'):
+            if event.exception is not None:
+                print(f"[LỖI] Công việc {event.job_id} thất bại: {event.exception}")
+            return
+        if event.exception is not None:
+            print(f"[LỖI] Giai đoạn {event.job_id} thất bại, dừng lần chạy này: {event.exception}")
+            pipeline.finish()
+            return
+        if event.job_id == 'scrape' and event.retval is False:
+            return
+        next_stage = NEXT_STAGE.get(event.job_id)
+        if next_stage is None:
+            pipeline.finish()
+            print(f"[INFO] Hoàn thành lần chạy, lần thu thập tiếp theo: "
+                  f"{scheduler.get_job('scrape').next_run_time:%Y-%m-%d %H:%M:%S}")
+        else:
+            scheduler.add_job(getattr(pipeline, next_stage), id=next_stage, replace_existing=True)
+
+    scheduler.add_listener(on_job_event, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MAX_INSTANCES)
+    return scheduler
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy nền pipeline thu thập -> phân tích -> thông báo")
+    parser.add_argument("--interval", type=int, default=DEFAULT_INTERVAL_MINUTES,
+                        help="Chu kỳ thu thập (phút)")
+    parser.add_argument("--jitter", type=int, default=DEFAULT_JITTER_SECONDS,
+                        help="Độ lệch ngẫu nhiên tối đa của mỗi lần thu thập (giây)")
+    parser.add_argument("--deliver-interval", type=int, default=DEFAULT_DELIVER_INTERVAL_MINUTES,
+                        help="Chu kỳ gửi lại thông báo còn trong hàng đợi (phút)")
+    parser.add_argument("--run-now", action="store_true", help="Chạy lần đầu ngay khi khởi động")
+    parser.add_argument("--once", action="store_true", help="Chạy pipeline một lần rồi thoát")
+    parser.add_argument("--scraper-args", default="",
+                        help='Tham số truyền cho scraper, ví dụ "--crawl --languages python go"')
+    parser.add_argument("--metrics-json", default=os.getenv('GITHUB_TRENDING_METRICS_JSON'),
+                        help="Ghi số liệu đo đạc ra file JSON sau mỗi lần chạy")
+    parser.add_argument("--retention-interval", type=int, default=DEFAULT_RETENTION_INTERVAL_HOURS,
+                        help="Chu kỳ gộp/xóa lịch sử cũ và thu nhỏ cơ sở dữ liệu (giờ, 0: không chạy)")
+    parser.add_argument("--full-days", type=int, default=retention.RETENTION_FULL_DAYS,
+                        help="Số ngày gần nhất giữ nguyên mọi lần chạy (xem retention.py)")
+    parser.add_argument("--daily-days", type=int, default=retention.RETENTION_DAILY_DAYS,
+                        help="Giữ một lần chạy mỗi ngày đến số ngày này, cũ hơn giữ một lần chạy mỗi tuần")
+    parser.add_argument("--keep-days", type=int, default=retention.RETENTION_KEEP_DAYS,
+                        help="Xóa dữ liệu cũ hơn số ngày này (mặc định: không xóa)")
+    parser.add_argument("--archive-dir", help="Lưu trữ các lần chạy ra thư mục này trước khi gộp/xóa")
+    args = parser.parse_args()
+
+    scraper_parser = scraper.build_parser()
+    scraper_args = scraper_parser.parse_args(shlex.split(args.scraper_args))
+    if scraper_args.run_id:
+        parser.error("--run-id cố định không dùng được khi chạy theo lịch")
+    if scraper_args.offline and scraper_args.no_cache:
+        scraper_parser.error("--offline cần dùng cache, không thể kết hợp với --no-cache")
+
+    init_db()
+    if args.retention_interval > 0 and not (
+            1 <= args.full_days <= args.daily_days <= (args.keep_days or args.daily_days)):
+        parser.error("Cần 1 <= --full-days <= --daily-days <= --keep-days")
+    retention_args = {'full_days': args.full_days, 'daily_days': args.daily_days,
+                      'keep_days': args.keep_days, 'archive_dir': args.archive_dir}
+    pipeline = Pipeline(scraper_args, metrics_json=args.metrics_json, retention_args=retention_args)
+    try:
+        if args.once:
+            pipeline.run_once()
+            return
+        scheduler = build_scheduler(pipeline, interval=args.interval, jitter=args.jitter,
+                                    deliver_interval=args.deliver_interval,
+                                    retention_interval=args.retention_interval, run_now=args.run_now)
+        # Dừng khi nhận SIGTERM (ví dụ từ systemd), chờ giai đoạn đang chạy hoàn tất
+        signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.shutdown())
+        print(f"=== Bộ lập lịch đã khởi động: thu thập mỗi {args.interval} phút "
+              f"(lệch tối đa {args.jitter}s) ===")
+        try:
+            scheduler.start()
+        except KeyboardInterrupt:
+            if scheduler.running:
+                scheduler.shutdown()
+    finally:
+        pipeline.close()
+        print("=== Bộ lập lịch đã dừng ===")
+
+if __name__ == "__main__":
+    main()
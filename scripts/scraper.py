@@ -1,77 +1,115 @@
 # scripts/scraper.py
 # Mô-đun thu thập dữ liệu từ trang GitHub Trending
 import requests
-from bs4 import BeautifulSoup
-import pandas as pd
 from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import argparse
 import os
+from urllib.parse import quote, urlsplit
 
-from db_utils import init_db, append_data_to_db
+from db_utils import init_db, SnapshotWriter
+from http_utils import create_session, RateLimiter, ResponseCache
+from extractors import get_extractor
+import metrics_utils
 
-def scrape_github_trending(url="https://github.com/trending"):
+# Số luồng tối đa dùng để lấy số người đóng góp song song
+DEFAULT_MAX_WORKERS = 8
+
+# Số dòng được đọc trước khi thu thập dạng luồng, tính theo bội số của số luồng
+STREAM_LOOKAHEAD = 4
+
+# Số dòng mỗi lần ghi (mỗi transaction) khi ghi dạng luồng; dữ liệu đã ghi được
+# giữ lại nếu lần thu thập bị lỗi giữa chừng
+DEFAULT_STREAM_BATCH_SIZE = 100
+
+GITHUB_URL = "https://github.com"
+TRENDING_URL = f"{GITHUB_URL}/trending"
+TRENDING_PERIODS = ("daily", "weekly", "monthly")
+
+# Các ngôn ngữ được thu thập ở chế độ crawl nhiều trang
+DEFAULT_LANGUAGES = [
+    "all", "python", "javascript", "typescript", "java", "go", "rust", "c", "c++",
+    "c#", "php", "ruby", "kotlin", "swift", "dart", "scala", "shell", "lua",
+    "r", "julia", "haskell", "elixir", "clojure", "perl", "objective-c", "zig",
+    "vue", "html", "css", "jupyter-notebook", "dockerfile", "powershell", "nix",
+]
+
+def scrape_github_trending(url="https://github.com/trending", session=None, max_workers=DEFAULT_MAX_WORKERS,
+                           extractor=None):
     """
     Thu thập thông tin các repository đang thịnh hành trên GitHub
     
     Tham số:
         url: Đường dẫn đến trang GitHub Trending (mặc định: https://github.com/trending)
+        session: requests.Session dùng chung (mặc định: tạo mới với pool theo max_workers)
+        max_workers: Số request lấy người đóng góp được chạy song song tối đa
+        extractor: Backend trích xuất HTML (mặc định: xem extractors.get_extractor)
     
     Trả về:
         Danh sách các repository với thông tin chi tiết
     """
+    data = list(iter_trending_listings([{'url': url}], session=session, max_workers=max_workers,
+                                       extractor=extractor))
+    print(f"[INFO] Tổng số repository đã xử lý: {len(data)}")
+    return data
+
+def fetch_trending_page(url, session, extractor=None):
+    """
+    Tải và phân tích một trang trending (chưa lấy số người đóng góp)
+
+    Tham số:
+        url: Đường dẫn đến trang trending
+        session: requests.Session dùng chung
+        extractor: Backend trích xuất HTML (mặc định: xem extractors.get_extractor)
+
+    Trả về:
+        Danh sách các repository trên trang, contributor_count tạm đặt là None
+    """
     try:
-        response = requests.get(url, timeout=10)
+        with metrics_utils.span('trending_fetch'):
+            response = session.get(url, timeout=10)
         response.raise_for_status()
-        print("[INFO] Đã tải thành công trang trending")
+        print(f"[INFO] Đã tải thành công trang trending: {url}")
     except requests.RequestException as e:
         print(f"[LỖI] Không thể tải trang trending: {e}")
         return []
 
-    # Phân tích cú pháp HTML và tìm tất cả các repository
-    soup = BeautifulSoup(response.text, "html.parser")
-    repo_list = soup.find_all("article", class_="Box-row")
-    print(f"[INFO] Tìm thấy {len(repo_list)} repository")
+    return parse_trending_html(response.text, extractor=extractor)
+
+def parse_trending_html(html, extractor=None):
+    """
+    Phân tích HTML của trang trending thành danh sách repository
+
+    Tham số:
+        html: Nội dung HTML của trang trending
+        extractor: Backend trích xuất HTML (mặc định: xem extractors.get_extractor)
+
+    Trả về:
+        Danh sách các repository theo thứ tự trên trang (rank bắt đầu từ 1),
+        contributor_count tạm đặt là None
+    """
+    extractor = extractor or get_extractor()
+    with metrics_utils.span('html_parse') as span:
+        rows = extractor.trending_rows(html)
+        span.rows = len(rows)
+    print(f"[INFO] Tìm thấy {len(rows)} repository")
 
     data = []
-    for repo in repo_list:
+    for rank, row in enumerate(rows, start=1):
         # Lấy tên đầy đủ của repository
-        full_name_tag = repo.find("h2", class_="h3")
-        full_name = (
-            full_name_tag.get_text(strip=True)
-            .replace("\n", "")
-            .replace(" ", "")
-        )
+        full_name = row['full_name'].replace("\n", "").replace(" ", "")
 
         # Lấy mô tả và ngôn ngữ lập trình của repository
-        desc_tag = repo.find("p", class_="col-9")
-        description = desc_tag.get_text(strip=True) if desc_tag else ""
-        lang_tag = repo.find("span", itemprop="programmingLanguage")
-        language = lang_tag.get_text(strip=True) if lang_tag else ""
+        description = row['description']
+        language = row['language']
 
         # Lấy số lượng sao và sự thay đổi số sao
-        star_tag = repo.find("a", href=lambda href: href and href.endswith("/stargazers"))
-        raw_stars = star_tag.get_text(strip=True) if star_tag else "0"
-        stars = convert_star_str_to_int(raw_stars)
+        stars = convert_star_str_to_int(row['raw_stars'])
 
-        star_change_tag = repo.find("span", class_="d-inline-block float-sm-right")
-        raw_star_change = star_change_tag.get_text(strip=True) if star_change_tag else "0"
+        raw_star_change = row['raw_star_change']
         star_change = convert_star_str_to_int(raw_star_change.split()[0]) if raw_star_change != "0" else 0
 
-        # Lấy số lượng người đóng góp
-        contributors_url = f"https://github.com/{full_name}/contributors"
-        contributor_count = 0
-        try:
-            contributors_response = requests.get(contributors_url, timeout=5)
-            if contributors_response.status_code == 200:
-                contributors_soup = BeautifulSoup(contributors_response.text, "html.parser")
-                contributor_count_tag = contributors_soup.find("span", class_="Counter")
-                if contributor_count_tag:
-                    try:
-                        contributor_count = int(contributor_count_tag.get_text(strip=True))
-                    except ValueError:
-                        print(f"[CẢNH BÁO] Số lượng người đóng góp không hợp lệ cho {full_name}")
-        except requests.RequestException as e:
-            print(f"[CẢNH BÁO] Không thể lấy thông tin người đóng góp cho {full_name}: {e}")
-
         # Tạo đường dẫn đến repository và thêm vào danh sách kết quả
         link = "https://github.com/" + full_name
         data.append({
@@ -80,13 +118,230 @@ def scrape_github_trending(url="https://github.com/trending"):
             'language': language,
             'stars': stars,
             'star_change': star_change,
-            'contributor_count': contributor_count,
-            'link': link
+            'contributor_count': None,
+            'link': link,
+            'rank': rank
         })
 
-    print(f"[INFO] Tổng số repository đã xử lý: {len(data)}")
     return data
 
+def build_listings(languages=None, periods=None, base_url=GITHUB_URL):
+    """
+    Tạo danh sách các trang trending cần thu thập
+
+    Tham số:
+        languages: Danh sách slug ngôn ngữ (ví dụ: "python"); "all" là trang không lọc ngôn ngữ
+        periods: Danh sách khoảng thời gian ("daily", "weekly", "monthly")
+        base_url: Địa chỉ gốc của GitHub (mặc định: https://github.com)
+
+    Trả về:
+        Danh sách dict gồm listing, period và url
+    """
+    languages = languages or ["all"]
+    periods = periods or ["daily"]
+    trending_url = f"{base_url}/trending"
+
+    listings = []
+    for language in languages:
+        for period in periods:
+            if period not in TRENDING_PERIODS:
+                raise ValueError(f"Khoảng thời gian không hợp lệ: {period}")
+            path = trending_url if language == "all" else f"{trending_url}/{quote(language, safe='+')}"
+            listings.append({
+                'listing': language,
+                'period': period,
+                'url': f"{path}?since={period}"
+            })
+    return listings
+
+def crawl_trending_listings(listings, session=None, max_workers=DEFAULT_MAX_WORKERS, extractor=None):
+    """
+    Thu thập nhiều trang trending trong cùng một lần chạy
+
+    Các trang được tải song song trên cùng connection pool. Repository xuất hiện
+    ở nhiều trang chỉ được lấy số người đóng góp một lần.
+
+    Tham số:
+        listings: Danh sách trang cần thu thập (xem build_listings)
+        session: requests.Session dùng chung (mặc định: tạo mới)
+        max_workers: Số request được chạy song song tối đa
+        extractor: Backend trích xuất HTML (mặc định: xem extractors.get_extractor)
+
+    Trả về:
+        Danh sách các repository, mỗi dòng được gắn thêm listing và period
+    """
+    data = list(iter_trending_listings(listings, session=session, max_workers=max_workers,
+                                       extractor=extractor))
+    print(f"[INFO] Tổng số dòng đã xử lý: {len(data)}")
+    return data
+
+def iter_trending_listings(listings, session=None, max_workers=DEFAULT_MAX_WORKERS, extractor=None):
+    """
+    Thu thập các trang trending và trả về từng dòng ngay khi đã có số người đóng góp
+
+    Các trang và trang contributors được tải song song, nhưng chỉ tối đa
+    STREAM_LOOKAHEAD * max_workers dòng được giữ chờ cùng lúc, nên bộ nhớ không
+    tăng theo số trang; các dòng được trả về theo thứ tự trang rồi thứ hạng.
+    Repository xuất hiện ở nhiều trang chỉ được lấy số người đóng góp một lần.
+
+    Tham số:
+        listings: Danh sách trang cần thu thập, mỗi trang là dict có url và tùy
+                  chọn listing, period (xem build_listings)
+        session: requests.Session dùng chung (mặc định: tạo mới)
+        max_workers: Số request được chạy song song tối đa
+        extractor: Backend trích xuất HTML (mặc định: xem extractors.get_extractor)
+
+    Trả về:
+        Generator các dict repository như parse_trending_html, đã có
+        contributor_count và (nếu trang có) listing, period
+    """
+    if not listings:
+        return
+    if session is None:
+        session = create_session(pool_size=max_workers)
+    extractor = extractor or get_extractor()
+    base_url = _base_url(listings[0]['url'])
+    max_workers = max(1, max_workers)
+
+    # full_name -> Future của lần tra cứu số người đóng góp (dùng chung giữa các trang)
+    lookups = {}
+    totals = {'rows': 0, 'pages': 0}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(listings)))) as page_pool, \
+            ThreadPoolExecutor(max_workers=max_workers) as lookup_pool:
+        pages = _ordered_map(page_pool, lambda listing: fetch_trending_page(listing['url'], session, extractor=extractor),
+                             listings, window=max_workers)
+
+        def pending_rows():
+            for listing, page in zip(listings, pages):
+                totals['pages'] += 1
+                for item in page:
+                    if 'listing' in listing:
+                        item['listing'] = listing['listing']
+                        item['period'] = listing['period']
+                    name = item['full_name']
+                    future = lookups.get(name)
+                    if future is None:
+                        future = lookups[name] = lookup_pool.submit(
+                            fetch_contributor_count, name, session, extractor=extractor, base_url=base_url)
+                    yield item, future
+
+        for item, future in _lookahead(pending_rows(), STREAM_LOOKAHEAD * max_workers):
+            item['contributor_count'] = future.result()
+            totals['rows'] += 1
+            yield item
+
+    if len(listings) > 1:
+        print(f"[INFO] {totals['rows']} dòng từ {totals['pages']} trang, {len(lookups)} repository khác nhau")
+
+def _ordered_map(executor, func, items, window):
+    # Như executor.map nhưng chỉ gửi trước tối đa window việc, kết quả theo thứ tự đầu vào
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def _lookahead(iterable, window):
+    # Đọc trước tối đa window phần tử (để các request của chúng chạy song song) rồi trả lần lượt
+    buffer = deque()
+    for item in iterable:
+        buffer.append(item)
+        if len(buffer) > window:
+            yield buffer.popleft()
+    while buffer:
+        yield buffer.popleft()
+
+@metrics_utils.timed('contributor_enrichment', rows=1)
+def fetch_contributor_count(full_name, session, extractor=None, base_url=GITHUB_URL):
+    """
+    Lấy số lượng người đóng góp của một repository
+
+    Tham số:
+        full_name: Tên đầy đủ của repository (owner/name)
+        session: requests.Session dùng chung
+        extractor: Backend trích xuất HTML (mặc định: xem extractors.get_extractor)
+        base_url: Địa chỉ gốc của GitHub (mặc định: https://github.com)
+
+    Trả về:
+        Số lượng người đóng góp, hoặc None nếu không lấy được (được lưu NULL để
+        không lẫn với repository thực sự có 0 người đóng góp)
+    """
+    contributors_url = f"{base_url}/{full_name}/contributors"
+    try:
+        contributors_response = session.get(contributors_url, timeout=5)
+    except requests.RequestException as e:
+        print(f"[CẢNH BÁO] Không thể lấy thông tin người đóng góp cho {full_name}: {e}")
+        return None
+    if contributors_response.status_code != 200:
+        print(f"[CẢNH BÁO] Không thể lấy thông tin người đóng góp cho {full_name}: "
+              f"HTTP {contributors_response.status_code}")
+        return None
+    return parse_contributor_count(contributors_response.text, full_name=full_name, extractor=extractor)
+
+def parse_contributor_count(html, full_name=None, extractor=None):
+    """
+    Phân tích HTML của trang contributors để lấy số lượng người đóng góp
+
+    Tham số:
+        html: Nội dung HTML của trang contributors
+        full_name: Tên repository, chỉ dùng để ghi cảnh báo
+        extractor: Backend trích xuất HTML (mặc định: xem extractors.get_extractor)
+
+    Trả về:
+        Số lượng người đóng góp (0 nếu trang không có bộ đếm, None nếu không hợp lệ)
+    """
+    extractor = extractor or get_extractor()
+    counter = extractor.contributor_counter(html)
+    if counter is None:
+        return 0
+    try:
+        return int(counter)
+    except ValueError:
+        print(f"[CẢNH BÁO] Số lượng người đóng góp không hợp lệ cho {full_name}")
+        return None
+
+def fetch_contributor_counts(full_names, session=None, max_workers=DEFAULT_MAX_WORKERS, extractor=None,
+                             base_url=GITHUB_URL):
+    """
+    Lấy số lượng người đóng góp cho nhiều repository song song
+
+    Các request chạy trên một thread pool giới hạn và dùng chung connection pool
+    của session, nên tổng thời gian phụ thuộc vào request chậm nhất thay vì
+    tổng thời gian của tất cả các request.
+
+    Tham số:
+        full_names: Danh sách tên đầy đủ của các repository
+        session: requests.Session dùng chung (mặc định: tạo mới)
+        max_workers: Số request được chạy song song tối đa
+        extractor: Backend trích xuất HTML (mặc định: xem extractors.get_extractor)
+        base_url: Địa chỉ gốc của GitHub (mặc định: https://github.com)
+
+    Trả về:
+        Danh sách số người đóng góp theo đúng thứ tự của full_names (None với
+        repository không lấy được)
+    """
+    if not full_names:
+        return []
+    if session is None:
+        session = create_session(pool_size=max_workers)
+    extractor = extractor or get_extractor()
+
+    max_workers = max(1, min(max_workers, len(full_names)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # executor.map trả kết quả theo thứ tự đầu vào
+        return list(executor.map(
+            lambda name: fetch_contributor_count(name, session, extractor=extractor, base_url=base_url),
+            full_names
+        ))
+
+def _base_url(url):
+    # Lấy scheme://host của một URL, dùng để tạo URL trang contributors trên cùng host
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
 def convert_star_str_to_int(star_str):
     """
     Chuyển đổi chuỗi số sao thành số nguyên
@@ -102,21 +357,128 @@ def convert_star_str_to_int(star_str):
         num = float(star_str)
     return int(num)
 
-def main():
+def _env_float(name):
+    # Đọc số thực từ biến môi trường, None nếu không đặt
+    value = os.getenv(name)
+    return float(value) if value else None
+
+def build_parser():
     """
-    Hàm chính để thực thi quá trình thu thập dữ liệu
+    Tạo bộ phân tích tham số dòng lệnh của scraper (dùng chung cho main và bộ lập lịch)
     """
-    print("=== Bắt đầu thu thập dữ liệu từ GitHub Trending ===")
-    init_db()
+    parser = argparse.ArgumentParser(description="Thu thập dữ liệu từ GitHub Trending")
+    parser.add_argument("--crawl", action="store_true",
+                        help="Thu thập nhiều trang trending (ngôn ngữ x khoảng thời gian) trong một lần chạy")
+    parser.add_argument("--languages", nargs="+", default=DEFAULT_LANGUAGES,
+                        help="Danh sách slug ngôn ngữ dùng cho --crawl")
+    parser.add_argument("--periods", nargs="+", default=list(TRENDING_PERIODS),
+                        choices=TRENDING_PERIODS, help="Khoảng thời gian dùng cho --crawl")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("SCRAPER_MAX_WORKERS", DEFAULT_MAX_WORKERS)),
+                        help="Số request được chạy song song tối đa")
+    parser.add_argument("--rate", type=float, default=_env_float("SCRAPER_RATE"),
+                        help="Số request tối đa mỗi giây (mặc định: không giới hạn, chỉ tự giảm "
+                             "tốc độ khi bị GitHub giới hạn)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Không dùng cache phản hồi HTTP trên đĩa")
+    parser.add_argument("--offline", action="store_true",
+                        help="Chỉ dùng dữ liệu trong cache, không gửi request ra mạng")
+    parser.add_argument("--extractor", choices=["bs4", "lxml"],
+                        help="Backend trích xuất HTML (mặc định: lxml nếu đã cài đặt)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_STREAM_BATCH_SIZE,
+                        help="Số dòng ghi vào cơ sở dữ liệu mỗi lần trong khi thu thập")
+    parser.add_argument("--run-id", default=os.getenv("SCRAPER_RUN_ID"),
+                        help="Mã lần thu thập; chạy lại với cùng mã sẽ cập nhật thay vì nhân đôi dữ liệu "
+                             "(mặc định: theo giờ, ví dụ 2024-01-01T09)")
+    return parser
+
+def create_scrape_session(args):
+    """
+    Tạo session HTTP (kèm cache nếu được bật) theo tham số dòng lệnh
+    """
+    cache = None if args.no_cache else ResponseCache()
+    limiter = RateLimiter(rate=args.rate, max_concurrency=args.workers)
+    return create_session(pool_size=args.workers, cache=cache, offline=args.offline, limiter=limiter)
+
+def run_scrape(args, session=None, extractor=None, writer=None):
+    """
+    Thu thập dữ liệu một lần và lưu vào cơ sở dữ liệu
+
+    Các dòng được ghi dạng luồng ngay khi thu thập xong, mỗi lần args.batch_size
+    dòng trong một transaction, với cùng một thời điểm thu thập cho cả lần chạy.
+    Nếu bị lỗi giữa chừng, các lô đã ghi được giữ lại nhưng lần chạy không được
+    đánh dấu hoàn tất; chạy lại với cùng run_key sẽ ghi tiếp vào lần chạy đó.
 
-    # Thu thập dữ liệu và lưu vào cơ sở dữ liệu
-    data = scrape_github_trending("https://github.com/trending")
-    print(f"[INFO] Đã lấy được {len(data)} repository")
+    Tiến trình chạy lâu (bộ lập lịch) truyền vào session, extractor và writer
+    dùng lại giữa các lần chạy để giữ kết nối HTTP, cache và kết nối SQLite.
+
+    Tham số:
+        args: Tham số dòng lệnh đã phân tích (xem build_parser)
+        session: Session HTTP dùng chung (mặc định: tạo mới theo args)
+        extractor: Backend trích xuất HTML (mặc định: theo args.extractor)
+        writer: SnapshotWriter dùng chung (mặc định: mở mới và đóng sau khi ghi)
+
+    Trả về:
+        Số dòng đã ghi
+    """
+    session = session or create_scrape_session(args)
+    extractor = extractor or get_extractor(args.extractor)
 
-    df = pd.DataFrame(data)
-    df["scrape_date"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    now = datetime.now()
+    scrape_date = now.strftime("%Y-%m-%d %H:%M:%S")
+    run_key = args.run_id or now.strftime("%Y-%m-%dT%H")
 
-    append_data_to_db(df)
+    if args.crawl:
+        listings = build_listings(args.languages, args.periods)
+    else:
+        listings = [{'url': TRENDING_URL}]
+    records = iter_trending_listings(listings, session=session, max_workers=args.workers, extractor=extractor)
+
+    # Đếm các dòng không lấy được số người đóng góp trong khi ghi
+    missing = {'count': 0}
+    def track_missing(records):
+        for item in records:
+            if item['contributor_count'] is None:
+                missing['count'] += 1
+            yield item
+
+    # Thu thập và ghi dạng luồng
+    with metrics_utils.span('scrape') as span:
+        if writer is None:
+            with SnapshotWriter() as writer:
+                written = writer.write(track_missing(records), scrape_date=scrape_date, run_key=run_key,
+                                       complete=True, batch_size=args.batch_size)
+        else:
+            written = writer.write(track_missing(records), scrape_date=scrape_date, run_key=run_key,
+                                   complete=True, batch_size=args.batch_size)
+        span.rows = written
+
+    if missing['count']:
+        print(f"[CẢNH BÁO] Không lấy được số người đóng góp của {missing['count']} dòng, lưu giá trị NULL")
+    cache = getattr(session, 'cache', None)
+    if cache is not None:
+        print(f"[INFO] Thống kê cache HTTP: {cache.snapshot()}")
+    limiter = getattr(session, 'rate_limiter', None)
+    if limiter is not None:
+        print(f"[INFO] Thống kê giới hạn tốc độ: {limiter.snapshot()}")
+    print(f"[INFO] Đã lưu {written} dòng vào cơ sở dữ liệu (run {run_key})")
+    return written
+
+def main(argv=None):
+    """
+    Hàm chính để thực thi quá trình thu thập dữ liệu
+
+    Tham số:
+        argv: Danh sách tham số dòng lệnh (mặc định: sys.argv)
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.offline and args.no_cache:
+        parser.error("--offline cần dùng cache, không thể kết hợp với --no-cache")
+
+    print("=== Bắt đầu thu thập dữ liệu từ GitHub Trending ===")
+    init_db()
+    run_scrape(args)
     print("=== Hoàn thành ===")
 
 if __name__ == "__main__":
@@ -0,0 +1,181 @@
+# scripts/star_metrics.py
+# Tính tốc độ tăng star, gia tốc và số ngày trên trending cho mọi repository
+# Mọi phép tính chạy một lượt trên các mảng NumPy sắp theo (repo, thời điểm) do
+# db_utils.get_star_history_arrays trả về, không groupby/apply theo từng repository.
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from db_utils import get_connection, get_star_history_arrays
+
+# Độ dài cửa sổ (ngày) dùng để tính tốc độ; gia tốc so sánh với cửa sổ liền trước
+DEFAULT_WINDOW_DAYS = 7
+
+SECONDS_PER_DAY = 86400
+
+# Các chỉ số có thể dùng để xếp hạng
+RANK_METRICS = ('velocity', 'acceleration', 'days_on_trending', 'stars')
+
+def compute_star_metrics(history, window_days=DEFAULT_WINDOW_DAYS):
+    """
+    Tính các chỉ số star cho mọi repository trong một lượt
+
+    - velocity: số star tăng mỗi ngày trong window_days ngày gần nhất của repository
+      (từ mẫu đầu tiên trong cửa sổ đến mẫu cuối cùng)
+    - acceleration: chênh lệch velocity so với cửa sổ liền trước, chia cho
+      window_days (star/ngày²)
+    - days_on_trending: số ngày khác nhau repository có mặt trong dữ liệu
+
+    Chỉ số không đủ dữ liệu (ví dụ chỉ có một mẫu trong cửa sổ) là NaN.
+
+    Tham số:
+        history: dict từ db_utils.get_star_history_arrays
+        window_days: Độ dài cửa sổ tính tốc độ (ngày)
+
+    Trả về:
+        dict các mảng cùng độ dài với history['repo_ids']: repo_ids, stars,
+        velocity, acceleration, days_on_trending, samples, first_seen, last_seen
+    """
+    repo_ids, offsets = history['repo_ids'], history['offsets']
+    timestamps, stars = history['timestamps'], history['stars']
+    n = len(repo_ids)
+    first, last = offsets[:-1], offsets[1:] - 1
+    if n == 0:
+        empty_float = np.empty(0, dtype=np.float64)
+        return {'repo_ids': repo_ids, 'stars': stars[:0], 'velocity': empty_float,
+                'acceleration': empty_float, 'days_on_trending': np.empty(0, dtype=np.int64),
+                'samples': np.empty(0, dtype=np.int64), 'first_seen': timestamps[:0], 'last_seen': timestamps[:0]}
+
+    # Khóa tăng dần trên toàn mảng: repository thứ i chiếm khoảng [i * span, (i + 1) * span),
+    # nên một lần searchsorted tìm được vị trí theo thời gian bên trong mọi repository
+    t0 = timestamps.min()
+    span = timestamps.max() - t0 + 1
+    segment = np.repeat(np.arange(n, dtype=np.int64), np.diff(offsets))
+    keys = segment * span + (timestamps - t0)
+    base = np.arange(n, dtype=np.int64) * span - t0
+
+    def locate(times, side='left'):
+        # Vị trí của times (mỗi repository một giá trị) trong đoạn của repository đó;
+        # thời điểm trước mẫu đầu tiên rơi về đoạn trước nên được chặn bởi first
+        return np.searchsorted(keys, base + times, side=side)
+
+    window = int(window_days * SECONDS_PER_DAY)
+    t_last = timestamps[last]
+    current_start = np.maximum(locate(t_last - window), first)
+    previous_end = locate(t_last - window, side='right') - 1
+    previous_start = np.maximum(locate(t_last - 2 * window), first)
+    has_previous = previous_end >= first
+    previous_end = np.maximum(previous_end, first)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        velocity = _slope(stars, timestamps, current_start, last)
+        previous_velocity = np.where(has_previous, _slope(stars, timestamps, previous_start, previous_end), np.nan)
+        acceleration = (velocity - previous_velocity) / window_days
+
+    # Số ngày khác nhau: đếm các mẫu mở đầu một ngày mới trong đoạn của mỗi repository
+    days = timestamps // SECONDS_PER_DAY
+    new_day = np.ones(len(timestamps), dtype=np.int64)
+    new_day[1:] = (days[1:] != days[:-1]) | (segment[1:] != segment[:-1])
+
+    return {
+        'repo_ids': repo_ids,
+        'stars': stars[last],
+        'velocity': velocity,
+        'acceleration': acceleration,
+        'days_on_trending': np.add.reduceat(new_day, first),
+        'samples': np.diff(offsets),
+        'first_seen': timestamps[first],
+        'last_seen': t_last,
+    }
+
+def _slope(stars, timestamps, start, end):
+    # Số star tăng mỗi ngày giữa hai mẫu; NaN khi hai mẫu trùng thời điểm
+    elapsed = (timestamps[end] - timestamps[start]) / SECONDS_PER_DAY
+    return np.where(elapsed > 0, (stars[end] - stars[start]) / elapsed, np.nan)
+
+def rank_repos(metrics, by='acceleration', top_n=20):
+    """
+    Trả về vị trí của top_n repository có chỉ số by cao nhất (NaN xếp cuối)
+
+    Chỉ top_n phần tử được sắp xếp (argpartition), không sắp toàn bộ mảng.
+    """
+    if by not in RANK_METRICS:
+        raise ValueError(f"Chỉ số không hợp lệ: {by}")
+    values = np.nan_to_num(metrics[by].astype(np.float64), nan=-np.inf)
+    top_n = min(top_n, len(values))
+    if top_n <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-values, top_n - 1)[:top_n]
+    return candidates[np.argsort(-values[candidates], kind='stable')]
+
+def metrics_frame(conn, metrics, positions=None):
+    """
+    Chuyển các chỉ số (tại positions, mặc định: tất cả) thành DataFrame kèm tên repository
+
+    Trả về:
+        DataFrame gồm full_name, language, stars, velocity, acceleration,
+        days_on_trending, samples, first_seen, last_seen theo thứ tự positions
+    """
+    if positions is None:
+        positions = np.arange(len(metrics['repo_ids']))
+    df = pd.DataFrame({key: values[positions] for key, values in metrics.items()})
+    for column in ('first_seen', 'last_seen'):
+        df[column] = pd.to_datetime(df[column], unit='s')
+
+    names = {}
+    repo_ids = df['repo_ids'].tolist()
+    for start in range(0, len(repo_ids), 500):
+        chunk = repo_ids[start:start + 500]
+        placeholders = ','.join('?' * len(chunk))
+        for repo_id, full_name, language in conn.execute(
+                f"SELECT id, full_name, language FROM repos WHERE id IN ({placeholders})", chunk):
+            names[repo_id] = (full_name, language)
+    df.insert(0, 'full_name', [names.get(repo_id, (None, None))[0] for repo_id in repo_ids])
+    df.insert(1, 'language', [names.get(repo_id, (None, None))[1] for repo_id in repo_ids])
+    return df.rename(columns={'repo_ids': 'repo_id'})
+
+def top_repos(conn, by='acceleration', top_n=20, window_days=DEFAULT_WINDOW_DAYS, start_date=None,
+              end_date=None, languages=None):
+    """
+    Xếp hạng các repository theo một chỉ số star
+
+    Tham số:
+        conn: Kết nối SQLite đang mở
+        by: Chỉ số dùng để xếp hạng (xem RANK_METRICS)
+        top_n: Số repository cần lấy
+        window_days: Độ dài cửa sổ tính tốc độ (ngày)
+        start_date, end_date, languages: Bộ lọc như db_utils.get_latest_snapshots
+
+    Trả về:
+        DataFrame như metrics_frame, chỉ số cao nhất trước
+    """
+    history = get_star_history_arrays(conn, start_date=start_date, end_date=end_date, languages=languages)
+    metrics = compute_star_metrics(history, window_days=window_days)
+    return metrics_frame(conn, metrics, rank_repos(metrics, by=by, top_n=top_n))
+
+def main():
+    parser = argparse.ArgumentParser(description="Xếp hạng repository theo tốc độ/gia tốc tăng star")
+    parser.add_argument("--by", choices=RANK_METRICS, default='acceleration', help="Chỉ số dùng để xếp hạng")
+    parser.add_argument("--top", type=int, default=20, help="Số repository cần hiển thị")
+    parser.add_argument("--window-days", type=float, default=DEFAULT_WINDOW_DAYS,
+                        help="Độ dài cửa sổ tính tốc độ (ngày)")
+    parser.add_argument("--start-date", help="Chỉ dùng dữ liệu từ ngày này (YYYY-MM-DD)")
+    parser.add_argument("--languages", nargs="+", help="Chỉ xếp hạng các ngôn ngữ này")
+    args = parser.parse_args()
+
+    conn = get_connection()
+    try:
+        df = top_repos(conn, by=args.by, top_n=args.top, window_days=args.window_days,
+                       start_date=args.start_date, languages=args.languages)
+    finally:
+        conn.close()
+    if df.empty:
+        print("[INFO] Chưa có dữ liệu, hãy chạy scraper trước")
+        return
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(df.drop(columns=['repo_id']).to_string(index=False, float_format=lambda value: f'{value:.1f}'))
+
+if __name__ == "__main__":
+    main()
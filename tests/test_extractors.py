@@ -0,0 +1,59 @@
+# tests/test_extractors.py
+# Kiểm tra backend lxml cho kết quả giống hệt backend tham chiếu bs4 trên các
+# trang mẫu trong data/fixtures. Chạy: python -m pytest tests
+
+import glob
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+pytest.importorskip('lxml')
+
+from extractors import FIXTURES_DIR, Bs4Extractor, LxmlExtractor, verify_extractors  # noqa: E402
+from scraper import parse_contributor_count  # noqa: E402
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+def _fixture_names(prefix):
+    return sorted(os.path.basename(path) for path in glob.glob(os.path.join(FIXTURES_DIR, f'{prefix}*.html')))
+
+@pytest.mark.parametrize('name', _fixture_names('trending'))
+def test_trending_rows_match(name):
+    html = _fixture(name)
+    expected = Bs4Extractor().trending_rows(html)
+    assert expected
+    assert LxmlExtractor().trending_rows(html) == expected
+
+@pytest.mark.parametrize('name', _fixture_names('contributors'))
+def test_contributor_counter_match(name):
+    html = _fixture(name)
+    expected = Bs4Extractor().contributor_counter(html)
+    assert LxmlExtractor().contributor_counter(html) == expected
+    assert (parse_contributor_count(html, full_name=name, extractor=LxmlExtractor())
+            == parse_contributor_count(html, full_name=name, extractor=Bs4Extractor()))
+
+def test_missing_language():
+    rows = LxmlExtractor().trending_rows(_fixture('trending.html'))
+    missing = [row for row in rows if row['language'] == ""]
+    assert missing
+    assert missing == [row for row in Bs4Extractor().trending_rows(_fixture('trending.html'))
+                       if row['language'] == ""]
+
+def test_missing_counter():
+    html = _fixture('contributors_missing.html')
+    assert LxmlExtractor().contributor_counter(html) is None
+    assert parse_contributor_count(html, extractor=LxmlExtractor()) == 0
+
+@pytest.mark.parametrize('name, counter', [('contributors_large.html', '5,000+'), ('contributors_nav.html', '')])
+def test_invalid_counter(name, counter):
+    html = _fixture(name)
+    assert LxmlExtractor().contributor_counter(html) == counter
+    assert parse_contributor_count(html, full_name=name, extractor=LxmlExtractor()) is None
+
+def test_verify_extractors():
+    assert verify_extractors() == []